@@ -0,0 +1,38 @@
+import os
+import threading
+from typing import Callable
+
+class BlobStore:
+    """Raw uploads stored once per distinct content under root/<sha256[:2]>/<sha256>.
+
+    Blobs carry no reference count of their own: release() asks the caller how many records still point at a digest,
+    and put()/release() share a lock so a blob cannot be removed between a new record claiming it and its file landing.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put(self, src: str, digest: str) -> str:
+        """Move src into place, or drop it when the same content is already stored"""
+        target = self.path(digest)
+        with self._lock:
+            if os.path.exists(target): os.remove(src)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(src, target)
+        return target
+
+    def release(self, digest: str, refs: Callable[[str], int]) -> bool:
+        """Remove the blob once refs(digest) reports that no record uses it any more; True if it was removed"""
+        with self._lock:
+            if refs(digest) > 0 or not self.exists(digest): return False
+            os.remove(self.path(digest))
+            return True
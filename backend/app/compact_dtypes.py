@@ -0,0 +1,129 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Iterable, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CATEGORY_MAX = int(os.getenv("COMPACT_CATEGORY_MAX", "1000"))
+CATEGORY_RATIO = float(os.getenv("COMPACT_CATEGORY_RATIO", "0.5"))
+ARROW_STRINGS = os.getenv("COMPACT_ARROW_STRINGS", "0") == "1"
+INT_TYPES = ('int8', 'int16', 'int32')
+
+class CompactOverflow(Exception):
+    """A later chunk holds values the dtype chosen from the sample cannot represent"""
+
+    def __init__(self, column: str):
+        super().__init__(f"Column '{column}' outgrew its compact dtype")
+        self.column = column
+
+def _fits(series: pd.Series, dtype: str) -> bool:
+    if dtype == 'float32':
+        if series.dtype.kind != 'f': return False
+        values = series.to_numpy(dtype='float64')
+        with np.errstate(over='ignore'): narrowed = values.astype('float32')
+        return np.array_equal(narrowed.astype('float64'), values, equal_nan=True)
+    if series.dtype.kind not in 'iu': return False
+    info = np.iinfo(dtype)
+    return series.empty or (info.min <= series.min() and series.max() <= info.max)
+
+def _is_text(series: pd.Series) -> bool:
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty')
+
+class CompactPlan:
+    """Narrowest dtypes chosen from a sample frame, then applied to it and to every later chunk of the same file.
+
+    Integers get the smallest signed type holding the sample's range and floats become float32 when that loses nothing.
+    Text with few distinct values becomes a categorical whose categories only ever grow, so each Arrow batch's dictionary
+    extends the previous one; other text optionally becomes Arrow-backed strings. A chunk that does not fit raises
+    CompactOverflow and the caller re-reads the file with that column excluded.
+    """
+
+    def __init__(self, sample: pd.DataFrame, arrow_strings: bool = ARROW_STRINGS, exclude: Iterable[str] = (),
+                 category_max: int = CATEGORY_MAX, category_ratio: float = CATEGORY_RATIO):
+        self.category_max = category_max
+        self.dtypes: Dict[str, str] = {}
+        self.categories: Dict[str, pd.Index] = {}
+        self.strings = []
+        exclude = set(exclude)
+        for col, series in sample.items():
+            if col in exclude or series.isna().all(): continue
+            if series.dtype.kind in 'iu':
+                target = next((t for t in INT_TYPES if _fits(series, t)), None)
+                if target: self.dtypes[col] = target
+            elif series.dtype == 'float64' and _fits(series, 'float32'):
+                self.dtypes[col] = 'float32'
+            elif _is_text(series):
+                distinct = series.dropna().unique()
+                if len(distinct) <= category_max and len(distinct) <= category_ratio * series.notna().sum():
+                    self.categories[col] = pd.Index([], dtype=object)
+                elif arrow_strings: self.strings.append(col)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for col, dtype in self.dtypes.items():
+            if col not in df: continue
+            if not _fits(df[col], dtype): raise CompactOverflow(col)
+            df[col] = df[col].astype(dtype)
+        for col, categories in self.categories.items():
+            if col not in df: continue
+            if not _is_text(df[col]): raise CompactOverflow(col)
+            distinct = df[col].dropna().unique()
+            fresh = distinct[~pd.Index(distinct).isin(categories)]
+            if len(categories) + len(fresh) > self.category_max: raise CompactOverflow(col)
+            # New values go on the end: earlier codes keep their meaning, which Arrow needs for dictionary deltas
+            if len(fresh): categories = self.categories[col] = categories.append(pd.Index(fresh, dtype=object))
+            df[col] = pd.Categorical(df[col], categories=categories)
+        for col in self.strings:
+            if col in df: df[col] = df[col].astype('string[pyarrow]')
+        return df
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'narrowed': dict(self.dtypes), 'categorical': list(self.categories), 'arrow_strings': list(self.strings)}
+
+def resident_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError): return None
+
+def peak_resident_bytes() -> Optional[int]:
+    """High-water RSS of this process over its whole life (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+class MemoryReport:
+    """Memory seen while one dataset is parsed: RSS sampled after every chunk, plus the sample frame's footprint
+    before and after compaction"""
+
+    def __init__(self, compact: bool):
+        self.compact = compact
+        self.start_rss = resident_bytes()
+        self.peak_rss = self.start_rss
+        self.sample_bytes = self.sample_compact_bytes = None
+        self.plan = None
+
+    @staticmethod
+    def frame_bytes(df: pd.DataFrame) -> int:
+        return int(df.memory_usage(index=False, deep=True).sum())
+
+    def sample(self, df: pd.DataFrame, plan: Optional[CompactPlan] = None) -> pd.DataFrame:
+        """Measure the first frame as parsed, compact it in place when a plan is given and measure it again"""
+        self.sample_bytes, self.plan = self.frame_bytes(df), plan
+        if plan is not None:
+            df = plan.apply(df)
+            self.sample_compact_bytes = self.frame_bytes(df)
+        return df
+
+    def tick(self):
+        rss = resident_bytes()
+        if rss is not None: self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.tick()
+        return {'compact': self.compact, 'rss_bytes': resident_bytes(), 'peak_rss_bytes': self.peak_rss, 'start_rss_bytes': self.start_rss,
+                'process_peak_rss_bytes': peak_resident_bytes(), 'sample_bytes': self.sample_bytes,
+                'sample_compact_bytes': self.sample_compact_bytes, 'plan': self.plan.to_dict() if self.plan else None}
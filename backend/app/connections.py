@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+BACKOFF_BASE = float(os.getenv("RECONNECT_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("RECONNECT_BACKOFF_MAX", "60"))
+PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+
+class CircuitOpen(Exception):
+    """Raised instead of connecting while a backend is known to be down"""
+
+    def __init__(self, name: str, retry_in: float, last_error: Optional[str]):
+        super().__init__(f"{name} not available (retrying in {retry_in:.0f}s): {last_error}")
+        self.name, self.retry_in = name, retry_in
+
+class ManagedConnection:
+    """A lazily opened backend client behind a circuit breaker.
+
+    A failed connect opens the circuit for an exponentially growing delay (base * 2**(failures-1), capped); until it
+    elapses get() raises CircuitOpen immediately. Once due, a single caller makes the next attempt while the rest keep
+    failing fast. The health prober pings open connections and trips the breaker when a live backend goes away.
+    """
+
+    def __init__(self, name: str, connect: Callable[[], Any], ping: Callable[[Any], bool], close: Optional[Callable[[Any], None]] = None,
+                 base_delay: float = BACKOFF_BASE, max_delay: float = BACKOFF_MAX):
+        self.name, self._connect, self._ping, self._close = name, connect, ping, close
+        self.base_delay, self.max_delay = base_delay, max_delay
+        self.client = None
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_error = None
+        self.checked_at = None
+        self.healthy = None
+        self._lock = threading.Lock()
+
+    def _trip(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)
+        self.next_attempt = time.monotonic() + min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        self.healthy, self.checked_at = False, time.time()
+        client, self.client = self.client, None
+        if client is not None and self._close:
+            try: self._close(client)
+            except Exception: pass
+
+    def get(self):
+        client = self.client
+        if client is not None: return client
+        retry_in = self.next_attempt - time.monotonic()
+        if retry_in > 0 or not self._lock.acquire(blocking=False):
+            raise CircuitOpen(self.name, max(retry_in, 0), self.last_error)
+        try:
+            if self.client is None:
+                try: self.client = self._connect()
+                except Exception as e:
+                    self._trip(e)
+                    print(f"[WARN] {self.name} connection failed (attempt {self.failures}): {e}")
+                    raise
+                self.failures, self.last_error, self.healthy, self.checked_at = 0, None, True, time.time()
+            return self.client
+        finally: self._lock.release()
+
+    def mark_down(self, error: Exception):
+        """Report that an operation on the current client failed because the backend went away"""
+        with self._lock:
+            if self.client is not None: self._trip(error)
+
+    def probe(self):
+        client = self.client
+        if client is None:
+            if time.monotonic() >= self.next_attempt:
+                try: self.get()
+                except Exception: pass
+            return
+        try: alive = self._ping(client)
+        except Exception as e: alive, error = False, e
+        else: error = Exception("ping failed")
+        if alive: self.healthy, self.checked_at = True, time.time()
+        else:
+            print(f"[WARN] {self.name} stopped answering: {error}")
+            self.mark_down(error)
+
+    def status(self) -> Dict[str, Any]:
+        state = "unknown" if self.healthy is None else "healthy" if self.healthy else "unhealthy"
+        return {"status": state, "checked_at": self.checked_at, "failures": self.failures, "last_error": self.last_error,
+                "retry_in": round(max(self.next_attempt - time.monotonic(), 0), 1) if self.client is None and self.failures else None}
+
+class ConnectionManager:
+    """Registry of managed connections plus a daemon thread that probes them all every interval"""
+
+    def __init__(self):
+        self.connections: Dict[str, ManagedConnection] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name: str, connect, ping, close=None) -> ManagedConnection:
+        self.connections[name] = ManagedConnection(name, connect, ping, close)
+        return self.connections[name]
+
+    def probe_all(self):
+        for conn in list(self.connections.values()): conn.probe()
+
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            self.probe_all()
+            self._stop.wait(interval)
+
+    def start(self, interval: float = PROBE_INTERVAL):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def health(self, name: str) -> Dict[str, Any]:
+        return self.connections[name].status()
+
+connections = ConnectionManager()
@@ -1,19 +1,31 @@
 import sqlite3
 import json
+import threading
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
 
+LIST_COLUMNS = 'f.id, f.filename, f.file_type, f.columns, f.row_count, f.uploaded_at, f.source, f.content_hash'
+
 class DataStore:
-    """Simple SQLite storage for file metadata"""
+    """SQLite storage for file metadata. Preview and stats blobs live in a side table that is only read when asked for."""
 
-    def __init__(self):
-        self.conn = sqlite3.connect(
-            os.path.join(os.path.dirname(__file__), 'data_files.db'),
-            check_same_thread=False
-        )
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(os.path.dirname(__file__), 'data_files.db')
+        self._local = threading.local()
         self._create_table()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # One connection per thread: WAL lets readers run alongside the single writer instead of sharing a handle
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
     def _create_table(self):
         self.conn.execute('''
             CREATE TABLE IF NOT EXISTS uploaded_files (
@@ -24,41 +36,127 @@ class DataStore:
                 data_preview TEXT, stats TEXT, source TEXT DEFAULT 'sqlite'
             )
         ''')
+        for column in ("source TEXT DEFAULT 'sqlite'", "content_hash TEXT", "parse_options TEXT", "appends INTEGER DEFAULT 0"):
+            try:
+                self.conn.execute(f"ALTER TABLE uploaded_files ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_payloads (
+                file_id INTEGER PRIMARY KEY REFERENCES uploaded_files(id) ON DELETE CASCADE,
+                data_preview TEXT, stats TEXT, stats_state BLOB
+            )
+        ''')
         try:
-            self.conn.execute("ALTER TABLE uploaded_files ADD COLUMN source TEXT DEFAULT 'sqlite'")
+            self.conn.execute("ALTER TABLE file_payloads ADD COLUMN stats_state BLOB")
         except sqlite3.OperationalError:
             pass
-        self.conn.commit()
-
-    def save_file_info(self, filename: str, file_type: str, data: Dict[str, Any], source: str = 'sqlite') -> int:
-        cursor = self.conn.execute(
-            'INSERT INTO uploaded_files (filename, file_type, columns, row_count, uploaded_at, data_preview, stats, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-            (filename, file_type, json.dumps(data['columns']), data['row_count'],
-             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-             json.dumps(data['preview']), json.dumps(data['stats']), source)
-        )
-        self.conn.commit()
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_uploaded_files_uploaded_at ON uploaded_files (uploaded_at DESC, id DESC)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_uploaded_files_source ON uploaded_files (source, uploaded_at DESC, id DESC)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_uploaded_files_hash ON uploaded_files (content_hash, file_type)')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_type_totals (
+                file_type TEXT PRIMARY KEY, files INTEGER NOT NULL DEFAULT 0,
+                total_rows INTEGER NOT NULL DEFAULT 0, total_columns INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Older databases kept the blobs inline; move them to the side table once and blank the inline copies
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO file_payloads (file_id, data_preview, stats) SELECT id, data_preview, stats FROM uploaded_files WHERE data_preview IS NOT NULL OR stats IS NOT NULL')
+            self.conn.execute('UPDATE uploaded_files SET data_preview = NULL, stats = NULL WHERE data_preview IS NOT NULL OR stats IS NOT NULL')
+            # Rebuild the counters once per start so they can never drift from the table they summarise
+            self.conn.execute('DELETE FROM file_type_totals')
+            self.conn.execute('INSERT INTO file_type_totals (file_type, files, total_rows, total_columns) SELECT file_type, COUNT(*), COALESCE(SUM(row_count), 0), COALESCE(SUM(json_array_length(columns)), 0) FROM uploaded_files GROUP BY file_type')
+
+    def _bump_totals(self, file_type: str, files: int, rows: int, columns: int):
+        self.conn.execute('INSERT INTO file_type_totals (file_type, files, total_rows, total_columns) VALUES (?, ?, ?, ?) '
+                          'ON CONFLICT(file_type) DO UPDATE SET files = files + excluded.files, total_rows = total_rows + excluded.total_rows, total_columns = total_columns + excluded.total_columns',
+                          (file_type, files, rows, columns))
+
+    def save_file_info(self, filename: str, file_type: str, data: Dict[str, Any], source: str = 'sqlite', content_hash: Optional[str] = None,
+                       parse_options: Optional[str] = None, stats_state: Optional[bytes] = None) -> int:
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO uploaded_files (filename, file_type, columns, row_count, uploaded_at, source, content_hash, parse_options) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (filename, file_type, json.dumps(data['columns']), data['row_count'],
+                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'), source, content_hash, parse_options)
+            )
+            self.conn.execute('INSERT INTO file_payloads (file_id, data_preview, stats, stats_state) VALUES (?, ?, ?, ?)',
+                              (cursor.lastrowid, json.dumps(data['preview']), json.dumps(data['stats']), stats_state))
+            self._bump_totals(file_type, 1, data['row_count'] or 0, len(data['columns']))
         return cursor.lastrowid
 
-    def _row_to_dict(self, row) -> Dict[str, Any]:
-        uploaded_at = row[5]
-        if isinstance(uploaded_at, str):
-            try: uploaded_at = datetime.strptime(uploaded_at, '%Y-%m-%d %H:%M:%S').isoformat()
-            except (ValueError, TypeError): pass
-        return {'id': row[0], 'filename': row[1], 'file_type': row[2], 'columns': json.loads(row[3]), 'row_count': row[4], 'uploaded_at': uploaded_at, 'preview': json.loads(row[6]), 'stats': json.loads(row[7]) if len(row) > 7 and row[7] else {}, 'source': row[8] if len(row) > 8 else 'sqlite'}
+    @staticmethod
+    def _iso(uploaded_at):
+        # Stored as '%Y-%m-%d %H:%M:%S'; splicing in the 'T' gives the same string as strptime(...).isoformat()
+        if isinstance(uploaded_at, str) and len(uploaded_at) == 19 and uploaded_at[10] == ' ':
+            return f"{uploaded_at[:10]}T{uploaded_at[11:]}"
+        return uploaded_at
+
+    def _row_to_dict(self, row, payload=None) -> Dict[str, Any]:
+        record = {'id': row[0], 'filename': row[1], 'file_type': row[2], 'columns': json.loads(row[3]), 'row_count': row[4],
+                  'uploaded_at': self._iso(row[5]), 'source': row[6] or 'sqlite', 'content_hash': row[7]}
+        if payload is not None:
+            record['preview'] = json.loads(payload[0]) if payload[0] else []
+            record['stats'] = json.loads(payload[1]) if payload[1] else {}
+        return record
+
+    def _select(self, where: str = '', params: tuple = (), include_payload: bool = False, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        sql = f'SELECT {LIST_COLUMNS}' + (', p.data_preview, p.stats FROM uploaded_files f LEFT JOIN file_payloads p ON p.file_id = f.id' if include_payload else ' FROM uploaded_files f')
+        sql += f' {where} ORDER BY f.uploaded_at DESC, f.id DESC'
+        if limit is not None: sql += ' LIMIT ? OFFSET ?'; params = (*params, limit, offset)
+        rows = self.conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(r, r[8:10] if include_payload else None) for r in rows]
 
-    def get_all_files(self) -> List[Dict[str, Any]]:
-        return [self._row_to_dict(r) for r in self.conn.execute('SELECT * FROM uploaded_files ORDER BY uploaded_at DESC')]
+    def get_all_files(self, include_payload: bool = False, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        return self._select(include_payload=include_payload, limit=limit, offset=offset)
 
-    def get_files_by_source(self, source: str) -> List[Dict[str, Any]]:
-        return [self._row_to_dict(r) for r in self.conn.execute('SELECT * FROM uploaded_files WHERE source = ? ORDER BY uploaded_at DESC', (source,))]
+    def get_files_by_source(self, source: str, include_payload: bool = False, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        return self._select('WHERE f.source = ?', (source,), include_payload, limit, offset)
+
+    def search_files(self, keyword: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Case-insensitive substring match on filename and column names, newest first"""
+        pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self._select("WHERE f.filename LIKE ? ESCAPE '\\' OR f.columns LIKE ? ESCAPE '\\'", (pattern, pattern), limit=limit)
 
     def get_file_by_id(self, file_id: int) -> Dict[str, Any]:
-        row = self.conn.execute('SELECT * FROM uploaded_files WHERE id = ?', (file_id,)).fetchone()
-        return self._row_to_dict(row) if row else None
+        rows = self._select('WHERE f.id = ?', (file_id,), include_payload=True)
+        return rows[0] if rows else None
+
+    def find_by_hash(self, content_hash: str, file_type: str, parse_options: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Newest record parsed from the same bytes with the same options (e.g. the Excel sheet) and nothing appended since,
+        with its preview and stats, or None"""
+        rows = self._select('WHERE f.content_hash = ? AND f.file_type = ? AND f.parse_options IS ? AND COALESCE(f.appends, 0) = 0', (content_hash, file_type, parse_options), include_payload=True, limit=1)
+        return rows[0] if rows else None
+
+    def get_stats_state(self, file_id: int) -> Optional[bytes]:
+        row = self.conn.execute('SELECT stats_state FROM file_payloads WHERE file_id = ?', (file_id,)).fetchone()
+        return row[0] if row else None
+
+    def append_rows(self, file_id: int, rows: int, stats: Dict[str, Any], stats_state: bytes) -> Optional[int]:
+        """Record rows appended to a file along with its merged stats; returns the new row count, or None if the file is gone"""
+        with self.conn:
+            row = self.conn.execute('UPDATE uploaded_files SET row_count = COALESCE(row_count, 0) + ?, appends = COALESCE(appends, 0) + 1 WHERE id = ? RETURNING file_type, row_count',
+                                    (rows, file_id)).fetchone()
+            if not row: return None
+            self.conn.execute('UPDATE file_payloads SET stats = ?, stats_state = ? WHERE file_id = ?', (json.dumps(stats), stats_state, file_id))
+            self._bump_totals(row[0], 0, rows, 0)
+        return row[1]
+
+    def hash_refs(self, content_hash: str) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM uploaded_files WHERE content_hash = ?', (content_hash,)).fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Totals straight from the counters table: one row per file type, independent of how many files exist"""
+        by_type = {r[0]: {'files': r[1], 'rows': r[2], 'columns': r[3]} for r in self.conn.execute('SELECT file_type, files, total_rows, total_columns FROM file_type_totals WHERE files > 0')}
+        return {'total_files': sum(t['files'] for t in by_type.values()), 'file_types': {k: t['files'] for k, t in by_type.items()},
+                'total_rows': sum(t['rows'] for t in by_type.values()), 'total_columns': sum(t['columns'] for t in by_type.values()), 'by_type': by_type}
 
     def delete_file(self, file_id: int) -> bool:
-        if not self.conn.execute('SELECT 1 FROM uploaded_files WHERE id = ?', (file_id,)).fetchone(): return False
-        self.conn.execute('DELETE FROM uploaded_files WHERE id = ?', (file_id,))
-        self.conn.commit()
-        return True
\ No newline at end of file
+        with self.conn:
+            # RETURNING keeps the lookup and the delete in one statement, so concurrent deletes cannot both decrement
+            row = self.conn.execute('DELETE FROM uploaded_files WHERE id = ? RETURNING file_type, row_count, json_array_length(columns)', (file_id,)).fetchone()
+            if not row: return False
+            self._bump_totals(row[0], -1, -(row[1] or 0), -(row[2] or 0))
+            self.conn.execute('DELETE FROM file_payloads WHERE file_id = ?', (file_id,))
+        return True
@@ -0,0 +1,202 @@
+import glob
+import json
+import math
+import os
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow as pa
+from typing import Dict, Any, List, Optional, Iterator
+
+class SchemaDrift(Exception):
+    """A later chunk holds values the column type fixed by earlier batches cannot represent"""
+
+    def __init__(self, column: str, dtype: str):
+        super().__init__(f"Column '{column}' changed type mid-file")
+        self.column, self.dtype = column, dtype
+
+def _is_null(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def as_text(value) -> str:
+    """A cell of a column stored as text: nested values as JSON, so they read back the way the file wrote them"""
+    return json.dumps(value, default=str) if isinstance(value, (list, dict)) else str(value)
+
+def _column_to_arrow(series: pd.Series) -> pa.Array:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Fixed 32-bit indices keep the field type stable while a compact column's categories grow between chunks
+        return pa.array(series, from_pandas=True).cast(pa.dictionary(pa.int32(), pa.string()))
+    try:
+        array = pa.array(series, from_pandas=True)
+        # An all-null object column (e.g. one pinned to text whose first chunk is empty) would fix the field as null,
+        # which no later chunk with values can be cast to; text is what such a column holds when it holds anything
+        return array.cast(pa.string()) if pa.types.is_null(array.type) and series.dtype == object else array
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Mixed-type object columns (e.g. ints and strings in one JSON field) are stored as text
+        return pa.array([None if _is_null(v) else as_text(v) for v in series], type=pa.string())
+
+class DatasetWriter:
+    """Appends DataFrame chunks to a temporary Arrow IPC file that is renamed into place on commit.
+    stats carries the serialised DatasetStats of the rows written, for the record that will own them."""
+
+    def __init__(self, store: 'DatasetStore', path: Optional[str] = None, stats: Optional[bytes] = None):
+        self.store, self.path, self.stats = store, path, stats
+        self.schema = self._sink = self._writer = None
+        self.committed = False
+
+    def _to_batch(self, df: pd.DataFrame) -> pa.RecordBatch:
+        arrays = [_column_to_arrow(df.iloc[:, i]) for i in range(df.shape[1])]
+        if self.schema is not None:
+            for i, field in enumerate(self.schema):
+                if arrays[i].type == field.type: continue
+                try: arrays[i] = arrays[i].cast(field.type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    numeric = pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+                    raise SchemaDrift(field.name, 'float64' if numeric and pa.types.is_floating(arrays[i].type) else 'str')
+        return pa.RecordBatch.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+    def write(self, df: pd.DataFrame):
+        batch = self._to_batch(df)
+        if self._writer is None:
+            fd, self.path = tempfile.mkstemp(dir=self.store.root, suffix=".part")
+            os.close(fd)
+            self._sink = pa.OSFile(self.path, "wb")
+            # Categorical columns only ever append categories, which the IPC file format accepts as dictionary deltas
+            self._writer = pa.ipc.new_file(self._sink, batch.schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            self.schema = batch.schema
+        self._writer.write_batch(batch)
+
+    def _close(self):
+        if self._writer is not None: self._writer.close(); self._sink.close()
+        self._writer = self._sink = None
+
+    def finish(self) -> Optional[str]:
+        """Close the part file and hand its path over, e.g. from a worker process back to the API process"""
+        self._close()
+        return self.path
+
+    def reset(self):
+        """Throw away everything written so far, e.g. before re-reading a file with corrected dtypes"""
+        self._close()
+        if self.path and os.path.exists(self.path): os.remove(self.path)
+        self.path = self.schema = self.stats = None
+
+    def commit(self, file_id: int):
+        self._close()
+        if self.path:
+            os.replace(self.path, self.store.path(file_id))
+            self.committed = True
+
+    def discard(self):
+        if not self.committed: self.reset()
+
+def _conform_column(column: pa.ChunkedArray, field: pa.Field) -> pa.ChunkedArray:
+    if column.type == field.type: return column
+    if pa.types.is_dictionary(field.type):
+        # Arrow has no cast from plain values to a dictionary type; encode them, then settle the index type
+        if not pa.types.is_dictionary(column.type): column = column.cast(field.type.value_type).dictionary_encode()
+    return column.cast(field.type)
+
+class DatasetStore:
+    """Full uploaded datasets kept as Arrow IPC files and read back through memory maps.
+
+    Appended rows land in numbered segment files next to the base file ({id}.1.arrow, {id}.2.arrow, ...) rather than
+    in a rewrite of it, so an append costs only the new rows; open() concatenates the segments without copying.
+    """
+
+    def __init__(self, root: str = "datasets"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, file_id: int) -> str:
+        return os.path.join(self.root, f"{file_id}.arrow")
+
+    def segments(self, file_id: int) -> List[str]:
+        appended = glob.glob(os.path.join(glob.escape(self.root), f"{file_id}.*.arrow"))
+        return [self.path(file_id)] + sorted(appended, key=lambda p: int(p.rsplit(".", 2)[1]))
+
+    def writer(self, path: Optional[str] = None, stats: Optional[bytes] = None) -> DatasetWriter:
+        """New writer, or one adopting a part file (and its stats) another process has already finished"""
+        return DatasetWriter(self, path, stats)
+
+    def _part(self) -> str:
+        fd, part = tempfile.mkstemp(dir=self.root, suffix=".part")
+        os.close(fd)
+        return part
+
+    def _write(self, table: pa.Table, path: str):
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)) as writer:
+                writer.write_table(table)
+
+    def clone(self, file_id: int) -> str:
+        """Part file sharing file_id's data, for a writer to commit under another id. A hard link costs no space;
+        datasets are replaced rather than modified in place, so the two ids never see each other's changes."""
+        part = self._part()
+        if len(self.segments(file_id)) > 1:
+            self._write(self.open(file_id).unify_dictionaries(), part)
+            return part
+        os.remove(part)
+        try: os.link(self.path(file_id), part)
+        except OSError: shutil.copyfile(self.path(file_id), part)
+        return part
+
+    def exists(self, file_id: int) -> bool:
+        return os.path.exists(self.path(file_id))
+
+    def schema(self, file_id: int) -> pa.Schema:
+        return pa.ipc.open_file(pa.memory_map(self.path(file_id), "r")).schema
+
+    def open(self, file_id: int) -> pa.Table:
+        # Uncompressed IPC over a memory map: the table's buffers point into the page cache, nothing is copied
+        tables = [pa.ipc.open_file(pa.memory_map(path, "r")).read_all() for path in self.segments(file_id)]
+        return tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+
+    def append(self, file_id: int, part: str) -> int:
+        """Move part's rows onto file_id as a new segment, cast to the dataset's schema and column order; returns the
+        number of rows added. Raises ValueError, leaving the dataset untouched, when columns are missing or do not fit."""
+        schema, table = self.schema(file_id), pa.ipc.open_file(pa.memory_map(part, "r")).read_all()
+        missing, extra = set(schema.names) - set(table.column_names), set(table.column_names) - set(schema.names)
+        if missing or extra:
+            raise ValueError("Columns do not match the dataset" + (f"; missing: {', '.join(sorted(missing))}" if missing else "")
+                             + (f"; unexpected: {', '.join(sorted(extra))}" if extra else ""))
+        columns, problems = [], []
+        for field in schema:
+            column = table.column(field.name)
+            try: columns.append(_conform_column(column, field))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError): problems.append(f"{field.name} ({column.type} into {field.type})")
+        if problems: raise ValueError(f"Values do not fit the dataset's column types: {', '.join(problems)}")
+        # One dictionary per column for the whole segment, so the IPC file never sees a replacement
+        table = pa.Table.from_arrays(columns, schema=schema).unify_dictionaries()
+        tmp = self._part()
+        self._write(table, tmp)
+        os.replace(tmp, os.path.join(self.root, f"{file_id}.{len(self.segments(file_id))}.arrow"))
+        os.remove(part)
+        return table.num_rows
+
+    def numeric_columns(self, file_id: int) -> List[str]:
+        schema = self.schema(file_id)
+        return [f.name for f in schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type) or pa.types.is_decimal(f.type)]
+
+    def iter_batches(self, file_id: int, batch_rows: int = 250000, columns: Optional[List[str]] = None) -> Iterator[pa.RecordBatch]:
+        table = self.open(file_id)
+        if columns: table = table.select(columns)
+        yield from table.to_batches(max_chunksize=batch_rows)
+
+    def iter_frames(self, file_id: int, batch_rows: int = 250000, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """Yield the dataset as pandas frames of at most batch_rows rows; only one block is materialised at a time"""
+        for batch in self.iter_batches(file_id, batch_rows, columns):
+            yield batch.to_pandas()
+
+    def read_rows(self, file_id: int, offset: int = 0, limit: int = 100, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        table = self.open(file_id)
+        if columns:
+            missing = [c for c in columns if c not in table.column_names]
+            if missing: raise KeyError(f"Unknown columns: {', '.join(missing)}")
+            table = table.select(columns)
+        return {'total_rows': table.num_rows, 'offset': offset, 'columns': table.column_names,
+                'rows': table.slice(offset, limit).to_pylist()}
+
+    def delete(self, file_id: int):
+        for path in self.segments(file_id):
+            if os.path.exists(path): os.remove(path)
@@ -0,0 +1,23 @@
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("[WARN] orjson not installed, JSON responses use the standard library encoder")
+
+def dumps(content: Any) -> bytes:
+    """Encode straight to UTF-8 JSON bytes: orjson when available, anything it does not know goes through jsonable_encoder"""
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Returned directly from heavy endpoints, which skips FastAPI's own jsonable_encoder pass over the whole body"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "2"))
+MERGED_FIELDS = ('filename', 'file_type', 'columns', 'row_count', 'uploaded_at')
+
+def search_deadline(name: str) -> float:
+    """Per-backend deadline in seconds: SEARCH_DEADLINE_<NAME> if set, otherwise SEARCH_DEADLINE"""
+    return float(os.getenv(f"SEARCH_DEADLINE_{name.upper()}", SEARCH_DEADLINE))
+
+def _recency(hit: Dict[str, Any]) -> str:
+    at = hit.get('uploaded_at')
+    return at.isoformat() if isinstance(at, datetime) else str(at or '')
+
+class FederatedSearch:
+    """Runs one query against every backend at once and merges the hits into one list per file.
+
+    Backends are (name, search(q, limit) -> hits, file_key(hit) -> SQLite file id or None). Each search runs in a worker
+    thread under its own deadline; one that misses it is reported as timed out and its late answer is dropped.
+    """
+
+    def __init__(self, backends: List[Tuple[str, Callable, Callable]]):
+        self.backends = [(name, search, key, search_deadline(name)) for name, search, key in backends]
+
+    async def _run(self, search, q: str, limit: int, deadline: float):
+        start = time.perf_counter()
+        hits = await asyncio.wait_for(asyncio.to_thread(search, q, limit), deadline)
+        return hits, time.perf_counter() - start
+
+    async def search(self, q: str, limit: int = 50) -> Dict[str, Any]:
+        outcomes = await asyncio.gather(*(self._run(search, q, limit, deadline) for _, search, _, deadline in self.backends), return_exceptions=True)
+        backends, merged = {}, {}
+        for (name, _, key, deadline), outcome in zip(self.backends, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                backends[name] = {"status": "timeout", "error": f"no answer within {deadline:g}s"}; continue
+            if isinstance(outcome, Exception):
+                backends[name] = {"status": "error", "error": str(outcome)}; continue
+            hits, seconds = outcome
+            backends[name] = {"status": "ok", "count": len(hits), "seconds": round(seconds, 3)}
+            for hit in hits:
+                file_id = key(hit)
+                # Files uploaded before backends recorded the SQLite id fall back to name and size as their identity
+                ident = ('id', file_id) if file_id is not None else ('name', hit.get('filename'), hit.get('row_count'))
+                entry = merged.setdefault(ident, {'file_id': file_id, 'score': None, 'sources': {}})
+                for field in MERGED_FIELDS:
+                    if entry.get(field) is None and hit.get(field) is not None: entry[field] = hit[field]
+                entry['sources'][name] = hit.get('id', hit.get('_id'))
+                if name == 'opensearch':
+                    entry['score'] = hit.get('score')
+                    if 'matched_rows' in hit: entry['matched_rows'] = hit['matched_rows']
+        # OpenSearch relevance first; everything it did not score follows, newest first
+        results = sorted(merged.values(), key=_recency, reverse=True)
+        results.sort(key=lambda e: (e['score'] is not None, e['score'] or 0), reverse=True)
+        for entry in results: entry['uploaded_at'] = _recency(entry) or None
+        return {"count": min(len(results), limit), "results": results[:limit], "backends": backends}
@@ -1,8 +1,21 @@
 import pandas as pd
 import json
 import io
+import time
 from datetime import datetime
-from typing import Dict, Any
+import numpy as np
+from contextlib import closing
+from typing import Dict, Any, Optional, Iterable, Iterator, Callable
+from pandas.io.parsers import TextParser
+from online_stats import DatasetStats, CovarianceAccumulator
+from dataset_store import DatasetStore, DatasetWriter, SchemaDrift, as_text
+from compact_dtypes import CompactPlan, CompactOverflow, MemoryReport
+from stream_readers import ExcelSheet, NotStreamable, json_records, ndjson_records
+
+PREVIEW_ROWS = 100
+
+class ColumnsAdded(Exception):
+    """Records or rows after the first chunk brought columns the chunks already written do not have"""
 
 class FileProcessor:
     """Handles CSV, Excel, and JSON file processing"""
@@ -15,17 +28,185 @@ class FileProcessor:
         return df
 
     @staticmethod
-    def process_csv(file_content: bytes) -> Dict[str, Any]:
-        try: return FileProcessor._prepare_response(FileProcessor._fix_dates(pd.read_csv(io.BytesIO(file_content), parse_dates=False)))
+    def process_csv(file_content: bytes, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
+        try: return FileProcessor._prepare_response(FileProcessor._fix_dates(pd.read_csv(io.BytesIO(file_content), parse_dates=False)), dataset, compact)
+        except Exception as e: raise ValueError(f"CSV processing error: {e}")
+
+    @staticmethod
+    def _pin_dtypes(chunk: pd.DataFrame, dtypes: Dict[str, str], text: bool) -> pd.DataFrame:
+        for col, dtype in dtypes.items():
+            if col not in chunk or (dtype == 'str') != text: continue
+            # map() infers its result dtype, which for an all-NaN chunk is float64 again; the dataset field must be text
+            chunk[col] = chunk[col].map(as_text, na_action='ignore').astype(object) if text else chunk[col].astype(dtype)
+        return chunk
+
+    @staticmethod
+    def _consume_chunks(chunks: Iterable[pd.DataFrame], dataset: Optional[DatasetWriter], compact: bool = False,
+                        exclude: Iterable[str] = (), pins: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        stats, preview, columns, row_count = DatasetStats(), None, [], 0
+        memory, plan, spent = MemoryReport(compact), None, {'stats': 0.0, 'serialize': 0.0}
+        with closing(chunks):
+            for chunk in chunks:
+                if pins: chunk = FileProcessor._pin_dtypes(chunk, pins, text=False)
+                clock = time.perf_counter()
+                stats.update(chunk)
+                spent['stats'] += time.perf_counter() - clock
+                first = preview is None
+                if first: columns, preview = chunk.columns.tolist(), chunk.head(PREVIEW_ROWS)
+                elif len(preview) < PREVIEW_ROWS: preview = pd.concat([preview, chunk.head(PREVIEW_ROWS - len(preview))])
+                # Text pins only exist so the dataset can store a mixed column; preview and stats keep the values as read
+                if pins: chunk = FileProcessor._pin_dtypes(chunk, pins, text=True)
+                # Compaction and the Arrow write both count as serialising the chunk
+                clock = time.perf_counter()
+                if first:
+                    # The first chunk is the sample the compact dtypes are chosen from
+                    plan = CompactPlan(chunk, exclude=exclude) if compact else None
+                    chunk = memory.sample(chunk, plan)
+                elif plan: chunk = plan.apply(chunk)
+                if dataset: dataset.write(chunk)
+                spent['serialize'] += time.perf_counter() - clock
+                memory.tick()
+                row_count += len(chunk)
+        if preview is None: raise ValueError("No columns to parse from file")
+        clock = time.perf_counter()
+        if dataset: dataset.stats = stats.to_state()
+        spent['stats'] += time.perf_counter() - clock
+        return FileProcessor._build_response(columns, preview, row_count, stats, memory, spent)
+
+    @staticmethod
+    def _read_chunked(read: Callable[[Dict[str, str]], Iterable[pd.DataFrame]], dataset: Optional[DatasetWriter] = None,
+                      compact: bool = False, pin_chunks: bool = True) -> Dict[str, Any]:
+        """Run read(dtypes)'s chunks through stats, preview and dataset, starting over whenever a later chunk shows that
+        something fixed by the earlier ones was wrong. pin_chunks=False means read() already applies the dtypes itself."""
+        dtypes, exclude = {}, set()
+        while True:
+            try: return FileProcessor._consume_chunks(read(dtypes), dataset, compact, exclude, dtypes if pin_chunks else None)
+            except ColumnsAdded:
+                # The reader now knows every column, so the first chunk of the next pass carries them all
+                pass
+            except CompactOverflow as overflow:
+                # A later chunk outgrew the dtype the first one suggested; leave that column as pandas infers it
+                exclude.add(overflow.column)
+            except SchemaDrift as drift:
+                # A column's inferred type changed between chunks; pin it and read again
+                if dtypes.get(drift.column) == drift.dtype: raise
+                dtypes[drift.column] = drift.dtype
+            except ValueError:
+                widened = [col for col, dtype in dtypes.items() if dtype == 'float64']
+                if not widened: raise
+                dtypes.update({col: 'str' for col in widened})
+            if dataset: dataset.reset()
+
+    @staticmethod
+    def process_csv_file(path: str, chunksize: int = 50000, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
+        """Chunked CSV read: memory stays bounded by chunksize, stats are accumulated online"""
+        read = lambda dtypes: pd.read_csv(path, parse_dates=False, chunksize=chunksize, dtype=dtypes or None)
+        try: return FileProcessor._read_chunked(read, dataset, compact, pin_chunks=False)
         except Exception as e: raise ValueError(f"CSV processing error: {e}")
 
     @staticmethod
-    def process_excel(file_content: bytes) -> Dict[str, Any]:
-        try: return FileProcessor._prepare_response(FileProcessor._fix_dates(pd.read_excel(io.BytesIO(file_content), parse_dates=False)))
+    def _conform(df: pd.DataFrame, known: list, emitted: bool) -> pd.DataFrame:
+        seen = set(known)
+        added = [c for c in df.columns if c not in seen]
+        if added:
+            known.extend(added)
+            if emitted: raise ColumnsAdded(added)
+        return df if df.columns.tolist() == known else df.reindex(columns=known)
+
+    @staticmethod
+    def _record_frames(records: Iterable[Any], chunksize: int, known: list) -> Iterator[pd.DataFrame]:
+        """Frames of chunksize records over one column list shared by every chunk: the union of keys in first-seen
+        order, which is what pd.DataFrame(records) gives for the whole file"""
+        batch, emitted = [], False
+        for record in records:
+            batch.append(record)
+            if len(batch) == chunksize:
+                yield FileProcessor._conform(pd.DataFrame(batch), known, emitted)
+                batch, emitted = [], True
+        if batch or not emitted: yield FileProcessor._conform(pd.DataFrame(batch), known, emitted)
+
+    @staticmethod
+    def process_json_file(path: str, chunksize: int = 50000, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
+        """Streams a top-level array or a {"data": [...]} payload record by record; any other document is small
+        enough by nature to be flattened whole"""
+        known = []
+        try:
+            try: return FileProcessor._read_chunked(lambda dtypes: FileProcessor._record_frames(json_records(path), chunksize, known), dataset, compact)
+            except NotStreamable:
+                with open(path, 'rb') as f: return FileProcessor.process_json(f.read(), dataset, compact)
+        except Exception as e: raise ValueError(f"JSON processing error: {e}")
+
+    @staticmethod
+    def process_ndjson_file(path: str, chunksize: int = 50000, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
+        known = []
+        try: return FileProcessor._read_chunked(lambda dtypes: FileProcessor._record_frames(ndjson_records(path), chunksize, known), dataset, compact)
+        except Exception as e: raise ValueError(f"NDJSON processing error: {e}")
+
+    @staticmethod
+    def _excel_frame(header: list, rows: list, width: int) -> pd.DataFrame:
+        # The same TextParser call pd.read_excel makes, on rows padded to the widest one seen like its reader pads them
+        pad = lambda row: row + [''] * (width - len(row))
+        return FileProcessor._fix_dates(TextParser([pad(header)] + [pad(r) for r in rows], header=0, skip_blank_lines=False).read())
+
+    @staticmethod
+    def _excel_frames(path: str, chunksize: int, sheet: Optional[str], state: Dict[str, Any]) -> Iterator[pd.DataFrame]:
+        with ExcelSheet(path, sheet) as book:
+            state.update(sheet=book.name, sheets=book.sheets)
+            rows = book.rows()
+            header = next(rows, None)
+            if header is None: yield pd.DataFrame(); return
+            state['width'] = max(state.get('width', 0), len(header))
+            batch, emitted = [], False
+            for row in rows:
+                if len(row) > state['width']:
+                    state['width'] = len(row)
+                    if emitted: raise ColumnsAdded([])
+                batch.append(row)
+                if len(batch) == chunksize:
+                    yield FileProcessor._excel_frame(header, batch, state['width'])
+                    batch, emitted = [], True
+            if batch or not emitted: yield FileProcessor._excel_frame(header, batch, state['width'])
+
+    @staticmethod
+    def process_excel_file(path: str, chunksize: int = 50000, dataset: Optional[DatasetWriter] = None, compact: bool = False,
+                           sheet: Optional[str] = None) -> Dict[str, Any]:
+        """Streams one worksheet (the first unless sheet names or numbers another) through a read-only workbook"""
+        state = {}
+        try:
+            response = FileProcessor._read_chunked(lambda dtypes: FileProcessor._excel_frames(path, chunksize, sheet, state), dataset, compact)
+            return {**response, 'sheet': state['sheet'], 'sheets': state['sheets']}
         except Exception as e: raise ValueError(f"Excel processing error: {e}")
 
     @staticmethod
-    def process_json(file_content: bytes) -> Dict[str, Any]:
+    def preview_excel(path: str, rows: int = 10) -> list:
+        """Name, columns and first rows of every worksheet, reading no further into any sheet than that"""
+        with ExcelSheet(path) as book: names = book.sheets
+        sheets = []
+        for name in names:
+            with ExcelSheet(path, name) as book:
+                data = list(book.rows(rows + 1))
+            df = FileProcessor._excel_frame(data[0], data[1:], max(map(len, data))) if data else pd.DataFrame()
+            sheets.append({'name': name, 'columns': df.columns.tolist(), 'preview': FileProcessor._preview_records(df)})
+        return sheets
+
+    @staticmethod
+    def process_path(path: str, ext: str, chunksize: int = 50000, dataset: Optional[DatasetWriter] = None, compact: bool = False,
+                     sheet: Optional[str] = None) -> Dict[str, Any]:
+        """Dispatch a spooled upload on its extension; everything but legacy .xls is read incrementally from disk"""
+        if ext == '.csv': return FileProcessor.process_csv_file(path, chunksize, dataset, compact)
+        if ext == '.xlsx': return FileProcessor.process_excel_file(path, chunksize, dataset, compact, sheet)
+        if ext == '.json': return FileProcessor.process_json_file(path, chunksize, dataset, compact)
+        if ext in ('.ndjson', '.jsonl'): return FileProcessor.process_ndjson_file(path, chunksize, dataset, compact)
+        with open(path, 'rb') as f: return FileProcessor.process_excel(f.read(), dataset, compact, sheet)
+
+    @staticmethod
+    def process_excel(file_content: bytes, dataset: Optional[DatasetWriter] = None, compact: bool = False, sheet: Optional[str] = None) -> Dict[str, Any]:
+        sheet_name = 0 if sheet is None else int(sheet) if str(sheet).isdigit() else sheet
+        try: return FileProcessor._prepare_response(FileProcessor._fix_dates(pd.read_excel(io.BytesIO(file_content), sheet_name=sheet_name, parse_dates=False)), dataset, compact)
+        except Exception as e: raise ValueError(f"Excel processing error: {e}")
+
+    @staticmethod
+    def process_json(file_content: bytes, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
         try:
             data = json.loads(file_content.decode('utf-8'))
             if isinstance(data, list):
@@ -34,7 +215,7 @@ class FileProcessor:
                 df = pd.DataFrame(data['data']) if 'data' in data and isinstance(data['data'], list) else pd.json_normalize(data)
             else:
                 raise ValueError("Unsupported JSON structure")
-            return FileProcessor._prepare_response(df)
+            return FileProcessor._prepare_response(df, dataset, compact)
         except Exception as e:
             raise ValueError(f"JSON processing error: {e}")
 
@@ -48,13 +229,89 @@ class FileProcessor:
         return obj
 
     @staticmethod
-    def _prepare_response(df: pd.DataFrame) -> Dict[str, Any]:
-        stats = {col: {'mean': float(df[col].mean()), 'min': float(df[col].min()), 'max': float(df[col].max()), 'std': float(df[col].std())} for col in df.columns if pd.api.types.is_numeric_dtype(df[col])}
-        convert = lambda d: FileProcessor._convert_timestamps(d)
-        return {'columns': df.columns.tolist(), 'preview': convert(df.head(100).to_dict(orient='records')), 'row_count': int(len(df)), 'stats': stats}
+    def _column_values(series: pd.Series) -> list:
+        """One preview column as JSON-ready Python values, formatted and null-masked with numpy for the whole column at once"""
+        if isinstance(series.dtype, pd.DatetimeTZDtype): series = series.dt.tz_localize(None)
+        if series.dtype.kind == 'M':
+            # Same output as _convert_timestamps: date only at midnight, otherwise date and time
+            stamps = series.to_numpy()
+            text = np.datetime_as_string(stamps, unit='s')
+            midnight = stamps.astype('datetime64[s]') == stamps.astype('datetime64[D]')
+            values = np.where(midnight, text.astype('U10'), np.char.replace(text, 'T', ' ')).astype(object)
+            values[np.isnat(stamps)] = None
+            return values.tolist()
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty', 'integer', 'floating', 'boolean'):
+            # Mixed object columns can hold timestamps or nested lists/dicts; only these fall back to the per-value walk
+            return [FileProcessor._convert_timestamps(v) for v in series.tolist()]
+        values = series.to_numpy()
+        if values.dtype.kind in 'iub': return values.tolist()
+        missing = np.isnan(values) if values.dtype.kind == 'f' else pd.isna(values)
+        if not missing.any(): return values.tolist()
+        values = values.astype(object)
+        values[missing] = None
+        return values.tolist()
+
+    @staticmethod
+    def _preview_records(df: pd.DataFrame) -> list:
+        keys = [str(c) if not isinstance(c, str) else c for c in df.columns]
+        columns = [FileProcessor._column_values(series) for _, series in df.items()]
+        return [dict(zip(keys, row)) for row in zip(*columns)] if columns else [{} for _ in range(len(df))]
+
+    @staticmethod
+    def _build_response(columns: list, preview: pd.DataFrame, row_count: int, stats: DatasetStats, memory: Optional[MemoryReport] = None,
+                        spent: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        response = {'columns': columns, 'preview': FileProcessor._preview_records(preview), 'row_count': int(row_count), 'stats': stats.to_dict()}
+        if memory: response['memory'] = memory.to_dict()
+        if spent: response['timings'] = {stage: round(seconds, 4) for stage, seconds in spent.items()}
+        return response
+
+    @staticmethod
+    def _prepare_response(df: pd.DataFrame, dataset: Optional[DatasetWriter] = None, compact: bool = False) -> Dict[str, Any]:
+        clock = time.perf_counter()
+        memory, stats, preview = MemoryReport(compact), DatasetStats().update(df), df.head(PREVIEW_ROWS)
+        if dataset: dataset.stats = stats.to_state()
+        spent = {'stats': time.perf_counter() - clock}
+        df = memory.sample(df, CompactPlan(df) if compact else None)
+        if dataset: dataset.write(df)
+        spent['serialize'] = time.perf_counter() - clock - spent['stats']
+        return FileProcessor._build_response(df.columns.tolist(), preview, len(df), stats, memory, spent)
+
+    @staticmethod
+    def _describe_columns(df: pd.DataFrame) -> list:
+        # Same column selection as DataFrame.describe()/select_dtypes('number'): numeric, booleans excluded
+        return [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+    @staticmethod
+    def analyze_batches(batches: Iterable[pd.DataFrame], analysis_type: str) -> Dict[str, Any]:
+        """Single pass over row blocks with mergeable per-block aggregates, so memory is bounded by the block size"""
+        if analysis_type == 'summary': return DatasetStats.scan(batches).summary()
+        if analysis_type == 'correlation':
+            acc = None
+            for df in batches:
+                if acc is None:
+                    if len(cols := FileProcessor._describe_columns(df)) < 2: return {'correlation': {}}
+                    acc = CovarianceAccumulator(cols)
+                acc.update(df)
+            return {'correlation': acc.correlation() if acc else {}}
+        return {}
 
     @staticmethod
     def analyze_data(df: pd.DataFrame, analysis_type: str) -> Dict[str, Any]:
-        if analysis_type == 'summary': return {'summary': df.describe().to_dict(), 'null_counts': df.isnull().sum().to_dict(), 'unique_counts': df.nunique().to_dict()}
-        if analysis_type == 'correlation': return {'correlation': (numeric_df := df.select_dtypes(include=['number'])).corr().to_dict() if len(numeric_df.columns) > 1 else {}}
-        return {}
\ No newline at end of file
+        return FileProcessor.analyze_batches([df], analysis_type)
+
+
+def parse_upload(path: str, ext: str, chunksize: int, dataset_root: Optional[str] = None, compact: bool = False, sheet: Optional[str] = None):
+    """Process-pool entry point: returns the parsed response, the finished dataset part file (or None) and the
+    serialised DatasetStats of its rows (or None). The response's timings split the worker's time by stage, since
+    metrics recorded in a pool process never reach the API process's registry."""
+    dataset = DatasetStore(dataset_root).writer() if dataset_root else None
+    start = time.perf_counter()
+    try:
+        data = FileProcessor.process_path(path, ext, chunksize, dataset, compact, sheet)
+        # Reading and parsing is whatever the stats and serialise stages do not account for, re-read passes included
+        spent, total = data.get('timings', {}), time.perf_counter() - start
+        data['timings'] = {'parse': round(total - sum(spent.values()), 4), **spent, 'total': round(total, 4)}
+        return (data, dataset.finish(), dataset.stats) if dataset else (data, None, None)
+    except Exception:
+        if dataset: dataset.reset()
+        raise
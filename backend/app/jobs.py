@@ -0,0 +1,35 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+class JobTracker:
+    """In-memory status board for background upload jobs; the oldest finished jobs are dropped past max_jobs"""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, filename: str) -> Dict[str, Any]:
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'filename': filename, 'status': 'queued', 'stage': 'queued',
+               'progress': 0.0, 'created_at': time.time(), 'finished_at': None, 'result': None, 'error': None}
+        with self._lock:
+            self._jobs[job['id']] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next((k for k, j in self._jobs.items() if j['finished_at']), None)
+                if oldest is None: break
+                del self._jobs[oldest]
+        return dict(job)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id not in self._jobs: return
+            if fields.get('status') in ('succeeded', 'failed'): fields['finished_at'] = time.time()
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
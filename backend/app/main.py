@@ -1,59 +1,264 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+import os, sys, subprocess
+
+if __name__ == "__main__":
+    # Serve through uvicorn's own entry point before anything below runs. Run as a script, this file would be the
+    # __main__ that every spawned child (uvicorn's reloaded server, each parse worker) re-executes as __mp_main__,
+    # building a second data store, pool and sinks and wiping the result cache's spill directory under the server.
+    sys.exit(subprocess.call([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+                              "--host", "0.0.0.0", "--port", "8000", "--reload"]))
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import PlainTextResponse
-import os, time, pandas as pd
-from file_processor import FileProcessor
+from fastapi.responses import PlainTextResponse, Response, FileResponse
+import time, json, hmac, shutil, asyncio, hashlib, tempfile, threading, functools, multiprocessing, pandas as pd, pyarrow as pa
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+from file_processor import FileProcessor, parse_upload
+from online_stats import DatasetStats
+from query_engine import QueryError, run_query
 from data_store import DataStore
-from simple_metrics import record_upload, record_error, get_metrics
+from connections import connections
+from dataset_store import DatasetStore
+from blob_store import BlobStore
+from jobs import JobTracker
+from result_cache import ResultCache
+from fast_json import FastJSONResponse, dumps as json_dumps
+from federated_search import FederatedSearch
+from sinks import UploadRecord, SinkFanOut, DiskSink, MongoSink, OpenSearchSink, PostgresSink
+from simple_metrics import record_upload, record_error, record_cache, record_request, record_stage, record_volume, timed, get_metrics
+from profiler import profiler, ProfilerBusy
 from mongodb_service import mongo_service
 from opensearch_service import opensearch
 from postgres_service import postgres
 
-ALLOWED_EXTENSIONS = ['.csv', '.xlsx', '.xls', '.json']
-EXT_TO_TYPE = {'.csv': 'CSV', '.xlsx': 'Excel', '.xls': 'Excel', '.json': 'JSON'}
+ALLOWED_EXTENSIONS = ['.csv', '.xlsx', '.xls', '.json', '.ndjson', '.jsonl']
+EXT_TO_TYPE = {'.csv': 'CSV', '.xlsx': 'Excel', '.xls': 'Excel', '.json': 'JSON', '.ndjson': 'NDJSON', '.jsonl': 'NDJSON'}
 CORS_ORIGINS = ["http://localhost:3000", "http://localhost:4200", "http://localhost:5173", "http://localhost:5176"]
+# Served as-is under /uploads; raw blobs and in-flight spool files are private and live outside it, next to the datasets
 STORAGE_DIR = "uploads"
+SPOOL_DIR = ".spool"
+BLOB_DIR = "blobs"
+SPOOL_BLOCK_BYTES = 1 << 20
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "50000"))
+DATASET_DIR = "datasets"
+MAX_ROWS_PER_PAGE = 10000
+ANALYSIS_BATCH_ROWS = int(os.getenv("ANALYSIS_BATCH_ROWS", "250000"))
+BACKEND_STATS_TTL = 30
+COPY_BATCH_ROWS = 100000
+COMPACT_DTYPES = os.getenv("COMPACT_DTYPES", "0") == "1"
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Extra backends every upload is replicated to, on top of the one its endpoint targets, e.g. "opensearch,postgresql"
+UPLOAD_SINKS = [s.strip() for s in os.getenv("UPLOAD_SINKS", "").split(",") if s.strip()]
+# /debug/profile stays disabled unless a token is configured; requests must send it as X-Profile-Token
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
 os.makedirs(STORAGE_DIR, exist_ok=True)
+os.makedirs(SPOOL_DIR, exist_ok=True)
+# Earlier versions kept both inside STORAGE_DIR, where the static mount exposed them: move the blobs, drop stale spool files
+if os.path.isdir(os.path.join(STORAGE_DIR, "blobs")) and not os.path.exists(BLOB_DIR): os.replace(os.path.join(STORAGE_DIR, "blobs"), BLOB_DIR)
+shutil.rmtree(os.path.join(STORAGE_DIR, ".spool"), ignore_errors=True)
 
 app = FastAPI(title="Simple Data Analytics Dashboard", description="Upload and analyze CSV, Excel, and JSON files", version="1.0.0")
 app.add_middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
-data_store = DataStore()
+data_store = DataStore(os.getenv("DATA_STORE_PATH") or None)
+datasets = DatasetStore(DATASET_DIR)
+blobs = BlobStore(BLOB_DIR)
+jobs = JobTracker()
+result_cache = ResultCache(int(os.getenv("RESULT_CACHE_ENTRIES", "512")), int(os.getenv("RESULT_CACHE_MB", "64")) << 20, os.getenv("RESULT_CACHE_DIR") or None)
+
+def new_parse_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the API process already runs pyarrow/driver threads that a forked child could deadlock on
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+parse_pool = new_parse_pool()
+background_tasks = set()
+append_locks: Dict[int, threading.Lock] = {}
+federated = FederatedSearch([
+    ('sqlite', data_store.search_files, lambda hit: hit['id']),
+    ('mongodb', lambda q, limit: mongo_service.search_files(q, limit), lambda hit: hit.get('sqlite_file_id')),
+    ('opensearch', lambda q, limit: opensearch.search_files(q, limit), lambda hit: hit.get('sqlite_file_id')),
+    ('postgresql', lambda q, limit: postgres.search_files(q, limit)[0], lambda hit: hit.get('sqlite_file_id')),
+])
+sinks = SinkFanOut([DiskSink(blobs), MongoSink(mongo_service, COPY_BATCH_ROWS), OpenSearchSink(opensearch, COPY_BATCH_ROWS), PostgresSink(postgres, COPY_BATCH_ROWS)])
 
-def process_uploaded_file(file: UploadFile, content: bytes):
-    ext = os.path.splitext(file.filename)[1].lower()
+def check_extension(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
     if ext not in ALLOWED_EXTENSIONS:
         record_error()
         raise HTTPException(status_code=400, detail=f"File type not supported. Allowed: {', '.join(ALLOWED_EXTENSIONS)}")
-    processors = {'.csv': FileProcessor.process_csv, '.xlsx': FileProcessor.process_excel, '.xls': FileProcessor.process_excel, '.json': FileProcessor.process_json}
-    return processors[ext](content), EXT_TO_TYPE[ext]
+    return ext
 
-def save_physical_file(filename: str, content: bytes):
-    with open(f"{STORAGE_DIR}/{filename}", "wb") as f:
-        f.write(content)
+async def spool_upload(file: UploadFile):
+    """Copy the upload to disk block by block so the raw bytes never sit in memory at once, hashing as it goes"""
+    check_extension(file.filename)
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    with os.fdopen(fd, "wb") as out:
+        def write(block):
+            out.write(block); digest.update(block)
+        # Writing and hashing a block off the event loop, so a large upload does not stall every other request
+        while block := await file.read(SPOOL_BLOCK_BYTES):
+            await asyncio.to_thread(write, block); size += len(block)
+    record_volume("upload", nbytes=size)
+    return path, digest.hexdigest()
+
+def discard_spool(path):
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except OSError as e: print(f"Warning: Could not remove spooled upload {path}: {e}")
 
 def http_error(e): raise HTTPException(status_code=500, detail=str(e))
 
+def backend_health(name: str, service: str):
+    """Last state seen by the background prober; answering never waits on the backend itself"""
+    state = connections.health(name)
+    message = {"healthy": "running!", "unhealthy": "unreachable", "unknown": "not checked yet"}[state["status"]]
+    return {**state, "service": service, "message": f"{service} is {message}"}
+
+def cached_json(request: Request, key: tuple, compute, ttl=None) -> Response:
+    """Serve a JSON body from the result cache, computing it on a miss; a matching If-None-Match gets a bare 304"""
+    hit = result_cache.get(key)
+    record_cache(key[0], hit is not None)
+    if hit: body, etag = hit
+    else:
+        with timed(key[0]): content = compute()
+        with timed("encode"): body = json_dumps(content)
+        record_volume("response", nbytes=len(body))
+        etag = result_cache.put(key, body, ttl)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""): return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def invalidate_file_results(file_id=None, backend=None):
+    if file_id is not None: result_cache.invalidate("analyze", file_id); result_cache.invalidate("query", file_id)
+    result_cache.invalidate("stats"); result_cache.invalidate("files")
+    if backend: result_cache.invalidate("backend_stats", backend)
+
+def cached_parse(digest: str, file_type: str, parse_options=None):
+    """Parse result, dataset part and stats state of an earlier upload of the same bytes read with the same options, or None"""
+    known = data_store.find_by_hash(digest, file_type, parse_options)
+    if not known: return None
+    data = {'columns': known['columns'], 'preview': known['preview'], 'row_count': known['row_count'], 'stats': known['stats']}
+    return data, datasets.clone(known['id']) if datasets.exists(known['id']) else None, data_store.get_stats_state(known['id'])
+
+def record_parse(data, seconds: float):
+    """Stage histograms from the worker's own timings; time not spent in the worker was spent queueing for one"""
+    timings = data.get("timings", {})
+    for stage in ("parse", "stats", "serialize"):
+        if stage in timings: record_stage(stage, timings[stage])
+    if "total" in timings: record_stage("parse_queue", max(seconds - timings["total"], 0.0))
+    record_volume("parse", rows=data.get("row_count") or 0)
+
+async def run_parse(*args):
+    """parse_upload in the process pool. A worker that dies (e.g. OOM-killed on a huge file) leaves the executor unusable
+    for good, so it is swapped for a fresh one: the jobs that were running on it fail, later uploads do not."""
+    global parse_pool
+    pool = parse_pool
+    try: return await asyncio.get_running_loop().run_in_executor(pool, parse_upload, *args)
+    except BrokenProcessPool:
+        if parse_pool is pool:
+            parse_pool = new_parse_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise RuntimeError("The parsing worker stopped unexpectedly, e.g. out of memory on a very large file")
+
+async def run_upload_job(job_id: str, filename: str, path: str, digest: str, persist, start: float, sheet: Optional[str] = None):
+    """Parse in the process pool, then persist in a thread, so the event loop never runs pandas or blocking I/O"""
+    dataset = None
+    try:
+        ext = check_extension(filename)
+        jobs.update(job_id, status="running", stage="parsing", progress=0.1)
+        # Identical bytes were parsed before: reuse that result and share its dataset instead of running pandas again
+        options = f"sheet={sheet}" if sheet is not None else None
+        cached = await asyncio.to_thread(cached_parse, digest, EXT_TO_TYPE[ext], options)
+        record_cache("parse", cached is not None)
+        if cached: data, part, state = cached
+        else:
+            waited = time.perf_counter()
+            data, part, state = await run_parse(path, ext, STREAM_CHUNK_ROWS, DATASET_DIR, COMPACT_DTYPES, sheet)
+            record_parse(data, time.perf_counter() - waited)
+        if options: data = {**data, "parse_options": options}
+        dataset = datasets.writer(part, state)
+        jobs.update(job_id, stage="persisting", progress=0.7)
+        result = await asyncio.to_thread(persist, filename, EXT_TO_TYPE[ext], data, path, dataset, digest, start)
+        jobs.update(job_id, status="succeeded", stage="done", progress=1.0, result={**result, "content_hash": digest, "parse_reused": cached is not None})
+    except Exception as e:
+        record_error()
+        jobs.update(job_id, status="failed", stage="failed", error=str(e.detail if isinstance(e, HTTPException) else e),
+                    status_code=e.status_code if isinstance(e, HTTPException) else 500)
+    finally:
+        discard_spool(path)
+        if dataset: dataset.discard()
+
+def persist_to_sinks(filename, file_type, data, path, dataset, digest, source, targets=()):
+    """Write the SQLite record (whose id everything else references), then fan out to disk and the backend sinks concurrently"""
+    with timed("sqlite"): file_id = data_store.save_file_info(filename, file_type, data, source=source, content_hash=digest, parse_options=data.get("parse_options"), stats_state=dataset.stats)
+    with timed("dataset_commit"): dataset.commit(file_id)
+    record = UploadRecord(filename, file_type, data, file_id, path, datasets.open(file_id) if datasets.exists(file_id) else None, digest)
+    report = sinks.write(["disk", *targets, *UPLOAD_SINKS], record)
+    invalidate_file_results(file_id, source)
+    for name in report:
+        if name not in ("disk", source): invalidate_file_results(backend=name)
+    return file_id, report
+
+async def start_upload(file: UploadFile, kind: str, persist, wait: bool, sheet: Optional[str] = None):
+    start = time.time()
+    path, digest = await spool_upload(file)
+    job = jobs.create(kind, file.filename)
+    task = asyncio.create_task(run_upload_job(job["id"], file.filename, path, digest, persist, start, sheet))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    if not wait:
+        return {"success": True, "job_id": job["id"], "status": job["status"], "filename": file.filename, "message": "Upload accepted for processing"}
+    await task
+    job = jobs.get(job["id"])
+    if job["status"] == "failed": raise HTTPException(status_code=job.get("status_code", 500), detail=job["error"])
+    return FastJSONResponse(job["result"])
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Latency labelled by route template (/api/files/{file_id}, not every id), so the series stay bounded"""
+    start, status = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        record_request(request.method, route.path if route else "unmatched", status, time.perf_counter() - start)
+
 @app.get("/")
 def read_root():
-    return {"message": "Data Analytics Dashboard API", "version": "1.0.0", "supported_formats": ["CSV", "Excel (.xlsx, .xls)", "JSON"]}
+    return {"message": "Data Analytics Dashboard API", "version": "1.0.0", "supported_formats": ["CSV", "Excel (.xlsx, .xls)", "JSON", "NDJSON (.ndjson, .jsonl)"]}
+
+def persist_upload(filename, file_type, data, path, dataset, digest, start):
+    file_id, report = persist_to_sinks(filename, file_type, data, path, dataset, digest, 'sqlite')
+    return {"success": True, "file_id": file_id, "filename": filename, "file_type": file_type,
+            "message": "File uploaded successfully", "data": data, "sinks": report, "upload_time": round(record_upload(start), 2)}
 
 @app.post("/api/upload/")
-async def upload_file(file: UploadFile = File(...)):
-    start = time.time()
-    try:
-        content = await file.read()
-        data, file_type = process_uploaded_file(file, content)
-        file_id = data_store.save_file_info(file.filename, file_type, data)
-        save_physical_file(file.filename, content)
-        return {"success": True, "file_id": file_id, "filename": file.filename, "file_type": file_type,
-                "message": "File uploaded successfully", "data": data, "upload_time": round(record_upload(start), 2)}
-    except HTTPException: raise
-    except Exception as e: record_error(); http_error(e)
+async def upload_file(file: UploadFile = File(...), wait: bool = Query(False), sheet: Optional[str] = Query(None)):
+    return await start_upload(file, "upload", persist_upload, wait, sheet)
+
+@app.get("/api/search")
+async def search_all(q: str = Query(..., min_length=1), limit: int = Query(50, ge=1, le=500)):
+    try: return {"success": True, "query": q, **(await federated.search(q, limit))}
+    except Exception as e: http_error(e)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse({"success": True, "job": job})
 
 @app.get("/api/files/")
-def get_all_files():
-    try: return {"success": True, "count": len(files := data_store.get_all_files()), "files": files}
+def get_all_files(request: Request, include_preview: bool = Query(False), source: Optional[str] = None, limit: Optional[int] = Query(None, ge=1), offset: int = Query(0, ge=0)):
+    try:
+        def compute():
+            files = data_store.get_files_by_source(source, include_preview, limit, offset) if source else data_store.get_all_files(include_preview, limit, offset)
+            return {"success": True, "count": len(files), "files": files}
+        return cached_json(request, ("files", include_preview, source, limit, offset), compute)
     except Exception as e: http_error(e)
 
 @app.get("/api/files/{file_id}")
@@ -61,7 +266,39 @@ def get_file(file_id: int):
     try:
         file_data = data_store.get_file_by_id(file_id)
         if not file_data: raise HTTPException(status_code=404, detail="File not found")
-        return {"success": True, "file": file_data}
+        return FastJSONResponse({"success": True, "file": file_data})
+    except HTTPException: raise
+    except Exception as e: http_error(e)
+
+@app.get("/api/files/{file_id}/rows")
+def get_file_rows(file_id: int, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=MAX_ROWS_PER_PAGE), columns: Optional[List[str]] = Query(None)):
+    try:
+        if not datasets.exists(file_id): raise HTTPException(status_code=404, detail="Row data not available for this file")
+        page = datasets.read_rows(file_id, offset, limit, columns)
+        return FastJSONResponse({"success": True, "file_id": file_id, **page, "rows": FileProcessor._convert_timestamps(page["rows"])})
+    except HTTPException: raise
+    except KeyError as e: raise HTTPException(status_code=400, detail=str(e.args[0]))
+    except Exception as e: http_error(e)
+
+def raw_path(file_id: int):
+    file_data = data_store.get_file_by_id(file_id)
+    if not file_data: raise HTTPException(status_code=404, detail="File not found")
+    path = blobs.path(file_data['content_hash']) if file_data.get('content_hash') else f"{STORAGE_DIR}/{file_data['filename']}"
+    if not os.path.exists(path): raise HTTPException(status_code=404, detail="Raw file not available")
+    return file_data, path
+
+@app.get("/api/files/{file_id}/raw")
+def download_file(file_id: int):
+    file_data, path = raw_path(file_id)
+    return FileResponse(path, filename=file_data['filename'])
+
+@app.get("/api/files/{file_id}/sheets")
+def get_file_sheets(file_id: int, rows: int = Query(10, ge=1, le=100)):
+    """Worksheets of an uploaded workbook with their first rows, to choose one for ?sheet= on upload"""
+    try:
+        file_data, path = raw_path(file_id)
+        if not file_data['filename'].lower().endswith('.xlsx'): raise HTTPException(status_code=400, detail="Sheet listing needs an .xlsx workbook")
+        return FastJSONResponse({"success": True, "file_id": file_id, "sheets": FileProcessor.preview_excel(path, rows)})
     except HTTPException: raise
     except Exception as e: http_error(e)
 
@@ -71,57 +308,121 @@ def delete_file(file_id: int):
         file_data = data_store.get_file_by_id(file_id)
         if not file_data: raise HTTPException(status_code=404, detail="File not found")
         if not data_store.delete_file(file_id): raise HTTPException(status_code=500, detail="Failed to delete file from database")
-        file_path = f"{STORAGE_DIR}/{file_data['filename']}"
-        if os.path.exists(file_path):
-            try: os.remove(file_path)
-            except Exception as e: print(f"Warning: Could not delete physical file {file_path}: {e}")
+        datasets.delete(file_id)
+        # An append still waiting on the lock finds the record gone and stops; nothing else needs the entry
+        append_locks.pop(file_id, None)
+        invalidate_file_results(file_id, file_data.get('source'))
+        # Content-addressed blobs are shared by every record with the same bytes; only the last one removes it
+        if file_data.get('content_hash'): blobs.release(file_data['content_hash'], data_store.hash_refs)
+        else:
+            file_path = f"{STORAGE_DIR}/{file_data['filename']}"
+            if os.path.exists(file_path):
+                try: os.remove(file_path)
+                except Exception as e: print(f"Warning: Could not delete physical file {file_path}: {e}")
         return {"success": True, "message": f"File {file_data['filename']} deleted successfully"}
     except HTTPException: raise
     except Exception as e: http_error(e)
 
 @app.get("/api/analyze/{file_id}")
-def analyze_file(file_id: int, analysis_type: str = Query("summary", pattern="^(summary|correlation)$")):
-    try:
+def analyze_file(request: Request, file_id: int, analysis_type: str = Query("summary", pattern="^(summary|correlation)$")):
+    def compute():
         file_data = data_store.get_file_by_id(file_id)
         if not file_data: raise HTTPException(status_code=404, detail="File not found")
+        # The summary is kept in mergeable form since upload (and through appends); only older files need a scan
+        state = data_store.get_stats_state(file_id) if analysis_type == 'summary' else None
+        if state: return {"success": True, "file_id": file_id, "analysis_type": analysis_type, "results": DatasetStats.from_state(state).summary()}
+        # Files uploaded before full datasets were persisted only have their preview to go on
+        if datasets.exists(file_id):
+            columns = datasets.numeric_columns(file_id) if analysis_type == 'correlation' else None
+            frames = datasets.iter_frames(file_id, ANALYSIS_BATCH_ROWS, columns)
+        else: frames = [pd.DataFrame(file_data['preview'])]
         return {"success": True, "file_id": file_id, "analysis_type": analysis_type,
-                "results": FileProcessor.analyze_data(pd.DataFrame(file_data['preview']), analysis_type)}
+                "results": FileProcessor.analyze_batches(frames, analysis_type)}
+    try: return cached_json(request, ("analyze", file_id, analysis_type), compute)
     except HTTPException: raise
     except Exception as e: http_error(e)
 
-@app.post("/api/mongodb/upload/")
-async def upload_to_mongodb(file: UploadFile = File(...)):
-    start = time.time()
-    try:
-        content = await file.read()
-        data, file_type = process_uploaded_file(file, content)
-        mongo_id = None
-        try:
-            mongo_id = mongo_service.save_uploaded_file(filename=file.filename, file_type=file_type, data=data)
-        except Exception as e:
-            print(f"[WARN] MongoDB upload failed: {e}")
-        sqlite_id = data_store.save_file_info(file.filename, file_type, data, source='mongodb')
-        save_physical_file(file.filename, content)
-        return {"success": True, "message": "File saved to MongoDB!" if mongo_id else "File saved (MongoDB unavailable, saved to SQLite only)", "mongo_id": mongo_id, "sqlite_file_id": sqlite_id,
-                "filename": file.filename, "file_type": file_type, "data_preview": data.get("preview", [])[:5], "upload_time": round(record_upload(start), 2)}
+@app.post("/api/files/{file_id}/query")
+def query_file(request: Request, file_id: int, spec: Dict[str, Any] = Body(...)):
+    """Filters, group-by/time-bucket aggregates and LTTB or min/max downsampling over the whole stored dataset, so a
+    chart gets a few thousand representative points instead of the first rows of the preview"""
+    def compute():
+        if datasets.exists(file_id): table = datasets.open(file_id)
+        else:
+            file_data = data_store.get_file_by_id(file_id)
+            if not file_data: raise HTTPException(status_code=404, detail="File not found")
+            table = pa.Table.from_pandas(pd.DataFrame(file_data['preview']), preserve_index=False)
+        result, table = run_query(table, spec)
+        record_volume("query", rows=result["source_rows"])
+        # Column-wise, like previews: a few thousand rows of a wide file would take far longer value by value
+        return {"success": True, "file_id": file_id, "from_preview": not datasets.exists(file_id), **result, "rows": FileProcessor._preview_records(table.to_pandas())}
+    try: return cached_json(request, ("query", file_id, json.dumps(spec, sort_keys=True)), compute)
     except HTTPException: raise
-    except Exception as e: record_error(); http_error(e)
+    except QueryError as e: raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e: http_error(e)
+
+def append_lock(file_id: int) -> threading.Lock:
+    return append_locks.setdefault(file_id, threading.Lock())
+
+def persist_append(file_id, filename, file_type, data, path, dataset, digest, start):
+    """Add the parsed rows to an existing file: a new dataset segment plus stats merged from both states, so the
+    work is proportional to the new rows only. Backend copies of the file are left as they were."""
+    with append_lock(file_id):
+        target = data_store.get_file_by_id(file_id)
+        if not target: raise HTTPException(status_code=404, detail="File not found")
+        if not datasets.exists(file_id): raise HTTPException(status_code=409, detail="File has no stored dataset to append to")
+        missing = [c for c in target['columns'] if c not in data['columns']]
+        extra = [c for c in data['columns'] if c not in target['columns']]
+        if missing or extra:
+            raise HTTPException(status_code=400, detail=f"Columns do not match the file; missing: {missing or 'none'}, unexpected: {extra or 'none'}")
+        state = data_store.get_stats_state(file_id)
+        if state: stats = DatasetStats.from_state(state)
+        else:
+            # Uploaded before stats were kept in mergeable form: scan the stored rows once, later appends merge
+            print(f"[WARN] File {file_id} has no stats state; rebuilding it from its dataset")
+            stats = DatasetStats.scan(datasets.iter_frames(file_id, ANALYSIS_BATCH_ROWS))
+        added = 0
+        if dataset.path:
+            try: added = datasets.append(file_id, dataset.path)
+            except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+            stats.merge(DatasetStats.from_state(dataset.stats))
+        with timed("sqlite"): row_count = data_store.append_rows(file_id, added, stats.to_dict(), stats.to_state())
+        record_volume("append", rows=added)
+        invalidate_file_results(file_id, target.get('source'))
+    return {"success": True, "file_id": file_id, "filename": target['filename'], "appended_filename": filename, "appended_rows": added,
+            "row_count": row_count, "stats": stats.to_dict(), "message": f"Appended {added} rows", "upload_time": round(record_upload(start), 2)}
+
+@app.post("/api/files/{file_id}/append")
+async def append_to_file(file_id: int, file: UploadFile = File(...), wait: bool = Query(False), sheet: Optional[str] = Query(None)):
+    if not await asyncio.to_thread(data_store.get_file_by_id, file_id): raise HTTPException(status_code=404, detail="File not found")
+    return await start_upload(file, "append", functools.partial(persist_append, file_id), wait, sheet)
+
+def persist_mongodb(filename, file_type, data, path, dataset, digest, start):
+    sqlite_id, report = persist_to_sinks(filename, file_type, data, path, dataset, digest, 'mongodb', ['mongodb'])
+    mongo_id = report['mongodb'].get('id')
+    return {"success": True, "message": "File saved to MongoDB!" if mongo_id else "File saved (MongoDB unavailable, saved to SQLite only)", "mongo_id": mongo_id, "sqlite_file_id": sqlite_id,
+            "filename": filename, "file_type": file_type, "data_preview": data.get("preview", [])[:5], "sinks": report, "upload_time": round(record_upload(start), 2)}
+
+@app.post("/api/mongodb/upload/")
+async def upload_to_mongodb(file: UploadFile = File(...), wait: bool = Query(False), sheet: Optional[str] = Query(None)):
+    return await start_upload(file, "mongodb", persist_mongodb, wait, sheet)
 
 @app.get("/api/mongodb/files/")
-def get_mongodb_files():
+def get_mongodb_files(include_preview: bool = Query(False), limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None):
     try:
         # Try to get files from MongoDB
-        files = []
+        files, next_cursor = [], None
         try:
-            files = mongo_service.get_all_files()
+            files, next_cursor = mongo_service.get_all_files(limit, cursor, include_preview)
+        except ValueError: raise HTTPException(status_code=400, detail="Invalid cursor")
         except Exception as e:
             print(f"[WARN] MongoDB access error: {e}")
             files = []
         
         # If MongoDB returned no files, fallback to SQLite files with source='mongodb'
-        if not files:
+        if not files and not cursor:
             try:
-                sqlite_files = data_store.get_files_by_source('mongodb')
+                sqlite_files = data_store.get_files_by_source('mongodb', include_payload=include_preview, limit=limit)
                 # Convert SQLite format to match MongoDB format
                 for f in sqlite_files:
                     files.append({
@@ -132,14 +433,13 @@ def get_mongodb_files():
                         'columns': f['columns'],
                         'row_count': f['row_count'],
                         'uploaded_at': f['uploaded_at'],
-                        'preview_data': f.get('preview', []),
-                        'preview': f.get('preview', []),
-                        'stats': f.get('stats', {})
+                        **({'preview_data': f['preview'], 'preview': f['preview'], 'stats': f['stats']} if include_preview else {})
                     })
             except Exception as e:
                 print(f"[WARN] SQLite fallback error: {e}")
         
-        return {"success": True, "count": len(files), "files": files}
+        return {"success": True, "count": len(files), "files": files, "next_cursor": next_cursor}
+    except HTTPException: raise
     except Exception as e: 
         print(f"[ERROR] get_mongodb_files error: {e}")
         import traceback
@@ -147,77 +447,61 @@ def get_mongodb_files():
         http_error(e)
 
 @app.get("/api/mongodb/search/")
-def search_mongodb_files(q: str):
-    try: return {"success": True, "query": q, "count": len(files := mongo_service.search_files(q)), "files": files}
+def search_mongodb_files(q: str, limit: int = Query(50, ge=1, le=500), include_preview: bool = Query(False), substring: bool = Query(False)):
+    try: return {"success": True, "query": q, "count": len(files := mongo_service.search_files(q, limit, include_preview, substring)), "files": files}
     except Exception as e: http_error(e)
 
 @app.get("/api/stats/")
-def get_system_stats():
-    files = data_store.get_all_files()
-    file_types = {}
-    for f in files: file_types[f['file_type']] = file_types.get(f['file_type'], 0) + 1
-    return {"success": True, "stats": {"total_files": len(files), "file_types": file_types,
-            "total_rows": sum(f.get('row_count', 0) for f in files), "total_columns": sum(len(f['columns']) for f in files)}}
+def get_system_stats(request: Request):
+    try: return cached_json(request, ("stats",), lambda: {"success": True, "stats": data_store.get_stats()})
+    except Exception as e: http_error(e)
 
 @app.get("/metrics")
 def metrics(): return PlainTextResponse(get_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
+@app.get("/debug/profile")
+async def capture_profile(request: Request, seconds: float = Query(10, gt=0, le=60), interval_ms: float = Query(10, ge=1, le=1000), idle: bool = Query(False)):
+    """Sample live traffic for `seconds` and return collapsed stacks for flamegraph.pl or speedscope. Threads parked
+    on locks, queues or the event loop's selector are left out unless idle=true."""
+    if not PROFILE_TOKEN: raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-profile-token", ""), PROFILE_TOKEN): raise HTTPException(status_code=403, detail="Invalid profile token")
+    try: stacks = await asyncio.to_thread(profiler.capture, seconds, interval_ms / 1000, idle)
+    except ProfilerBusy as e: raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks, headers={"Content-Disposition": f'attachment; filename="profile-{int(time.time())}.folded"'})
+
+def persist_opensearch(filename, file_type, data, path, dataset, digest, start):
+    sqlite_id, report = persist_to_sinks(filename, file_type, data, path, dataset, digest, 'opensearch', ['opensearch'])
+    return {"success": True, "message": "File indexed in OpenSearch!", "search_id": report['opensearch'].get('id'), "sqlite_file_id": sqlite_id,
+            "filename": filename, "file_type": file_type, "preview": data.get("preview", [])[:10],
+            "columns": data.get("columns", []), "row_count": data.get("row_count", 0), "sinks": report, "upload_time": round(record_upload(start), 2)}
+
 @app.post("/api/opensearch/upload/")
-async def upload_to_opensearch(file: UploadFile = File(...)):
-    start = time.time()
-    try:
-        content = await file.read()
-        data, file_type = process_uploaded_file(file, content)
-        search_id = None
-        try: search_id = opensearch.index_file(filename=file.filename, file_type=file_type, data=data)
-        except Exception as e: print(f"[WARN] OpenSearch indexing failed: {e}")
-        sqlite_id = data_store.save_file_info(file.filename, file_type, data, source='opensearch')
-        save_physical_file(file.filename, content)
-        return {"success": True, "message": "File indexed in OpenSearch!", "search_id": search_id, "sqlite_file_id": sqlite_id,
-                "filename": file.filename, "file_type": file_type, "preview": data.get("preview", [])[:10],
-                "columns": data.get("columns", []), "row_count": data.get("row_count", 0), "upload_time": round(record_upload(start), 2)}
-    except HTTPException: raise
-    except Exception as e: record_error(); http_error(e)
+async def upload_to_opensearch(file: UploadFile = File(...), wait: bool = Query(False), sheet: Optional[str] = Query(None)):
+    return await start_upload(file, "opensearch", persist_opensearch, wait, sheet)
 
 @app.get("/api/opensearch/search/")
-def search_opensearch(q: str):
-    try: return {"success": True, "query": q, "count": len(results := opensearch.search_files(q)), "results": results}
+def search_opensearch(q: str, limit: int = Query(50, ge=1, le=500)):
+    try: return {"success": True, "query": q, "count": len(results := opensearch.search_files(q, limit)), "results": results}
     except Exception as e: http_error(e)
 
 @app.get("/api/opensearch/stats/")
-def get_opensearch_stats():
-    try: return {"success": True, "stats": opensearch.get_stats()}
+def get_opensearch_stats(request: Request):
+    try: return cached_json(request, ("backend_stats", "opensearch"), lambda: {"success": True, "stats": opensearch.get_stats()}, BACKEND_STATS_TTL)
     except Exception as e: http_error(e)
 
 @app.get("/health/opensearch")
-def check_opensearch():
-    try:
-        status = "healthy" if opensearch.client.ping() else "unhealthy"
-        return {"status": status, "service": "OpenSearch", "message": f"OpenSearch is {'running!' if status == 'healthy' else 'unreachable'}"}
-    except Exception as e: return {"status": "error", "service": "OpenSearch", "error": str(e)}
+def check_opensearch(): return backend_health("opensearch", "OpenSearch")
+
+def persist_postgres(filename, file_type, data, path, dataset, digest, start):
+    sqlite_id, report = persist_to_sinks(filename, file_type, data, path, dataset, digest, 'postgresql', ['postgresql'])
+    file_id = report['postgresql'].get('id')
+    return {"success": True, "message": "File saved to PostgreSQL!" if file_id else "File saved (PostgreSQL unavailable, saved to SQLite only)", "file_id": file_id, "sqlite_file_id": sqlite_id,
+            "filename": filename, "file_type": file_type, "preview": data.get("preview", [])[:10],
+            "columns": data.get("columns", []), "row_count": data.get("row_count", 0), "sinks": report, "upload_time": round(record_upload(start), 2)}
 
 @app.post("/api/postgres/upload/")
-async def upload_to_postgres(file: UploadFile = File(...)):
-    start = time.time()
-    try:
-        content = await file.read()
-        data, file_type = process_uploaded_file(file, content)
-        file_id = None
-        try:
-            file_id = postgres.save_file(filename=file.filename, file_type=file_type, data=data)
-        except Exception as e:
-            print(f"[WARN] PostgreSQL upload failed: {e}")
-        sqlite_id = data_store.save_file_info(file.filename, file_type, data, source='postgresql')
-        save_physical_file(file.filename, content)
-        if not file_id:
-            return {"success": True, "message": "File saved (PostgreSQL unavailable, saved to SQLite only)", "file_id": None, "sqlite_file_id": sqlite_id,
-                    "filename": file.filename, "file_type": file_type, "preview": data.get("preview", [])[:10],
-                    "columns": data.get("columns", []), "row_count": data.get("row_count", 0), "upload_time": round(record_upload(start), 2)}
-        return {"success": True, "message": "File saved to PostgreSQL!", "file_id": file_id, "sqlite_file_id": sqlite_id,
-                "filename": file.filename, "file_type": file_type, "preview": data.get("preview", [])[:10],
-                "columns": data.get("columns", []), "row_count": data.get("row_count", 0), "upload_time": round(record_upload(start), 2)}
-    except HTTPException: raise
-    except Exception as e: record_error(); http_error(e)
+async def upload_to_postgres(file: UploadFile = File(...), wait: bool = Query(False), sheet: Optional[str] = Query(None)):
+    return await start_upload(file, "postgresql", persist_postgres, wait, sheet)
 
 @app.get("/api/postgres/files/")
 def get_postgres_files():
@@ -225,25 +509,31 @@ def get_postgres_files():
     except Exception as e: http_error(e)
 
 @app.get("/api/postgres/search/")
-def search_postgres_files(q: str):
-    try: return {"success": True, "query": q, "count": len(files := postgres.search_files(q)), "files": files}
+def search_postgres_files(q: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None, include_preview: bool = Query(False)):
+    try:
+        files, next_cursor = postgres.search_files(q, limit, cursor, include_preview)
+        return {"success": True, "query": q, "count": len(files), "files": files, "next_cursor": next_cursor}
+    except ValueError: raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e: http_error(e)
 
 @app.get("/api/postgres/stats/")
-def get_postgres_stats():
-    try: return {"success": True, "stats": postgres.get_stats()}
+def get_postgres_stats(request: Request):
+    try: return cached_json(request, ("backend_stats", "postgresql"), lambda: {"success": True, "stats": postgres.get_stats()}, BACKEND_STATS_TTL)
     except Exception as e: http_error(e)
 
 @app.get("/health/postgres")
-def check_postgres():
-    try:
-        postgres.cursor.execute("SELECT 1")
-        status = "healthy" if postgres.cursor.fetchone()[0] == 1 else "unhealthy"
-        return {"status": status, "service": "PostgreSQL", "message": f"PostgreSQL is {'running!' if status == 'healthy' else 'unreachable'}"}
-    except Exception as e: return {"status": "error", "service": "PostgreSQL", "error": str(e)}
+def check_postgres(): return backend_health("postgresql", "PostgreSQL")
 
-app.mount("/uploads", StaticFiles(directory=STORAGE_DIR), name="uploads")
+@app.get("/health/mongodb")
+def check_mongodb(): return backend_health("mongodb", "MongoDB")
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+@app.on_event("startup")
+def start_health_prober(): connections.start()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    connections.stop()
+    parse_pool.shutdown(wait=False, cancel_futures=True)
+    sinks.shutdown()
+
+app.mount("/uploads", StaticFiles(directory=STORAGE_DIR), name="uploads")
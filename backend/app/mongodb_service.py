@@ -1,45 +1,144 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, OperationFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+from contextlib import contextmanager
 from datetime import datetime
+import os
+import re
+
+import pyarrow as pa
+
+from connections import connections
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://mongodb:27017/")
+MONGO_INSERT_BATCH = int(os.getenv("MONGO_INSERT_BATCH", "5000"))
+LIST_PROJECTION = {"preview_data": 0, "stats": 0}
+# An unanchored regex cannot use an index, so the substring fallback is a collection scan; it is cut off after this
+MONGO_SCAN_MAX_MS = int(os.getenv("MONGO_SCAN_MAX_MS", "2000"))
+
+def _bson_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Cast the Arrow types BSON cannot encode (dates, times, decimals) to ones it can"""
+    arrays, changed = [], False
+    for field, column in zip(batch.schema, batch.columns):
+        target = (pa.timestamp("ms") if pa.types.is_date(field.type) else pa.string() if pa.types.is_time(field.type)
+                  else pa.float64() if pa.types.is_decimal(field.type) else None)
+        if target is not None: column, changed = column.cast(target), True
+        arrays.append(column)
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names) if changed else batch
 
 class MongoDBService:
-    def __init__(self):
-        self._client = self._collection = None
-        self._connected = False
+    def __init__(self, client=None, uri: str = MONGODB_URI, batch_size: int = MONGO_INSERT_BATCH):
+        # An injected client (e.g. mongomock.MongoClient()) skips the network connection entirely
+        self._client, self._uri, self.batch_size = client, uri, batch_size
+        self._text_index = False
+        self._conn = connections.register("mongodb", self._connect, lambda c: c.database.command("ping").get("ok") == 1, self._close)
+
+    def _connect(self):
+        client = self._client or MongoClient(self._uri, serverSelectionTimeoutMS=2000)
+        client.server_info()  # Test connection
+        collection = client["analytics_db"]["files"]
+        self._create_indexes(collection)
+        print("[OK] Connected to MongoDB (analytics_db.files)")
+        return collection
+
+    def _close(self, collection):
+        if self._client is None: collection.database.client.close()
 
     @property
     def collection(self):
-        if self._collection is None:
-            try:
-                self._client = MongoClient("mongodb://mongodb:27017/", serverSelectionTimeoutMS=2000)
-                self._client.server_info()  # Test connection
-                self._collection = self._client["analytics_db"]["files"]
-                self._connected = True
-                print("[OK] Connected to MongoDB (analytics_db.files)")
-            except Exception as e:
-                print(f"[WARN] MongoDB not available: {e}")
-                self._connected = False
-                self._collection = None
-        return self._collection
+        # None while MongoDB is down; the breaker answers immediately instead of waiting out a server-selection timeout
+        try: return self._conn.get()
+        except Exception: return None
+
+    @contextmanager
+    def _guard(self):
+        try: yield
+        except ConnectionFailure as e:
+            self._conn.mark_down(e); raise
+
+    def _create_indexes(self, collection):
+        collection.create_index([("uploaded_at", DESCENDING), ("_id", DESCENDING)], name="files_recent")
+        try:
+            # language "none" disables stemming and stop words: filenames and column names are identifiers, not prose
+            collection.create_index([("filename", TEXT), ("columns", TEXT)], weights={"filename": 3, "columns": 1},
+                                    default_language="none", name="files_text")
+            self._text_index = True
+        except (OperationFailure, NotImplementedError) as e:
+            print(f"[WARN] MongoDB text index unavailable, search will scan: {e}")
 
     def _fix_ids(self, files):
         return [{**f, "_id": str(f["_id"])} for f in files]
 
-    def save_uploaded_file(self, filename: str, file_type: str, data: dict) -> str:
-        if not self.collection:
-            raise Exception("MongoDB not available")
-        result = self.collection.insert_one({
+    def _insert_rows(self, rows, batches) -> int:
+        """Unordered insert_many in batch_size slices: the server keeps going past a bad document and may apply a batch in parallel"""
+        inserted = 0
+        for batch in batches:
+            batch = _bson_batch(batch)
+            for start in range(0, batch.num_rows, self.batch_size):
+                docs = batch.slice(start, self.batch_size).to_pylist()
+                try: inserted += len(rows.insert_many(docs, ordered=False).inserted_ids)
+                except BulkWriteError as e:
+                    inserted += e.details.get("nInserted", 0)
+                    print(f"[WARN] MongoDB skipped {len(e.details.get('writeErrors', []))} rows: {e.details['writeErrors'][0]['errmsg']}")
+        return inserted
+
+    def save_uploaded_file(self, filename: str, file_type: str, data: dict, batches=None, sqlite_file_id=None) -> str:
+        """Store file metadata plus a 10-row preview; with batches (Arrow record batches) also insert every row into rows_<id>"""
+        collection = self._conn.get()  # raises CircuitOpen while MongoDB is known to be down
+        with self._guard(): return self._save(collection, filename, file_type, data, batches, sqlite_file_id)
+
+    def _save(self, collection, filename, file_type, data, batches, sqlite_file_id) -> str:
+        result = collection.insert_one({
             "filename": filename, "file_type": file_type, "uploaded_at": datetime.now(),
-            "columns": data.get("columns", []), "row_count": data.get("row_count", 0),
-            "preview_data": data.get("preview", [])[:10], "stats": data.get("stats", {})
+            "columns": [str(c) for c in data.get("columns", [])], "row_count": data.get("row_count", 0),
+            "preview_data": data.get("preview", [])[:10], "stats": data.get("stats", {}), "sqlite_file_id": sqlite_file_id
         })
+        if batches is not None:
+            name = f"rows_{result.inserted_id}"
+            inserted = self._insert_rows(collection.database[name], batches)
+            collection.update_one({"_id": result.inserted_id}, {"$set": {"rows_collection": name, "rows_inserted": inserted}})
+            print(f"[OK] Saved {filename} to MongoDB ({inserted} rows in {name})")
         return str(result.inserted_id)
 
-    def get_all_files(self):
-        return self._fix_ids(list(self.collection.find().sort("uploaded_at", -1))) if self.collection else []
+    def get_all_files(self, limit: int = 100, cursor: str = None, include_preview: bool = False):
+        """Newest first, one page at a time; the cursor is '<uploaded_at>|<_id>' of the last file seen. Returns (files, next_cursor)."""
+        collection = self.collection
+        if collection is None: return [], None
+        query = {}
+        if cursor:
+            try:
+                at, oid = cursor.rsplit("|", 1)
+                at, oid = datetime.fromisoformat(at), ObjectId(oid)
+            except (InvalidId, TypeError) as e: raise ValueError(str(e))
+            query = {"$or": [{"uploaded_at": {"$lt": at}}, {"uploaded_at": at, "_id": {"$lt": oid}}]}
+        with self._guard():
+            docs = list(collection.find(query, None if include_preview else LIST_PROJECTION)
+                        .sort([("uploaded_at", DESCENDING), ("_id", DESCENDING)]).limit(limit))
+        next_cursor = f"{docs[-1]['uploaded_at'].isoformat()}|{docs[-1]['_id']}" if len(docs) == limit else None
+        return self._fix_ids(docs), next_cursor
 
-    def search_files(self, keyword: str):
-        if not self.collection: return []
-        q = {"$or": [{"filename": {"$regex": keyword, "$options": "i"}}, {"columns": {"$regex": keyword, "$options": "i"}}]}
-        return self._fix_ids(list(self.collection.find(q)))
+    def search_files(self, keyword: str, limit: int = 50, include_preview: bool = False, substring: bool = False):
+        """Ranked $text search over filename and columns. Partial words need substring=True, which falls back to an
+        escaped case-insensitive regex scan when $text finds nothing; without a text index that scan is the only search."""
+        collection = self.collection
+        if collection is None: return []
+        projection = {} if include_preview else dict(LIST_PROJECTION)
+        if self._text_index:
+            try:
+                with self._guard():
+                    docs = list(collection.find({"$text": {"$search": keyword}}, {**projection, "score": {"$meta": "textScore"}})
+                                .sort([("score", {"$meta": "textScore"}), ("uploaded_at", DESCENDING)]).limit(limit))
+                if docs or not substring: return self._fix_ids(docs)
+            except (OperationFailure, NotImplementedError) as e:
+                print(f"[WARN] MongoDB text search failed: {e}")
+        pattern = {"$regex": re.escape(keyword), "$options": "i"}
+        try:
+            with self._guard():
+                docs = collection.find({"$or": [{"filename": pattern}, {"columns": pattern}]}, projection or None)
+                return self._fix_ids(list(docs.sort([("uploaded_at", DESCENDING), ("_id", DESCENDING)]).limit(limit).max_time_ms(MONGO_SCAN_MAX_MS)))
+        except ExecutionTimeout:
+            print(f"[WARN] MongoDB substring search for {keyword!r} stopped after {MONGO_SCAN_MAX_MS}ms")
+            return []
 
-mongo_service = MongoDBService()
\ No newline at end of file
+mongo_service = MongoDBService()
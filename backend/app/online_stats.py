@@ -0,0 +1,332 @@
+import base64
+import json
+import math
+import zlib
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Iterable
+
+def _pack(values: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')
+
+def _unpack(text: str, dtype) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+class RunningMoments:
+    """Mergeable count/mean/variance/min/max accumulator (chunked Welford, Chan et al. merge)"""
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = math.inf, -math.inf
+
+    @staticmethod
+    def _as_floats(values) -> np.ndarray:
+        if isinstance(values, pd.Series): values = values.to_numpy(dtype='float64', na_value=np.nan)
+        values = np.asarray(values, dtype='float64')
+        return values[~np.isnan(values)]
+
+    def _combine(self, n: int, mean: float, m2: float, lo: float, hi: float):
+        if not n: return
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min, self.max = min(self.min, lo), max(self.max, hi)
+
+    def update(self, values) -> 'RunningMoments':
+        vals = self._as_floats(values)
+        if vals.size:
+            mean = float(vals.mean())
+            self._combine(int(vals.size), mean, float(((vals - mean) ** 2).sum()), float(vals.min()), float(vals.max()))
+        return self
+
+    def merge(self, other: 'RunningMoments') -> 'RunningMoments':
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def to_state(self) -> list:
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'RunningMoments':
+        moments = cls()
+        moments.count, moments.mean, moments.m2, moments.min, moments.max = state
+        return moments
+
+    def to_dict(self) -> Dict[str, float]:
+        if not self.count: return {'mean': math.nan, 'min': math.nan, 'max': math.nan, 'std': math.nan}
+        return {'mean': self.mean, 'min': self.min, 'max': self.max, 'std': self.std}
+
+class ColumnStats:
+    """Per-column RunningMoments for numeric columns; a column that is ever non-numeric is dropped"""
+
+    def __init__(self):
+        self.moments: Dict[str, RunningMoments] = {}
+        self.non_numeric = set()
+
+    def update(self, df: pd.DataFrame) -> 'ColumnStats':
+        for col in df.columns:
+            if col in self.non_numeric: continue
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                # An all-null chunk carries no type information; only real values demote a column
+                if df[col].notna().any(): self.non_numeric.add(col); self.moments.pop(col, None)
+                continue
+            self.moments.setdefault(col, RunningMoments()).update(df[col])
+        return self
+
+    def merge(self, other: 'ColumnStats') -> 'ColumnStats':
+        self.non_numeric |= other.non_numeric
+        for col, moments in other.moments.items():
+            if col not in self.non_numeric: self.moments.setdefault(col, RunningMoments()).merge(moments)
+        for col in self.non_numeric: self.moments.pop(col, None)
+        return self
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {col: m.to_dict() for col, m in self.moments.items()}
+
+    # Columns go into state as [name, value] pairs: JSON object keys would turn integer column names into strings
+    def to_state(self) -> Dict[str, Any]:
+        return {'moments': [[col, m.to_state()] for col, m in self.moments.items()], 'non_numeric': list(self.non_numeric)}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'ColumnStats':
+        stats = cls()
+        stats.moments = {col: RunningMoments.from_state(m) for col, m in state['moments']}
+        stats.non_numeric = set(state['non_numeric'])
+        return stats
+
+class DistinctCounter:
+    """Distinct count over 64-bit value hashes: exact up to EXACT_LIMIT values, HyperLogLog beyond that"""
+    EXACT_LIMIT = 4096
+    _POWERS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+
+    def __init__(self, precision: int = 14):
+        self.p = precision
+        self.exact, self.registers = set(), None
+
+    def _to_registers(self):
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+        if self.exact: self._add(np.fromiter(self.exact, dtype=np.uint64, count=len(self.exact)))
+        self.exact = set()
+
+    def _add(self, hashes: np.ndarray):
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # rank = leading zeros of the remaining bits + 1, found exactly via bit length (no float log2 rounding)
+        rank = 64 - np.searchsorted(self._POWERS, rest, side='right') + 1
+        np.maximum.at(self.registers, idx, np.minimum(rank, 64 - self.p + 1).astype(np.uint8))
+
+    @staticmethod
+    def _canonical(values: pd.Series) -> pd.Series:
+        # Hashes follow the dtype, and a null turns an int chunk into float64; numbers hash as float64 so 1 and 1.0 agree
+        if pd.api.types.is_numeric_dtype(values): return values.astype('float64')
+        if values.dtype != object: return values
+        kind = pd.api.types.infer_dtype(values, skipna=False)
+        if kind in ('integer', 'floating', 'mixed-integer-float', 'boolean'): return values.astype('float64')
+        # Nested JSON cells (lists, objects) cannot be hashed; they count by their key-sorted JSON text
+        if kind.startswith('mixed'):
+            return values.map(lambda v: json.dumps(v, sort_keys=True, default=str) if isinstance(v, (list, dict)) else v)
+        return values
+
+    def update(self, values: pd.Series) -> 'DistinctCounter':
+        values = values.dropna()
+        if values.empty: return self
+        hashes = pd.util.hash_pandas_object(self._canonical(values), index=False).to_numpy(dtype=np.uint64)
+        if self.registers is None:
+            self.exact.update(np.unique(hashes).tolist())
+            if len(self.exact) > self.EXACT_LIMIT: self._to_registers()
+        else: self._add(hashes)
+        return self
+
+    def merge(self, other: 'DistinctCounter') -> 'DistinctCounter':
+        if self.registers is None and other.registers is None:
+            self.exact |= other.exact
+            if len(self.exact) > self.EXACT_LIMIT: self._to_registers()
+            return self
+        if self.registers is None: self._to_registers()
+        if other.registers is None: self._add(np.fromiter(other.exact, dtype=np.uint64, count=len(other.exact)))
+        else: np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_state(self) -> Dict[str, Any]:
+        if self.registers is not None: return {'p': self.p, 'registers': _pack(self.registers)}
+        return {'p': self.p, 'exact': _pack(np.fromiter(self.exact, dtype=np.uint64, count=len(self.exact)))}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'DistinctCounter':
+        counter = cls(state['p'])
+        if 'registers' in state: counter.registers = _unpack(state['registers'], np.uint8)
+        else: counter.exact = set(_unpack(state['exact'], np.uint64).tolist())
+        return counter
+
+    def estimate(self) -> int:
+        if self.registers is None: return len(self.exact)
+        m = float(self.registers.size)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros: raw = m * math.log(m / zeros)
+        return int(round(raw))
+
+class QuantileSketch:
+    """Mergeable quantile sketch built from fixed-size compactors; level h holds items of weight 2**h"""
+
+    def __init__(self, k: int = 1024):
+        self.k, self.count, self._flip = k, 0, 0
+        self.levels = [np.empty(0)]
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if level.size > self.k:
+                level = np.sort(level)
+                keep = level[-1:] if level.size % 2 else level[:0]
+                pairs = level[:level.size - keep.size]
+                # Alternate which half is promoted so the rank error does not drift in one direction
+                self._flip ^= 1
+                if h + 1 == len(self.levels): self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], pairs[self._flip::2]])
+                self.levels[h] = keep
+            h += 1
+
+    def update(self, values) -> 'QuantileSketch':
+        vals = RunningMoments._as_floats(values)
+        if vals.size:
+            self.count += int(vals.size)
+            self.levels[0] = np.concatenate([self.levels[0], vals])
+            self._compress()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels): self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def to_state(self) -> Dict[str, Any]:
+        return {'k': self.k, 'count': self.count, 'flip': self._flip, 'levels': [_pack(level.astype('float64')) for level in self.levels]}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(state['k'])
+        sketch.count, sketch._flip = state['count'], state['flip']
+        sketch.levels = [_unpack(level, np.float64) for level in state['levels']]
+        return sketch
+
+    def quantile(self, q: float) -> float:
+        if not self.count: return math.nan
+        # Nothing compacted yet: the sketch still holds every value, so answer exactly like pandas
+        if len(self.levels) == 1: return float(np.quantile(self.levels[0], q))
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        return float(items[order][min(np.searchsorted(cumulative, q * cumulative[-1]), items.size - 1)])
+
+class DatasetStats:
+    """Everything the upload stats and the summary analysis need, in mergeable form: per-column moments, null counts,
+    distinct-count sketches and quantile sketches. Its serialised state lets an append fold in only the new rows."""
+
+    def __init__(self):
+        self.rows, self.columns = 0, ColumnStats()
+        self.nulls: Dict[Any, int] = {}
+        self.distinct: Dict[Any, DistinctCounter] = {}
+        self.sketches: Dict[Any, QuantileSketch] = {}
+
+    def update(self, df: pd.DataFrame) -> 'DatasetStats':
+        self.rows += len(df)
+        self.columns.update(df)
+        for col, series in df.items():
+            self.nulls[col] = self.nulls.get(col, 0) + int(series.isna().sum())
+            self.distinct.setdefault(col, DistinctCounter()).update(series)
+            # Same columns as DataFrame.describe(): numeric, booleans excluded
+            if col in self.columns.moments and not pd.api.types.is_bool_dtype(series):
+                self.sketches.setdefault(col, QuantileSketch()).update(series)
+        for col in self.columns.non_numeric: self.sketches.pop(col, None)
+        return self
+
+    def merge(self, other: 'DatasetStats') -> 'DatasetStats':
+        self.rows += other.rows
+        self.columns.merge(other.columns)
+        for col, nulls in other.nulls.items(): self.nulls[col] = self.nulls.get(col, 0) + nulls
+        for col, counter in other.distinct.items(): self.distinct.setdefault(col, DistinctCounter()).merge(counter)
+        for col, sketch in other.sketches.items():
+            if col in self.columns.moments: self.sketches.setdefault(col, QuantileSketch()).merge(sketch)
+        for col in self.columns.non_numeric: self.sketches.pop(col, None)
+        return self
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return self.columns.to_dict()
+
+    def summary(self) -> Dict[str, Any]:
+        clean = lambda v: None if isinstance(v, float) and math.isnan(v) else v
+        summary = {}
+        for col, q in self.sketches.items():
+            m = self.columns.moments[col]
+            moments = m.to_dict()
+            summary[col] = {k: clean(v) for k, v in {'count': float(m.count), 'mean': moments['mean'], 'std': m.std, 'min': moments['min'],
+                            '25%': q.quantile(0.25), '50%': q.quantile(0.5), '75%': q.quantile(0.75), 'max': moments['max']}.items()}
+        return {'summary': summary, 'null_counts': dict(self.nulls), 'unique_counts': {col: d.estimate() for col, d in self.distinct.items()}}
+
+    def to_state(self) -> bytes:
+        state = {'rows': self.rows, 'columns': self.columns.to_state(), 'nulls': [[c, n] for c, n in self.nulls.items()],
+                 'distinct': [[c, d.to_state()] for c, d in self.distinct.items()], 'sketches': [[c, q.to_state()] for c, q in self.sketches.items()]}
+        return zlib.compress(json.dumps(state).encode('utf-8'))
+
+    @classmethod
+    def from_state(cls, blob: bytes) -> 'DatasetStats':
+        state = json.loads(zlib.decompress(blob))
+        stats = cls()
+        stats.rows, stats.columns = state['rows'], ColumnStats.from_state(state['columns'])
+        stats.nulls = {c: n for c, n in state['nulls']}
+        stats.distinct = {c: DistinctCounter.from_state(d) for c, d in state['distinct']}
+        stats.sketches = {c: QuantileSketch.from_state(q) for c, q in state['sketches']}
+        return stats
+
+    @classmethod
+    def scan(cls, frames: Iterable[pd.DataFrame]) -> 'DatasetStats':
+        stats = cls()
+        for df in frames: stats.update(df)
+        return stats
+
+class CovarianceAccumulator:
+    """Pairwise-complete sums for a Pearson correlation matrix, accumulated one block of rows at a time"""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.shift = None
+        self.n, self.sx, self.sxx, self.sxy = (np.zeros((k, k)) for _ in range(4))
+
+    def update(self, df: pd.DataFrame) -> 'CovarianceAccumulator':
+        x = df[self.columns].to_numpy(dtype='float64', na_value=np.nan)
+        if not len(x): return self
+        if self.shift is None:
+            # Centre on the first block's means so the sums do not cancel catastrophically later
+            with np.errstate(all='ignore'): self.shift = np.nan_to_num(np.nanmean(x, axis=0))
+        x = x - self.shift
+        present = ~np.isnan(x)
+        x = np.where(present, x, 0.0)
+        m = present.astype('float64')
+        self.n += m.T @ m
+        self.sx += x.T @ m
+        self.sxx += (x * x).T @ m
+        self.sxy += x.T @ x
+        return self
+
+    def correlation(self) -> Dict[str, Dict[str, Any]]:
+        with np.errstate(all='ignore'):
+            n = np.where(self.n > 1, self.n, np.nan)
+            cov = self.sxy - self.sx * self.sx.T / n
+            var = self.sxx - self.sx * self.sx / n
+            corr = np.clip(cov / np.sqrt(var * var.T), -1.0, 1.0)
+        np.fill_diagonal(corr, np.where(np.isnan(np.diag(corr)), np.nan, 1.0))
+        return {a: {b: (None if np.isnan(corr[i, j]) else float(corr[i, j])) for j, b in enumerate(self.columns)} for i, a in enumerate(self.columns)}
@@ -1,5 +1,21 @@
-from opensearchpy import OpenSearch
+from opensearchpy import OpenSearch, helpers, ConnectionError as TransportConnectionError
+from contextlib import contextmanager
 from datetime import datetime
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from connections import connections
+
+OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOST", "http://opensearch:9200")
+BULK_DOCS = int(os.getenv("OPENSEARCH_BULK_DOCS", "1000"))
+BULK_BYTES = int(os.getenv("OPENSEARCH_BULK_MB", "10")) << 20
+BULK_RETRIES = int(os.getenv("OPENSEARCH_BULK_RETRIES", "5"))
+ROWS_PER_DOC = int(os.getenv("OPENSEARCH_ROWS_PER_DOC", "50"))
+# Loads at least this large run with refresh disabled on the rows index; smaller ones keep the normal 1s refresh
+NO_REFRESH_ROWS = int(os.getenv("OPENSEARCH_NO_REFRESH_ROWS", "100000"))
 
 INDEX = "files"
 INDEX_BODY = {
@@ -7,53 +23,129 @@ INDEX_BODY = {
     "mappings": {"properties": {
         "filename": {"type": "text"}, "file_type": {"type": "keyword"},
         "columns": {"type": "keyword"}, "content": {"type": "text"},
-        "uploaded_at": {"type": "date"}
+        "uploaded_at": {"type": "date"}, "sqlite_file_id": {"type": "long"}
+    }}
+}
+ROWS_INDEX = "file_rows"
+ROWS_INDEX_BODY = {
+    "settings": {"index": {"number_of_shards": 1, "number_of_replicas": 0}},
+    "mappings": {"properties": {
+        "file_id": {"type": "keyword"}, "row_start": {"type": "long"},
+        "row_end": {"type": "long"}, "content": {"type": "text"}
     }}
 }
 
+def _row_text(batch: pa.RecordBatch) -> list:
+    """One space-joined string per row, built column-wise in Arrow rather than value by value in Python"""
+    columns = []
+    for column in batch.columns:
+        try: columns.append(pc.fill_null(pc.cast(column, pa.string()), ""))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            columns.append(pa.array(["" if v is None else str(v) for v in column.to_pylist()], type=pa.string()))
+    if not columns: return [""] * batch.num_rows
+    return pc.binary_join_element_wise(*columns, " ").to_pylist()
+
 class OpenSearchService:
-    def __init__(self):
-        self._client = None
-        self._initialized = False
+    def __init__(self, client=None, host: str = OPENSEARCH_HOST):
+        self._client, self._host = client, host
+        self._loads = 0
+        self._refresh_interval = None
+        self._lock = threading.Lock()
+        self._conn = connections.register("opensearch", self._connect, lambda c: c.ping(), lambda c: c.close())
+
+    def _connect(self):
+        client = self._client or OpenSearch(hosts=[self._host], use_ssl=False, verify_certs=False, timeout=2)
+        if not client.ping(): raise Exception("OpenSearch not ready yet")
+        print("[OK] Connected to OpenSearch!")
+        for index, body in ((INDEX, INDEX_BODY), (ROWS_INDEX, ROWS_INDEX_BODY)):
+            if not client.indices.exists(index=index):
+                client.indices.create(index=index, body=body)
+                print(f"[OK] Created OpenSearch index: {index}")
+        return client
 
     @property
     def client(self):
-        if self._client is None:
-            try:
-                self._client = OpenSearch(hosts=['http://opensearch:9200'], use_ssl=False, verify_certs=False, timeout=2)
-                if self._client.ping():
-                    print("[OK] Connected to OpenSearch!")
-                    if not self._initialized:
-                        if not self._client.indices.exists(index=INDEX):
-                            self._client.indices.create(index=INDEX, body=INDEX_BODY)
-                            print(f"[OK] Created OpenSearch index: {INDEX}")
-                        self._initialized = True
-                else:
-                    print("[WARN] OpenSearch not ready yet")
-                    self._client = None
-            except Exception as e:
-                print(f"[WARN] OpenSearch connection error: {e}")
-                self._client = None
-        if self._client is None:
-            raise Exception("OpenSearch not available")
-        return self._client
-
-    def index_file(self, filename, file_type, data):
+        # Raises CircuitOpen straight away while OpenSearch is known to be down
+        return self._conn.get()
+
+    def _failed(self, e: Exception):
+        if isinstance(e, TransportConnectionError): self._conn.mark_down(e)
+        print(f"[ERROR] {e}")
+
+    @contextmanager
+    def _bulk_load(self, rows: int):
+        """Turn refresh off on the rows index for the duration of a large load. Overlapping loads share one
+        switch: the first disables refresh, the last restores the previous interval."""
+        if rows < NO_REFRESH_ROWS:
+            yield; return
+        with self._lock:
+            if self._loads == 0:
+                settings = self.client.indices.get_settings(index=ROWS_INDEX, name="index.refresh_interval")
+                self._refresh_interval = settings.get(ROWS_INDEX, {}).get("settings", {}).get("index", {}).get("refresh_interval")
+                self.client.indices.put_settings(index=ROWS_INDEX, body={"index": {"refresh_interval": "-1"}})
+            self._loads += 1
+        try: yield
+        finally:
+            with self._lock:
+                self._loads -= 1
+                if self._loads == 0:
+                    # None resets the setting to the cluster default when nothing was set explicitly before
+                    self.client.indices.put_settings(index=ROWS_INDEX, body={"index": {"refresh_interval": self._refresh_interval}})
+
+    def _row_actions(self, file_id, batches, rows_per_doc):
+        offset = 0
+        for batch in batches:
+            text = _row_text(batch)
+            for start in range(0, len(text), rows_per_doc):
+                chunk = text[start:start + rows_per_doc]
+                yield {"_index": ROWS_INDEX, "_source": {"file_id": file_id, "row_start": offset + start,
+                                                         "row_end": offset + start + len(chunk) - 1, "content": "\n".join(chunk)}}
+            offset += batch.num_rows
+
+    def index_rows(self, file_id, batches, rows: int = 0, rows_per_doc: int = ROWS_PER_DOC) -> int:
+        """Stream every row into the rows index through the bulk API, rows_per_doc rows per document. Rejected
+        (429) chunks are retried with exponential backoff, so a busy cluster slows the load down instead of failing it."""
+        failed = 0
+        with self._bulk_load(rows):
+            for ok, info in helpers.streaming_bulk(self.client, self._row_actions(file_id, batches, rows_per_doc), chunk_size=BULK_DOCS,
+                                                   max_chunk_bytes=BULK_BYTES, max_retries=BULK_RETRIES, initial_backoff=1, max_backoff=30,
+                                                   raise_on_error=False, yield_ok=False):
+                failed += 1
+                if failed == 1: print(f"[WARN] OpenSearch rejected row documents: {info}")
+        return failed
+
+    def index_file(self, filename, file_type, data, batches=None, sqlite_file_id=None):
         try:
             content = " ".join(" ".join(str(v) for v in row.values()) for row in data.get('preview', [])[:5])
-            r = self.client.index(index=INDEX, body={'filename': filename, 'file_type': file_type, 'columns': data.get('columns', []), 'content': content, 'uploaded_at': datetime.now()}, refresh=True)
+            r = self.client.index(index=INDEX, body={'filename': filename, 'file_type': file_type, 'columns': data.get('columns', []), 'content': content, 'uploaded_at': datetime.now(), 'sqlite_file_id': sqlite_file_id})
             print(f"[OK] Indexed {filename} in OpenSearch (ID: {r['_id']})")
+            if batches is not None:
+                failed = self.index_rows(r['_id'], batches, data.get('row_count', 0))
+                print(f"[OK] Bulk-indexed {data.get('row_count', 0)} rows of {filename} ({failed} documents rejected)")
             return r['_id']
-        except Exception as e: print(f"[ERROR] {e}"); return None
+        except Exception as e: self._failed(e); return None
 
-    def search_files(self, query):
+    def search_files(self, query, limit: int = 50):
         try:
-            r = self.client.search(index=INDEX, size=50, body={"query": {"multi_match": {"query": query, "fields": ["filename^3", "content", "columns"], "fuzziness": "AUTO"}}})
-            return [{**hit['_source'], 'score': hit['_score'], 'id': hit['_id']} for hit in r['hits']['hits']]
-        except Exception as e: print(f"[ERROR] {e}"); return []
+            multi_match = {"multi_match": {"query": query, "fields": ["filename^3", "content", "columns"], "fuzziness": "AUTO"}}
+            r = self.client.search(index=INDEX, size=limit, body={"query": multi_match})
+            results = {hit['_id']: {**hit['_source'], 'score': hit['_score'], 'id': hit['_id']} for hit in r['hits']['hits']}
+            # Files whose match is past the preview: best row chunk per file, then the file documents themselves
+            rows = self.client.search(index=ROWS_INDEX, size=limit, body={"query": {"match": {"content": {"query": query, "fuzziness": "AUTO"}}},
+                                      "collapse": {"field": "file_id"}, "_source": ["file_id", "row_start", "row_end"]})
+            hits = {h['_source']['file_id']: h for h in rows['hits']['hits']}
+            missing = [fid for fid in hits if fid not in results]
+            if missing:
+                for doc in self.client.mget(index=INDEX, body={"ids": missing})['docs']:
+                    if doc.get('found'): results[doc['_id']] = {**doc['_source'], 'score': hits[doc['_id']]['_score'], 'id': doc['_id']}
+            for fid, hit in hits.items():
+                if fid in results: results[fid]['matched_rows'] = [hit['_source']['row_start'], hit['_source']['row_end']]
+            return sorted(results.values(), key=lambda f: f['score'], reverse=True)[:limit]
+        except Exception as e: self._failed(e); return []
 
     def get_stats(self):
-        try: return {"indexed_files": self.client.count(index=INDEX)['count'], "total_size_bytes": self.client.indices.stats(index=INDEX)['_all']['total']['store']['size_in_bytes']}
+        try: return {"indexed_files": self.client.count(index=INDEX)['count'], "indexed_row_documents": self.client.count(index=ROWS_INDEX)['count'],
+                     "total_size_bytes": self.client.indices.stats(index=f"{INDEX},{ROWS_INDEX}")['_all']['total']['store']['size_in_bytes']}
         except Exception as e: return {"error": str(e)}
 
-opensearch = OpenSearchService()
\ No newline at end of file
+opensearch = OpenSearchService()
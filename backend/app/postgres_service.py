@@ -1,86 +1,252 @@
+from contextlib import contextmanager
 from datetime import datetime
+import io
+import itertools
 import json
+import math
+import os
+import re
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from connections import connections
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+COPY_READ_BYTES = 1 << 20
+FILE_COLUMNS = "id, filename, file_type, column_names, row_count, uploaded_at, sqlite_file_id"
+SEARCH_VECTOR_FUNCTION = """
+    CREATE OR REPLACE FUNCTION uploaded_files_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.filename, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') ||
+            setweight(to_tsvector('simple', regexp_replace(coalesce(array_to_string(NEW.column_names, ' '), ''), '[^[:alnum:]]+', ' ', 'g')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.file_type, '')), 'C');
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql
+"""
+
+def _is_nested(arrow_type) -> bool:
+    return pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type) or pa.types.is_struct(arrow_type) or pa.types.is_map(arrow_type)
+
+def _json_safe(value):
+    # JSONB has no NaN or Infinity; json.dumps would write them anyway
+    if isinstance(value, float): return value if math.isfinite(value) else None
+    if isinstance(value, dict): return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)): return [_json_safe(v) for v in value]
+    return value
+
+def _csv_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Nested columns (lists, structs, maps, e.g. from JSON uploads) as JSON text, which the CSV writer cannot render itself"""
+    if not any(_is_nested(f.type) for f in batch.schema): return batch
+    arrays = [pa.array([None if v is None else json.dumps(_json_safe(v), default=str) for v in column.to_pylist()], type=pa.string())
+              if _is_nested(field.type) else column for field, column in zip(batch.schema, batch.columns)]
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+def _pg_type(arrow_type) -> str:
+    if _is_nested(arrow_type): return "JSONB"
+    if pa.types.is_boolean(arrow_type): return "BOOLEAN"
+    if pa.types.is_integer(arrow_type): return "BIGINT"
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type): return "DOUBLE PRECISION"
+    if pa.types.is_timestamp(arrow_type): return "TIMESTAMP"
+    if pa.types.is_date(arrow_type): return "DATE"
+    return "TEXT"
+
+class _CsvStream:
+    """File-like object rendering Arrow batches to CSV on demand, so COPY FROM STDIN never holds more than one batch"""
+
+    def __init__(self, batches):
+        self._batches = iter(batches)
+        self._buf, self._pos = b"", 0
+        self.rows = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self._pos >= len(self._buf):
+            batch = next(self._batches, None)
+            if batch is None: return b""
+            sink = io.BytesIO()
+            pacsv.write_csv(_csv_batch(batch), sink, pacsv.WriteOptions(include_header=False))
+            self._buf, self._pos = sink.getvalue(), 0
+            self.rows += batch.num_rows
+        end = len(self._buf) if size is None or size < 0 else self._pos + size
+        chunk = self._buf[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    readline = read
 
 class PostgresService:
     def __init__(self):
-        self._conn = self._cursor = None
-        self._initialized = False
+        self._trigram = False
+        self._conn = connections.register("postgresql", self._connect, self._ping, lambda pool: pool.closeall())
+
+    def _connect(self):
+        from psycopg2.pool import ThreadedConnectionPool
+        pool = ThreadedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, host="postgres", database="analytics_db",
+            user="admin", password="password123", port="5432", connect_timeout=2)
+        try: self._create_table(pool)
+        except Exception: pool.closeall(); raise
+        print("[OK] Connected to PostgreSQL!")
+        return pool
 
     @property
-    def conn(self):
-        if self._conn is None:
+    def pool(self):
+        # Raises CircuitOpen straight away while PostgreSQL is known to be down
+        return self._conn.get()
+
+    @contextmanager
+    def cursor(self):
+        """Borrow a pooled connection for one unit of work; commit on success, roll back on error"""
+        pool = self.pool
+        conn = pool.getconn()
+        lost = None
+        try:
+            with conn.cursor() as cur: yield cur
+            conn.commit()
+        except Exception as e:
+            # A closed connection means the server went away, not that the statement was bad
+            if conn.closed: lost = e
+            else: conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+            if lost is not None: self._conn.mark_down(lost)
+
+    def _create_table(self, pool):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS uploaded_files (
+                        id SERIAL PRIMARY KEY, filename VARCHAR(255) NOT NULL,
+                        file_type VARCHAR(50) NOT NULL, columns TEXT,
+                        row_count INTEGER, uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cur.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS preview_data JSONB")
+                cur.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS rows_table VARCHAR(63)")
+                cur.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS column_names TEXT[]")
+                cur.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS search_vector tsvector")
+                cur.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS sqlite_file_id INTEGER")
+                cur.execute(SEARCH_VECTOR_FUNCTION)
+                cur.execute("DROP TRIGGER IF EXISTS uploaded_files_search_vector ON uploaded_files")
+                cur.execute("CREATE TRIGGER uploaded_files_search_vector BEFORE INSERT OR UPDATE OF filename, file_type, column_names ON uploaded_files "
+                            "FOR EACH ROW EXECUTE FUNCTION uploaded_files_search_vector()")
+                # Backfill rows written before the array column and trigger existed
+                cur.execute("UPDATE uploaded_files SET column_names = COALESCE(string_to_array(columns, ','), '{}') WHERE column_names IS NULL OR search_vector IS NULL")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_uploaded_files_search ON uploaded_files USING GIN (search_vector)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_uploaded_files_recent ON uploaded_files (uploaded_at DESC, id DESC)")
+            conn.commit()
             try:
-                import psycopg2
-                self._conn = psycopg2.connect(host="postgres", database="analytics_db",
-                    user="admin", password="password123", port="5432", connect_timeout=2)
-                self._cursor = self._conn.cursor()
-                if not self._initialized:
-                    self._create_table()
-                    self._initialized = True
-                    print("[OK] Connected to PostgreSQL!")
-            except ImportError:
-                print("[WARN] psycopg2 not installed")
-                self._conn = None
+                # pg_trgm makes the substring (ILIKE) fallback index-backed; it needs CREATE privilege, so it stays optional
+                with conn.cursor() as cur:
+                    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_uploaded_files_filename_trgm ON uploaded_files USING GIN (filename gin_trgm_ops)")
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_uploaded_files_columns_trgm ON uploaded_files USING GIN (columns gin_trgm_ops)")
+                conn.commit()
+                self._trigram = True
             except Exception as e:
-                print(f"[WARN] PostgreSQL connection error: {e}")
-                self._conn = None
-        if self._conn is None:
-            raise Exception("PostgreSQL not available")
-        return self._conn
+                conn.rollback()
+                print(f"[WARN] pg_trgm unavailable, substring search will scan: {e}")
+        finally:
+            pool.putconn(conn)
 
-    @property
-    def cursor(self):
-        if self._cursor is None: _ = self.conn
-        return self._cursor
-
-    def _create_table(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS uploaded_files (
-                id SERIAL PRIMARY KEY, filename VARCHAR(255) NOT NULL,
-                file_type VARCHAR(50) NOT NULL, columns TEXT,
-                row_count INTEGER, uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        self.cursor.execute("ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS preview_data JSONB")
-        self.conn.commit()
-
-    def _row_to_dict(self, row):
-        preview = json.loads(row[6]) if isinstance(row[6], str) else (row[6] or [])
-        return {'id': row[0], 'filename': row[1], 'file_type': row[2],
-                'columns': row[3].split(',') if row[3] else [],
-                'row_count': row[4], 'uploaded_at': row[5], 'preview_data': preview}
+    def _ping(self, pool) -> bool:
+        from psycopg2.pool import PoolError
+        try: conn = pool.getconn()
+        except PoolError:
+            # Every connection checked out (e.g. concurrent COPY loads) means busy, not down; tripping the breaker would
+            # close the pool under those loads. A server that really went away fails them, and they mark it down.
+            if pool.closed: raise
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                return cur.fetchone()[0] == 1
+        finally:
+            if not conn.closed: conn.rollback()
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def _row_to_dict(self, row, include_preview=True):
+        record = {'id': row[0], 'filename': row[1], 'file_type': row[2], 'columns': list(row[3] or []),
+                  'row_count': row[4], 'uploaded_at': row[5], 'sqlite_file_id': row[6]}
+        if include_preview: record['preview_data'] = json.loads(row[7]) if isinstance(row[7], str) else (row[7] or [])
+        return record
 
     def _query(self, sql, params=()):
-        try: self.cursor.execute(sql, params); return [self._row_to_dict(r) for r in self.cursor.fetchall()]
+        try:
+            with self.cursor() as cur:
+                cur.execute(sql, params)
+                return [self._row_to_dict(r) for r in cur.fetchall()]
         except Exception as e: print(f"[ERROR] PostgreSQL error: {e}"); return []
 
-    def save_file(self, filename, file_type, data):
+    def _copy_rows(self, cur, file_id, batches) -> int:
+        """Create dataset_<id> from the first batch's schema and stream every batch into it with COPY"""
+        from psycopg2 import sql
+        batches = iter(batches)
+        first = next(batches, None)
+        if first is None: return 0
+        table = f"dataset_{file_id}"
+        cols = sql.SQL(", ").join(sql.SQL("{} {}").format(sql.Identifier(f.name), sql.SQL(_pg_type(f.type))) for f in first.schema)
+        cur.execute(sql.SQL("CREATE TABLE {} ({})").format(sql.Identifier(table), cols))
+        stream = _CsvStream(itertools.chain([first], batches))
+        cur.copy_expert(sql.SQL("COPY {} FROM STDIN WITH (FORMAT csv)").format(sql.Identifier(table)).as_string(cur), stream, size=COPY_READ_BYTES)
+        cur.execute("UPDATE uploaded_files SET rows_table = %s WHERE id = %s", (table, file_id))
+        return stream.rows
+
+    def save_file(self, filename, file_type, data, batches=None, sqlite_file_id=None):
+        """Store file metadata plus a 10-row preview; with batches (Arrow record batches) also bulk-load every row"""
         try:
             preview = data.get('preview', [])[:10]
-            self.cursor.execute(
-                "INSERT INTO uploaded_files (filename, file_type, columns, row_count, uploaded_at, preview_data) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
-                (filename, file_type, ",".join(data.get('columns', [])), data.get('row_count', 0),
-                 datetime.now(), json.dumps(preview) or None))
-            file_id = self.cursor.fetchone()[0]
-            self.conn.commit()
-            print(f"[OK] Saved {filename} to PostgreSQL (ID: {file_id})")
+            with self.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO uploaded_files (filename, file_type, columns, column_names, row_count, uploaded_at, preview_data, sqlite_file_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+                    (filename, file_type, ",".join(data.get('columns', [])), [str(c) for c in data.get('columns', [])], data.get('row_count', 0),
+                     datetime.now(), json.dumps(preview) or None, sqlite_file_id))
+                file_id = cur.fetchone()[0]
+                copied = self._copy_rows(cur, file_id, batches) if batches is not None else 0
+            print(f"[OK] Saved {filename} to PostgreSQL (ID: {file_id}, {copied} rows copied)")
             return file_id
         except Exception as e:
-            print(f"[ERROR] PostgreSQL error: {e}"); self.conn.rollback(); return None
+            print(f"[ERROR] PostgreSQL error: {e}"); return None
 
     def get_all_files(self):
-        return self._query("SELECT id, filename, file_type, columns, row_count, uploaded_at, preview_data FROM uploaded_files ORDER BY uploaded_at DESC")
+        return self._query(f"SELECT {FILE_COLUMNS}, preview_data FROM uploaded_files ORDER BY uploaded_at DESC, id DESC")
 
-    def search_files(self, keyword):
-        p = f"%{keyword}%"
-        return self._query("SELECT id, filename, file_type, columns, row_count, uploaded_at, preview_data FROM uploaded_files WHERE filename ILIKE %s OR file_type ILIKE %s OR columns ILIKE %s ORDER BY uploaded_at DESC", (p, p, p))
+    def search_files(self, keyword, limit=50, cursor=None, include_preview=False):
+        """Ranked search: prefix full-text match on the maintained search_vector, plus trigram-indexed substring
+        matches on filename/columns. Pages with a (score, id) keyset cursor; returns (files, next_cursor)."""
+        terms = re.findall(r"[^\W_]+", keyword.lower())
+        # Wildcards typed by the user match literally, as in DataStore.search_files
+        like = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        params = {'tsq': " & ".join(f"{t}:*" for t in terms), 'like': like, 'kw': keyword, 'limit': limit}
+        substring = "filename ILIKE %(like)s ESCAPE '\\' OR columns ILIKE %(like)s ESCAPE '\\'"
+        match = f"(search_vector @@ to_tsquery('simple', %(tsq)s) OR {substring})" if terms else f"({substring})"
+        rank = "ts_rank(search_vector, to_tsquery('simple', %(tsq)s))" if terms else "0"
+        score = f"({rank} + similarity(filename, %(kw)s))::float8" if self._trigram else f"({rank})::float8"
+        after = ""
+        if cursor:
+            after_score, after_id = cursor.rsplit(":", 1)
+            params.update(after_score=float(after_score), after_id=int(after_id))
+            after = "WHERE (score, id) < (%(after_score)s, %(after_id)s)"
+        sql = (f"SELECT * FROM (SELECT {FILE_COLUMNS}, {'preview_data' if include_preview else 'NULL'}, {score} AS score "
+               f"FROM uploaded_files WHERE {match}) hits {after} ORDER BY score DESC, id DESC LIMIT %(limit)s")
+        try:
+            with self.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+        except Exception as e: print(f"[ERROR] PostgreSQL error: {e}"); return [], None
+        files = [{**self._row_to_dict(r, include_preview), 'score': r[8]} for r in rows]
+        return files, (f"{rows[-1][8]!r}:{rows[-1][0]}" if len(rows) == limit else None)
 
     def get_stats(self):
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM uploaded_files")
-            total = self.cursor.fetchone()[0]
-            self.cursor.execute("SELECT file_type, COUNT(*) FROM uploaded_files GROUP BY file_type")
-            return {"total_files": total, "by_type": {r[0]: r[1] for r in self.cursor.fetchall()}}
+            with self.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM uploaded_files")
+                total = cur.fetchone()[0]
+                cur.execute("SELECT file_type, COUNT(*) FROM uploaded_files GROUP BY file_type")
+                return {"total_files": total, "by_type": {r[0]: r[1] for r in cur.fetchall()}}
         except Exception as e: print(f"[ERROR] PostgreSQL error: {e}"); return {"total_files": 0, "by_type": {}}
 
-postgres = PostgresService()
\ No newline at end of file
+postgres = PostgresService()
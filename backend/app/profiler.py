@@ -0,0 +1,49 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+MAX_SECONDS = 60
+# Leaf frames of threads parked on a lock, queue or selector; dropped unless idle samples are asked for
+IDLE_FRAMES = {('threading.py', 'wait'), ('selectors.py', 'select'), ('thread.py', '_worker'), ('queue.py', 'get'),
+               ('base_events.py', '_run_once'), ('connection.py', 'wait'), ('process.py', '_wait_for_work')}
+
+class ProfilerBusy(Exception):
+    """Another capture is already running; samples from two at once would distort each other"""
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # ';' separates frames in the collapsed format; the count is whatever follows the last space, as py-spy writes it
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+class SamplingProfiler:
+    """Wall-clock sampler over every thread of this process: interval-spaced snapshots of sys._current_frames(),
+    folded into Brendan Gregg's collapsed-stack format that flamegraph.pl, speedscope and inferno read.
+
+    Only the API process is visible; parsing done in the worker process pool shows up as the thread waiting on it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def capture(self, seconds: float, interval: float = 0.01, idle: bool = False) -> str:
+        if not self._lock.acquire(blocking=False): raise ProfilerBusy("A profile is already being captured")
+        try:
+            stacks, me, names = Counter(), threading.get_ident(), {}
+            deadline = time.perf_counter() + min(seconds, MAX_SECONDS)
+            while time.perf_counter() < deadline:
+                for t in threading.enumerate(): names.setdefault(t.ident, t.name)
+                for ident, frame in sys._current_frames().items():
+                    if ident == me: continue
+                    if not idle and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES: continue
+                    labels = []
+                    while frame is not None: labels.append(_frame_label(frame)); frame = frame.f_back
+                    labels.append(names.get(ident, f"thread-{ident}").replace(';', ':'))
+                    stacks[';'.join(reversed(labels))] += 1
+                time.sleep(interval)
+            return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally: self._lock.release()
+
+profiler = SamplingProfiler()
@@ -0,0 +1,236 @@
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Any, List, Tuple
+
+MAX_POINTS = 20000
+MAX_RESULT_ROWS = 10000
+BUCKET_UNITS = {'s': 'second', 'min': 'minute', 'h': 'hour', 'd': 'day', 'w': 'week', 'mo': 'month', 'q': 'quarter', 'y': 'year'}
+BUCKET_PATTERN = re.compile(r'^(\d*)\s*(s|min|h|d|w|mo|q|y)$')
+# Public name -> Arrow hash aggregate; 'count' without a column counts rows
+AGGREGATES = {'count': 'count', 'sum': 'sum', 'mean': 'mean', 'min': 'min', 'max': 'max', 'std': 'stddev',
+              'var': 'variance', 'distinct': 'count_distinct', 'median': 'approximate_median'}
+COMPARISONS = {'eq': pc.equal, 'ne': pc.not_equal, 'lt': pc.less, 'le': pc.less_equal, 'gt': pc.greater, 'ge': pc.greater_equal}
+FILTER_OPS = (*COMPARISONS, 'in', 'not_in', 'between', 'contains', 'starts_with', 'is_null', 'not_null')
+DOWNSAMPLERS = ('lttb', 'minmax')
+
+class QueryError(ValueError):
+    """The query asks for something the dataset cannot answer: unknown columns, operators or mismatched values"""
+
+def _column_list(value, name: str) -> List[str]:
+    if value is None: return []
+    if isinstance(value, str): return [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value): raise QueryError(f"'{name}' must be a column name or a list of them")
+    return value
+
+def parse_bucket(bucket: str):
+    """'15min' -> (15, 'minute'); a bare unit means one of it"""
+    match = BUCKET_PATTERN.match(str(bucket).strip().lower())
+    if not match or match.group(1) == '0': raise QueryError(f"Bad bucket {bucket!r}; use e.g. 30s, 15min, 1h, 1d, 1w, 1mo, 1q or 1y")
+    return int(match.group(1) or 1), BUCKET_UNITS[match.group(2)]
+
+class Query:
+    """Validated form of a query request:
+
+        filters     [{"column", "op", "value"}], all of which must hold
+        group_by    columns to group on
+        time_column, bucket   timestamp column floored to buckets such as "15min" and grouped on
+        aggregates  [{"fn", "column"}]; rows are counted when grouping without any
+        x, y, downsample, points   reduce an (x, y) series to about `points` rows with "lttb" or "minmax"
+        columns, limit   columns and row cap of an ungrouped, undownsampled result
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        if not isinstance(spec, dict): raise QueryError("Query must be a JSON object")
+        unknown = set(spec) - {'filters', 'group_by', 'time_column', 'bucket', 'aggregates', 'x', 'y', 'downsample', 'points', 'columns', 'limit'}
+        if unknown: raise QueryError(f"Unknown query fields: {', '.join(sorted(unknown))}")
+        self.filters = spec.get('filters') or []
+        if not isinstance(self.filters, list): raise QueryError("'filters' must be a list")
+        for f in self.filters:
+            if not isinstance(f, dict) or not isinstance(f.get('column'), str): raise QueryError("Each filter needs a 'column'")
+            if f.get('op', 'eq') not in FILTER_OPS: raise QueryError(f"Unknown filter op {f.get('op')!r}; use one of {', '.join(FILTER_OPS)}")
+        self.group_by = _column_list(spec.get('group_by'), 'group_by')
+        self.time_column, self.bucket = spec.get('time_column'), spec.get('bucket')
+        if self.bucket is not None and not self.time_column: raise QueryError("'bucket' needs a 'time_column'")
+        self.bucket = parse_bucket(self.bucket) if self.bucket is not None else None
+        self.aggregates = []
+        for a in spec.get('aggregates') or []:
+            if not isinstance(a, dict) or a.get('fn') not in AGGREGATES: raise QueryError(f"Aggregate fn must be one of {', '.join(AGGREGATES)}")
+            if a['fn'] != 'count' and not isinstance(a.get('column'), str): raise QueryError(f"Aggregate '{a['fn']}' needs a 'column'")
+            self.aggregates.append((a.get('column'), a['fn']))
+        self.grouped = bool(self.group_by or self.bucket or self.aggregates)
+        if self.grouped and not self.aggregates: self.aggregates = [(None, 'count')]
+        self.downsample = spec.get('downsample')
+        if self.downsample is not None and self.downsample not in DOWNSAMPLERS: raise QueryError(f"'downsample' must be one of {', '.join(DOWNSAMPLERS)}")
+        self.x = spec.get('x') or (self.time_column if self.grouped else None)
+        self.y = _column_list(spec.get('y'), 'y')
+        if self.downsample and not (self.x and self.y): raise QueryError("Downsampling needs 'x' and 'y'")
+        self.points = spec.get('points', 2000)
+        if not isinstance(self.points, int) or not 3 <= self.points <= MAX_POINTS: raise QueryError(f"'points' must be between 3 and {MAX_POINTS}")
+        self.columns = _column_list(spec.get('columns'), 'columns')
+        # A projection keeps the series it is sorted or downsampled on, even when only other columns were named
+        if self.columns and not self.grouped: self.columns = list(dict.fromkeys([*self.columns, *([self.x] if self.x else []), *self.y]))
+        self.limit = spec.get('limit', MAX_RESULT_ROWS)
+        if not isinstance(self.limit, int) or not 1 <= self.limit <= MAX_RESULT_ROWS: raise QueryError(f"'limit' must be between 1 and {MAX_RESULT_ROWS}")
+
+    def source_columns(self, available: List[str]) -> List[str]:
+        """Columns the query reads from the dataset, so nothing else is materialised"""
+        if self.grouped: wanted = [*self.group_by, *([self.time_column] if self.time_column else []), *(c for c, _ in self.aggregates if c)]
+        else: wanted = [*(self.columns or available), *([self.x] if self.x else []), *self.y]
+        wanted += [f['column'] for f in self.filters]
+        missing = [c for c in dict.fromkeys(wanted) if c not in available]
+        if missing: raise QueryError(f"Unknown columns: {', '.join(missing)}")
+        return list(dict.fromkeys(wanted))
+
+def _decoded(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Compact uploads store text as dictionaries whose chunks may not share one; plain values compare and group simply
+    return column.cast(column.type.value_type) if pa.types.is_dictionary(column.type) else column
+
+def as_timestamps(column: pa.ChunkedArray, name: str) -> pa.ChunkedArray:
+    """Timestamp view of a column: temporal types as they are, ISO text through Arrow, anything else through pandas"""
+    if pa.types.is_timestamp(column.type): return column
+    if pa.types.is_date(column.type): return column.cast(pa.timestamp('s'))
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        try: return column.cast(pa.timestamp('ns'))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError): pass
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type): raise QueryError(f"Column '{name}' holds numbers, not times")
+    parsed = pd.to_datetime(column.to_pandas(), errors='coerce', format='mixed')
+    if parsed.notna().sum() == 0 and column.null_count < len(column): raise QueryError(f"Column '{name}' holds no recognisable times")
+    return pa.chunked_array([pa.array(parsed, type=pa.timestamp('ns'))])
+
+def _scalar(value, column: pa.ChunkedArray, name: str):
+    try: return pa.scalar(value).cast(column.type) if value is not None else None
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        raise QueryError(f"Value {value!r} does not fit column '{name}' ({column.type})")
+
+def _mask(table: pa.Table, f: Dict[str, Any]):
+    name, op, value = f['column'], f.get('op', 'eq'), f.get('value')
+    column = table.column(name)
+    if op == 'is_null': return pc.is_null(column, nan_is_null=True)
+    if op == 'not_null': return pc.invert(pc.is_null(column, nan_is_null=True))
+    if op in ('contains', 'starts_with'):
+        if not isinstance(value, str): raise QueryError(f"'{op}' needs a text value")
+        text = column if pa.types.is_string(column.type) else column.cast(pa.string())
+        return pc.match_substring(text, value) if op == 'contains' else pc.starts_with(text, value)
+    if op in ('in', 'not_in', 'between'):
+        if not isinstance(value, list) or (op == 'between' and len(value) != 2): raise QueryError(f"'{op}' needs a list value" + (" of [low, high]" if op == 'between' else ""))
+        values = [_scalar(v, column, name) for v in value]
+        if op == 'between': return pc.and_(pc.greater_equal(column, values[0]), pc.less_equal(column, values[1]))
+        found = pc.is_in(column, value_set=pa.array([v.as_py() for v in values if v is not None], type=column.type))
+        return found if op == 'in' else pc.invert(found)
+    if value is None: raise QueryError(f"'{op}' needs a value; use is_null / not_null for missing ones")
+    return COMPARISONS[op](column, _scalar(value, column, name))
+
+def filter_table(table: pa.Table, filters: List[Dict[str, Any]]) -> pa.Table:
+    mask = None
+    for f in filters:
+        m = _mask(table, f)
+        mask = m if mask is None else pc.and_(mask, m)
+    # Nulls in the mask (comparisons against missing values) drop the row, as SQL would
+    return table if mask is None else table.filter(mask, null_selection_behavior='drop')
+
+def aggregate_table(table: pa.Table, query: Query) -> pa.Table:
+    keys = list(query.group_by)
+    if query.bucket:
+        multiple, unit = query.bucket
+        stamps = pc.floor_temporal(as_timestamps(table.column(query.time_column), query.time_column), multiple=multiple, unit=unit)
+        table = table.set_column(table.schema.get_field_index(query.time_column), query.time_column, stamps)
+        if query.time_column not in keys: keys.insert(0, query.time_column)
+    if not keys:
+        # Whole-table aggregates: group on a constant so the same kernels apply
+        table, keys = table.append_column('__all', pa.array(np.zeros(table.num_rows, dtype='int8'))), ['__all']
+    specs, outputs = [], {}
+    for column, fn in query.aggregates:
+        spec = ([], 'count_all') if column is None else (column, AGGREGATES[fn])
+        specs.append(spec)
+        # Arrow names outputs <column>_<kernel>; expose them as <column>_<fn>
+        outputs['count' if column is None else f"{column}_{fn}"] = 'count_all' if column is None else f"{column}_{spec[1]}"
+    arrow_errors = (pa.ArrowNotImplementedError, pa.ArrowInvalid, pa.ArrowTypeError)
+    try: result = table.group_by(keys).aggregate(specs)
+    except arrow_errors as e:
+        # e.g. a mean or median over a text column, which Arrow has no kernel for; kernels resolve on types, so trying
+        # each aggregate on no rows finds the one to name
+        for spec, (column, fn) in zip(specs, query.aggregates):
+            try: table.slice(0, 0).group_by(keys).aggregate([spec])
+            except arrow_errors: raise QueryError(f"Aggregate '{fn}' does not apply to column '{column}' ({table.schema.field(column).type})")
+        raise QueryError(f"Cannot aggregate: {e}")
+    if keys == ['__all']:
+        if result.num_rows == 0: return pa.table({name: [0 if kernel == 'count_all' else None] for name, kernel in outputs.items()})
+        return pa.table({name: result.column(kernel) for name, kernel in outputs.items()})
+    result = pa.table({**{k: result.column(k) for k in keys}, **{name: result.column(kernel) for name, kernel in outputs.items()}})
+    return result.sort_by([(k, 'ascending') for k in keys])
+
+def _numeric(column: pa.ChunkedArray, name: str) -> np.ndarray:
+    if pa.types.is_timestamp(column.type) or pa.types.is_date(column.type): column = column.cast(pa.timestamp('ns')).cast(pa.int64())
+    elif not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type) or pa.types.is_decimal(column.type)):
+        raise QueryError(f"Column '{name}' is not numeric or temporal and cannot be downsampled")
+    # Through float64 (nanosecond stamps lose a few digits, harmless for picking points), so missing values come out as NaN
+    return column.cast(pa.float64(), safe=False).to_numpy()
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets over points sorted by x: indices of the kept points, first and last included.
+    Each bucket keeps the point spanning the largest triangle with the previous pick and the next bucket's mean."""
+    n = len(x)
+    if points >= n: return np.arange(n)
+    edges = (np.arange(points - 1) * (n - 2) / (points - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    picked = np.empty(points, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        if nhi <= nlo: nlo, nhi = n - 1, n
+        mx, my = (cx[nhi] - cx[nlo]) / (nhi - nlo), (cy[nhi] - cy[nlo]) / (nhi - nlo)
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - mx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (my - ay))
+        a = picked[i + 1] = lo + int(np.argmax(area))
+    return picked
+
+def minmax(y: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the lowest and highest value in each of points // 2 equal-count buckets, in order"""
+    n = len(y)
+    if points >= n: return np.arange(n)
+    buckets = pd.Series(y).groupby(np.arange(n) * (points // 2) // n)
+    return np.unique(np.concatenate((buckets.idxmin().to_numpy(), buckets.idxmax().to_numpy())))
+
+def downsample_table(table: pa.Table, query: Query) -> pa.Table:
+    """Sort by x, then keep the union of each y series' selected points; rows missing x or that y are skipped for it"""
+    for name in (query.x, *query.y):
+        if name not in table.column_names: raise QueryError(f"Unknown column '{name}' in the result")
+    x = table.column(query.x)
+    # Text x axes are usually times written out (CSV uploads keep them as strings)
+    if pa.types.is_string(x.type) or pa.types.is_large_string(x.type): x = as_timestamps(x, query.x)
+    x = _numeric(x, query.x)
+    order = np.argsort(x, kind='stable') if len(x) > 1 and np.any(np.diff(x) < 0) else None
+    if order is not None: table, x = table.take(order), x[order]
+    keep = []
+    for name in query.y:
+        y = _numeric(table.column(name), name)
+        valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        chosen = lttb(x[valid], y[valid], query.points) if query.downsample == 'lttb' else minmax(y[valid], query.points)
+        keep.append(valid[chosen])
+    return table.take(np.unique(np.concatenate(keep))) if keep else table.slice(0, 0)
+
+def run_query(table: pa.Table, spec: Dict[str, Any]) -> Tuple[Dict[str, Any], pa.Table]:
+    """Filter, group/bucket and aggregate, then downsample or cap the result; returns row counts at each step and the
+    result table, left for the caller to turn into records"""
+    query = Query(spec)
+    table = table.select(query.source_columns(table.column_names))
+    table = pa.table({name: _decoded(table.column(name)) for name in table.column_names})
+    source_rows = table.num_rows
+    table = filter_table(table, query.filters)
+    matched = table.num_rows
+    if query.grouped: table = aggregate_table(table, query)
+    elif query.columns: table = table.select(query.columns)
+    result_rows = table.num_rows
+    if query.downsample: table = downsample_table(table, query)
+    elif query.x and not query.grouped: table = table.sort_by(query.x)
+    truncated = table.num_rows > query.limit
+    if truncated: table = table.slice(0, query.limit)
+    return {'source_rows': source_rows, 'matched_rows': matched, 'result_rows': result_rows, 'returned_rows': table.num_rows,
+            'truncated': truncated, 'downsample': {'method': query.downsample, 'points': query.points} if query.downsample else None,
+            'columns': table.column_names}, table
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class ResultCache:
+    """Thread-safe LRU of encoded responses keyed by tuples such as ('analyze', file_id, analysis_type).
+
+    Bounded by entry count and total bytes. With disk_dir set, entries evicted from memory spill to disk and are
+    promoted back on the next hit. Invalidation is by key prefix, e.g. invalidate('analyze', 7) drops every analysis of file 7.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 << 20, disk_dir: Optional[str] = None):
+        self.max_entries, self.max_bytes, self.disk_dir = max_entries, max_bytes, disk_dir
+        self._entries: "OrderedDict[tuple, Tuple[bytes, str, Optional[float]]]" = OrderedDict()
+        self._on_disk = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            # Keys are not recoverable from the file names, so spilled entries from a previous run are unusable
+            shutil.rmtree(disk_dir, ignore_errors=True)
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def etag_for(body: bytes) -> str:
+        return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+    def _disk_path(self, key: tuple) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".json")
+
+    def _drop(self, key: tuple):
+        if key in self._entries: self._bytes -= len(self._entries.pop(key)[0])
+        meta = self._on_disk.pop(key, None)
+        if meta:
+            try: os.remove(meta[0])
+            except OSError: pass
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, (body, etag, expires) = self._entries.popitem(last=False)
+            self._bytes -= len(body)
+            if self.disk_dir:
+                path = self._disk_path(key)
+                with open(path, "wb") as f: f.write(body)
+                self._on_disk[key] = (path, etag, expires)
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and key in self._on_disk:
+                path, etag, expires = self._on_disk.pop(key)
+                try:
+                    with open(path, "rb") as f: entry = (f.read(), etag, expires)
+                    os.remove(path)
+                except OSError: entry = None
+                if entry: self._entries[key] = entry; self._bytes += len(entry[0])
+            if entry is None: return None
+            if entry[2] is not None and entry[2] < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self._evict()
+            return entry[0], entry[1]
+
+    def put(self, key: tuple, body: bytes, ttl: Optional[float] = None) -> str:
+        etag = self.etag_for(body)
+        with self._lock:
+            self._drop(key)
+            if len(body) <= self.max_bytes:
+                self._entries[key] = (body, etag, time.time() + ttl if ttl else None)
+                self._bytes += len(body)
+                self._evict()
+        return etag
+
+    def invalidate(self, *prefix):
+        with self._lock:
+            for key in [k for k in (*self._entries, *self._on_disk) if k[:len(prefix)] == prefix]: self._drop(key)
+
+    def clear(self):
+        self.invalidate()
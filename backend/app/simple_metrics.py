@@ -1,9 +1,19 @@
 from prometheus_client import Counter, Histogram, generate_latest
+from contextlib import contextmanager
 import time
 
+# Uploads of large files run for minutes; the old 5 s ceiling put all of them in +Inf
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]
+
 FILE_UPLOADS = Counter("file_uploads_total", "Total files uploaded")
-UPLOAD_TIME = Histogram("upload_time_seconds", "Time to upload and process files", buckets=[0.1, 0.5, 1.0, 2.0, 5.0])
+UPLOAD_TIME = Histogram("upload_time_seconds", "Time to upload and process files", buckets=DURATION_BUCKETS)
 ERRORS = Counter("errors_total", "Total errors while handling requests")
+CACHE_HITS = Counter("result_cache_hits_total", "Responses served from the result cache", ["cache"])
+CACHE_MISSES = Counter("result_cache_misses_total", "Responses computed because the result cache had no entry", ["cache"])
+REQUEST_TIME = Histogram("http_request_duration_seconds", "Request latency by route template", ["method", "route", "status"], buckets=DURATION_BUCKETS)
+STAGE_TIME = Histogram("stage_duration_seconds", "Time spent in one stage of handling a file, e.g. parse, stats, sqlite or sink_mongodb", ["stage"], buckets=DURATION_BUCKETS)
+BYTES_PROCESSED = Counter("bytes_processed_total", "Bytes taken in or produced, by stage", ["stage"])
+ROWS_PROCESSED = Counter("rows_processed_total", "Rows handled, by stage", ["stage"])
 
 def record_upload(start: float) -> float:
     duration = time.time() - start
@@ -11,4 +21,19 @@ def record_upload(start: float) -> float:
     return duration
 
 def record_error() -> None: ERRORS.inc()
-def get_metrics() -> bytes: return generate_latest()
\ No newline at end of file
+def record_cache(cache: str, hit: bool) -> None: (CACHE_HITS if hit else CACHE_MISSES).labels(cache).inc()
+def record_request(method: str, route: str, status: int, seconds: float) -> None: REQUEST_TIME.labels(method, route, str(status)).observe(seconds)
+def record_stage(stage: str, seconds: float) -> None: STAGE_TIME.labels(stage).observe(seconds)
+
+def record_volume(stage: str, rows: int = 0, nbytes: int = 0) -> None:
+    if rows: ROWS_PROCESSED.labels(stage).inc(rows)
+    if nbytes: BYTES_PROCESSED.labels(stage).inc(nbytes)
+
+@contextmanager
+def timed(stage: str):
+    """Observe the block's wall time under stage, whether it returns or raises"""
+    start = time.perf_counter()
+    try: yield
+    finally: record_stage(stage, time.perf_counter() - start)
+
+def get_metrics() -> bytes: return generate_latest()
@@ -0,0 +1,116 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, Iterable, Optional
+
+import pyarrow as pa
+from simple_metrics import record_stage, record_volume
+
+SINK_TIMEOUT = float(os.getenv("SINK_TIMEOUT", "60"))
+
+def sink_timeout(name: str) -> float:
+    """Per-sink deadline in seconds: SINK_TIMEOUT_<NAME> if set, otherwise SINK_TIMEOUT"""
+    return float(os.getenv(f"SINK_TIMEOUT_{name.upper()}", SINK_TIMEOUT))
+
+class UploadRecord:
+    """What every sink receives: the parsed upload, the id of its SQLite record and the memory-mapped dataset"""
+
+    def __init__(self, filename: str, file_type: str, data: Dict[str, Any], file_id: int, path: str, table: Optional[pa.Table] = None,
+                 digest: Optional[str] = None):
+        self.filename, self.file_type, self.data, self.file_id, self.path, self.table = filename, file_type, data, file_id, path, table
+        self.digest = digest
+
+    def batches(self, rows: int) -> Optional[Iterable[pa.RecordBatch]]:
+        # Each call gets its own iterator over the shared read-only table, so sinks can stream it concurrently
+        return iter(self.table.to_batches(max_chunksize=rows)) if self.table is not None else None
+
+class Sink:
+    """A destination an upload is written to; write() returns the backend's id for it or raises"""
+    name = "sink"
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = sink_timeout(self.name) if timeout is None else timeout
+
+    def write(self, record: UploadRecord) -> Any:
+        raise NotImplementedError
+
+class DiskSink(Sink):
+    """Keeps the raw upload in the content-addressed blob store, so same-named files no longer overwrite each other"""
+    name = "disk"
+
+    def __init__(self, blobs, timeout: Optional[float] = None):
+        super().__init__(timeout)
+        self.blobs = blobs
+
+    def write(self, record: UploadRecord) -> str:
+        return self.blobs.put(record.path, record.digest)
+
+class ServiceSink(Sink):
+    """A backend service client the full dataset is streamed to in record batches of batch_rows rows"""
+
+    def __init__(self, service, batch_rows: int, timeout: Optional[float] = None):
+        super().__init__(timeout)
+        self.service, self.batch_rows = service, batch_rows
+
+class MongoSink(ServiceSink):
+    name = "mongodb"
+
+    def write(self, record: UploadRecord) -> str:
+        return self.service.save_uploaded_file(filename=record.filename, file_type=record.file_type, data=record.data,
+                                               batches=record.batches(self.batch_rows), sqlite_file_id=record.file_id)
+
+class OpenSearchSink(ServiceSink):
+    name = "opensearch"
+
+    def write(self, record: UploadRecord) -> str:
+        search_id = self.service.index_file(filename=record.filename, file_type=record.file_type, data=record.data,
+                                             batches=record.batches(self.batch_rows), sqlite_file_id=record.file_id)
+        if not search_id: raise Exception("OpenSearch indexing failed")
+        return search_id
+
+class PostgresSink(ServiceSink):
+    name = "postgresql"
+
+    def write(self, record: UploadRecord) -> int:
+        file_id = self.service.save_file(filename=record.filename, file_type=record.file_type, data=record.data,
+                                         batches=record.batches(self.batch_rows), sqlite_file_id=record.file_id)
+        if not file_id: raise Exception("PostgreSQL save failed")
+        return file_id
+
+class SinkFanOut:
+    """Writes one upload to several sinks at once. Each sink has its own deadline; a sink that fails or runs over
+    is reported rather than failing the upload, so latency is the slowest sink instead of the sum of all of them."""
+
+    def __init__(self, sinks: Iterable[Sink], max_workers: int = 16):
+        self.sinks = {s.name: s for s in sinks}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sink")
+
+    def _timed(self, sink: Sink, record: UploadRecord):
+        start = time.perf_counter()
+        # Observed in the sink's own thread, so writes that outlive their deadline are still measured when they end
+        try: result = sink.write(record)
+        finally: record_stage(f"sink_{sink.name}", time.perf_counter() - start)
+        if record.table is not None and sink.name != "disk": record_volume(f"sink_{sink.name}", rows=record.table.num_rows)
+        return result, time.perf_counter() - start
+
+    def write(self, names: Iterable[str], record: UploadRecord) -> Dict[str, Dict[str, Any]]:
+        start = time.perf_counter()
+        names = list(dict.fromkeys(names))
+        futures = {name: self._pool.submit(self._timed, self.sinks[name], record) for name in names if name in self.sinks}
+        report = {name: {"status": "error", "error": "unknown sink"} for name in names if name not in self.sinks}
+        for name, future in futures.items():
+            remaining = self.sinks[name].timeout - (time.perf_counter() - start)
+            try:
+                result, seconds = future.result(timeout=max(remaining, 0))
+                report[name] = {"status": "ok", "id": result, "seconds": round(seconds, 3)}
+            except FutureTimeout:
+                # Threads cannot be cancelled; the write carries on in the background and is only reported as late
+                report[name] = {"status": "timeout", "error": f"no answer within {self.sinks[name].timeout:g}s"}
+                print(f"[WARN] Sink {name} timed out for {record.filename}")
+            except Exception as e:
+                report[name] = {"status": "error", "error": str(e)}
+                print(f"[WARN] Sink {name} failed for {record.filename}: {e}")
+        return report
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,154 @@
+import json
+import math
+import re
+from typing import Any, Iterator, List, Optional, Union
+
+READ_BLOCK_CHARS = 1 << 20
+SKIP_WHITESPACE = re.compile(r'[ \t\n\r]*').match
+NEXT_ELEMENT = re.compile(r'[ \t\n\r]*([,\]])').match
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z').match
+# Longest token raw_decode can reject for being cut short rather than wrong ('-Infinity')
+PARTIAL_TOKEN_CHARS = 9
+
+class NotStreamable(Exception):
+    """The JSON document is neither a top-level array nor an object with a "data" array"""
+
+class JsonStream:
+    """Pull reader over a JSON text file: values are decoded one at a time with raw_decode, so only the current value
+    and one block of text are ever held in memory"""
+
+    def __init__(self, f, block: int = READ_BLOCK_CHARS):
+        self.f, self.block = f, block
+        self.buf, self.pos = '', 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        text = self.f.read(self.block)
+        if not text: return False
+        self.buf, self.pos = self.buf[self.pos:] + text, 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it; '' at the end of the input"""
+        while True:
+            self.pos = SKIP_WHITESPACE(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill(): return self.buf[self.pos:self.pos + 1]
+
+    def take(self, expected: str):
+        char = self.peek()
+        if char not in expected: raise ValueError(f"Expecting one of {expected!r}, found {char or 'end of input'!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        while True:
+            self.pos = SKIP_WHITESPACE(self.buf, self.pos).end()
+            try: value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Only an error at the very end of the block (or an open string running into it) may be the value
+                # going on in the next block; anything else is malformed however much more is read
+                truncated = e.pos >= len(self.buf) - PARTIAL_TOKEN_CHARS or e.msg.startswith('Unterminated string')
+                if truncated and self._fill(): continue
+                raise
+            # A value that runs into the end of the block may go on in the next one (e.g. a number split in two, which
+            # raw_decode ends before a trailing '.' or exponent it cannot finish yet)
+            complete = end < len(self.buf) and not (isinstance(value, (int, float)) and NUMBER_TAIL(self.buf, end))
+            if complete or not self._fill():
+                self.pos = end
+                return value
+
+    def array(self) -> Iterator[Any]:
+        self.take('[')
+        if self.peek() == ']': self.pos += 1; return
+        while True:
+            yield self.value()
+            # Regex fast path for the delimiter; take() handles it landing on a block boundary
+            found = NEXT_ELEMENT(self.buf, self.pos)
+            if found: self.pos = found.end()
+            if (found.group(1) if found else self.take(',]')) == ']': return
+
+    def end(self):
+        if self.peek(): raise ValueError("Extra data after the JSON document")
+
+def json_records(path: str) -> Iterator[Any]:
+    """Elements of a top-level JSON array, or of the "data" array of a top-level object, decoded one by one.
+    Any other document raises NotStreamable before a single record is produced."""
+    with open(path, encoding='utf-8') as f:
+        stream = JsonStream(f)
+        if stream.peek() == '[':
+            yield from stream.array()
+            stream.end(); return
+        stream.take('{')
+        found = False
+        if stream.peek() == '}': stream.pos += 1
+        else:
+            while True:
+                key = stream.value()
+                if not isinstance(key, str): raise ValueError("Expecting property name enclosed in double quotes")
+                stream.take(':')
+                if key == 'data' and not found and stream.peek() == '[':
+                    yield from stream.array(); found = True
+                else: stream.value()
+                if stream.take(',}') == '}': break
+        stream.end()
+        if not found: raise NotStreamable()
+
+def ndjson_records(path: str) -> Iterator[Any]:
+    """One JSON value per non-blank line"""
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip(): continue
+            try: yield json.loads(line)
+            except json.JSONDecodeError as e: raise ValueError(f"Line {number}: {e}")
+
+def _excel_cell(cell) -> Any:
+    # Same conversion as pandas' openpyxl reader: blanks are '', errors NaN, integral numbers int
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+    if cell.value is None: return ''
+    if cell.data_type == TYPE_ERROR: return math.nan
+    if cell.data_type == TYPE_NUMERIC:
+        whole = int(cell.value)
+        return whole if whole == cell.value else float(cell.value)
+    return cell.value
+
+def _worksheet(book, sheet: Union[str, int, None]):
+    if sheet is None: return book.worksheets[0]
+    if sheet in book.sheetnames: return book[sheet]
+    if str(sheet).isdigit() and int(sheet) < len(book.worksheets): return book.worksheets[int(sheet)]
+    raise ValueError(f"Worksheet {sheet!r} not found. Available: {', '.join(book.sheetnames)}")
+
+class ExcelSheet:
+    """One worksheet of an .xlsx workbook opened read-only; rows() streams it without loading the whole sheet"""
+
+    def __init__(self, path: str, sheet: Union[str, int, None] = None):
+        from openpyxl import load_workbook
+        # A file object, since openpyxl refuses paths without an Excel extension (spooled uploads end in .part)
+        self.file = open(path, 'rb')
+        try:
+            self.book = load_workbook(self.file, read_only=True, data_only=True, keep_links=False)
+            self.sheet = _worksheet(self.book, sheet)
+        except Exception: self.close(); raise
+        self.name, self.sheets = self.sheet.title, list(self.book.sheetnames)
+
+    def rows(self, max_rows: Optional[int] = None) -> Iterator[List[Any]]:
+        """Converted rows with trailing blank cells trimmed. Blank rows are held back until a row with data follows,
+        so trailing ones are dropped as pandas does; max_rows caps the rows produced, header included."""
+        self.sheet.reset_dimensions()
+        produced, blank = 0, 0
+        for row in self.sheet.rows:
+            values = [_excel_cell(c) for c in row]
+            while values and values[-1] == '': values.pop()
+            if not values: blank += 1; continue
+            for _ in range(blank):
+                if max_rows is not None and produced >= max_rows: return
+                yield []; produced += 1
+            blank = 0
+            if max_rows is not None and produced >= max_rows: return
+            yield values; produced += 1
+
+    def close(self):
+        if getattr(self, 'book', None) is not None: self.book.close()
+        self.file.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
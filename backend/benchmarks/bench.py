@@ -0,0 +1,248 @@
+"""Benchmarks for the ingestion, analysis and listing paths, driven in-process through the FastAPI app.
+
+    python backend/benchmarks/bench.py                               # 1k and 100k rows, every format and schema
+    python backend/benchmarks/bench.py --sizes 1m,10m --formats csv,ndjson --schemas narrow
+    python backend/benchmarks/bench.py --save-baseline               # record this machine's numbers as the baseline
+    python backend/benchmarks/bench.py --fail-on-regression          # compare with it, exit 1 on a slowdown
+
+Synthetic files are generated once per (format, schema, rows, seed) under --data-dir and reused by later runs.
+Each run gets a scratch working directory and SQLite database, so the app's own data is never touched. Uploads
+fan out to in-process stand-ins for MongoDB, OpenSearch and PostgreSQL that run the real services' client-side
+encoding. Latencies are per request; peak RSS covers this process plus the parse workers, polled every 10ms.
+Baselines are only comparable on the machine that recorded them.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import standins
+import synthetic
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.normpath(os.path.join(HERE, '..', 'app'))
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+DEFAULT_DATA_DIR = os.path.join(HERE, '.data')
+RSS_POLL_SECONDS = 0.01
+# Metrics a regression is judged on; p99 over a handful of uploads is too noisy to gate on
+GATED_METRICS = ('p50_ms', 'peak_rss_mb')
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError): return 0
+
+class RssSampler:
+    """Peak resident memory of this process and its children (the parse pool) while the block runs; 0 without /proc"""
+
+    def __init__(self, interval: float = RSS_POLL_SECONDS):
+        self.interval, self.peak = interval, 0
+        self._stop = threading.Event()
+
+    def sample(self):
+        pids = [os.getpid(), *(child.pid for child in multiprocessing.active_children())]
+        self.peak = max(self.peak, sum(_rss(pid) for pid in pids))
+
+    def _run(self):
+        while not self._stop.wait(self.interval): self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._thread.join()
+        self.sample()
+
+def measure(scenario: str, call: Callable[[], Any], repeat: int, rows: int = 0, nbytes: int = 0, setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """Run call() repeat times, each after an untimed setup(), and summarise latency, throughput and peak memory"""
+    latencies = []
+    with RssSampler() as rss:
+        for _ in range(repeat):
+            if setup: setup()
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    result = {'scenario': scenario, 'repeat': repeat, 'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+              'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3), 'mean_ms': round(total / repeat * 1000, 3),
+              'ops_per_s': round(repeat / total, 3), 'rows_per_s': round(rows * repeat / total) if rows else None,
+              'mb_per_s': round(nbytes * repeat / total / 1e6, 3) if nbytes else None, 'peak_rss_mb': round(rss.peak / 1e6, 1)}
+    print(f"  {scenario:<44} p50 {result['p50_ms']:>10.1f}ms  p99 {result['p99_ms']:>10.1f}ms  peak {result['peak_rss_mb']:>8.1f}MB"
+          + (f"  {result['rows_per_s']:>12,} rows/s" if rows else ''))
+    return result
+
+def _ok(response, scenario: str):
+    if response.status_code != 200: raise RuntimeError(f"{scenario}: HTTP {response.status_code} {response.text[:300]}")
+    return response
+
+def environment() -> Dict[str, Any]:
+    import pandas, pyarrow
+    try: commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): commit = None
+    return {'created_at': datetime.now().isoformat(timespec='seconds'), 'git_commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+            'pandas': pandas.__version__, 'pyarrow': pyarrow.__version__, 'numpy': np.__version__}
+
+class Bench:
+    """The app imported into a scratch working directory, with a TestClient in front of it"""
+
+    def __init__(self, args, workdir: str):
+        os.environ['DATA_STORE_PATH'] = os.path.join(workdir, 'bench.db')
+        os.environ['UPLOAD_SINKS'] = args.sinks
+        os.chdir(workdir)
+        sys.path.insert(0, APP_DIR)
+        import main
+        from fastapi.testclient import TestClient
+        self.args, self.main = args, main
+        self.backends = standins.install(main.sinks)
+        # Not used as a context manager: startup would begin probing the real backends
+        self.client = TestClient(main.app)
+
+    def close(self):
+        self.main.parse_pool.shutdown(wait=True)
+        self.main.sinks.shutdown()
+
+    def upload(self, path: str, scenario: str) -> int:
+        with open(path, 'rb') as f:
+            response = _ok(self.client.post('/api/upload/?wait=true', files={'file': (os.path.basename(path), f, 'application/octet-stream')}), scenario)
+        return response.json()['file_id']
+
+    def delete(self, file_id: int):
+        _ok(self.client.delete(f'/api/files/{file_id}'), f'delete {file_id}')
+
+    def warm_up(self):
+        # Spawning the parse workers and importing pandas in them takes seconds; keep that out of the first upload
+        path = synthetic.dataset(self.args.data_dir, 'csv', 'narrow', 100, self.args.seed)
+        futures = [self.main.parse_pool.submit(int, 0) for _ in range(self.main.PARSE_WORKERS)]
+        for future in futures: future.result()
+        for _ in range(2): self.delete(self.upload(path, 'warm-up'))
+
+    def dataset_scenarios(self, fmt: str, schema: str, rows: int) -> List[Dict[str, Any]]:
+        args, cache = self.args, self.main.result_cache
+        path = synthetic.dataset(args.data_dir, fmt, schema, rows, args.seed)
+        key, nbytes = f"{fmt}/{schema}/{synthetic.size_label(rows)}", os.path.getsize(path)
+        uploaded: List[int] = []
+        def upload(): uploaded.append(self.upload(path, f"upload/{key}"))
+        def forget():
+            # Identical bytes are otherwise answered from the earlier parse; dropping the record makes each pass parse again
+            while uploaded: self.delete(uploaded.pop())
+        results = [measure(f"upload/{key}", upload, args.upload_repeat, rows, nbytes, setup=forget),
+                   measure(f"upload_reuse/{key}", upload, args.upload_repeat, rows, nbytes)]
+        file_id = uploaded[0]
+        for analysis in ('summary', 'correlation'):
+            call = lambda: _ok(self.client.get(f'/api/analyze/{file_id}?analysis_type={analysis}'), f"analyze/{key}")
+            results.append(measure(f"analyze_{analysis}/{key}", call, args.repeat, rows, setup=lambda: cache.invalidate('analyze', file_id)))
+        results.append(measure(f"analyze_cached/{key}", lambda: _ok(self.client.get(f'/api/analyze/{file_id}'), f"analyze/{key}"), args.repeat))
+        spec = {'x': 'id', 'y': 'value', 'downsample': 'lttb', 'points': 2000}
+        call = lambda: _ok(self.client.post(f'/api/files/{file_id}/query', json=spec), f"query/{key}")
+        results.append(measure(f"query_lttb/{key}", call, args.repeat, rows, setup=lambda: cache.invalidate('query', file_id)))
+        forget()
+        return results
+
+    def listing_scenarios(self) -> List[Dict[str, Any]]:
+        """Listing and totals over args.files metadata records, each with a small preview and stats blob"""
+        args, cache, store = self.args, self.main.result_cache, self.main.data_store
+        existing = store.get_stats()['total_files']
+        for i in range(existing, args.files):
+            preview = [{'id': j, 'category': synthetic.CATEGORIES[j % 12], 'value': j * 1.5} for j in range(10)]
+            store.save_file_info(f"file_{i}.csv", 'CSV', {'columns': ['id', 'category', 'value'], 'row_count': 1000 + i, 'preview': preview,
+                                                          'stats': {'value': {'mean': 1.0, 'std': 0.5}}})
+        label = f"{args.files}_files"
+        get = lambda url, name: (lambda: _ok(self.client.get(url), name))
+        return [measure(f"files_list/{label}", get('/api/files/?limit=100', 'files'), args.repeat, setup=lambda: cache.invalidate('files')),
+                measure(f"files_list_preview/{label}", get('/api/files/?limit=100&include_preview=true', 'files'), args.repeat, setup=lambda: cache.invalidate('files')),
+                measure(f"files_page_deep/{label}", get(f'/api/files/?limit=100&offset={max(args.files - 100, 0)}', 'files'), args.repeat, setup=lambda: cache.invalidate('files')),
+                measure(f"stats/{label}", get('/api/stats/', 'stats'), args.repeat, setup=lambda: cache.invalidate('stats'))]
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print each scenario against the baseline; returns the scenarios whose gated metrics grew by more than threshold"""
+    before = {r['scenario']: r for r in baseline.get('results', [])}
+    env, base_env = environment(), baseline.get('environment', {})
+    if (env['machine'], env['cpu_count']) != (base_env.get('machine'), base_env.get('cpu_count')):
+        print(f"[WARN] Baseline was recorded on {base_env.get('machine')} with {base_env.get('cpu_count')} CPUs; numbers may not be comparable")
+    print(f"\n{'scenario':<44} {'p50 ms':>10} {'vs base':>8} {'p99 ms':>10} {'vs base':>8} {'peak MB':>9} {'vs base':>8}")
+    regressions = []
+    for r in results:
+        b = before.get(r['scenario'])
+        change = lambda metric: (r[metric] / b[metric] - 1) if b and b.get(metric) else None
+        cell = lambda metric: f"{change(metric):+8.1%}" if change(metric) is not None else f"{'new' if not b else '-':>8}"
+        print(f"{r['scenario']:<44} {r['p50_ms']:>10.1f} {cell('p50_ms')} {r['p99_ms']:>10.1f} {cell('p99_ms')} {r['peak_rss_mb']:>9.1f} {cell('peak_rss_mb')}")
+        if any((change(m) or 0) > threshold for m in GATED_METRICS): regressions.append(r['scenario'])
+    missing = [s for s in before if s not in {r['scenario'] for r in results}]
+    if missing: print(f"\n{len(missing)} baseline scenarios were not run this time")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1k,100k', help="row counts, e.g. 1k,100k,1m,10m")
+    parser.add_argument('--formats', default=','.join(synthetic.FORMATS), help="csv, xlsx, json and/or ndjson")
+    parser.add_argument('--schemas', default=','.join(synthetic.SCHEMAS), help="narrow (5 columns) and/or wide (50 columns)")
+    parser.add_argument('--repeat', type=int, default=20, help="requests per read scenario")
+    parser.add_argument('--upload-repeat', type=int, default=3, help="uploads per upload scenario")
+    parser.add_argument('--files', type=int, default=1000, help="metadata records behind the listing and stats scenarios")
+    parser.add_argument('--sinks', default='mongodb,opensearch,postgresql', help="stand-in backends every upload fans out to; '' for none")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated datasets are kept between runs")
+    parser.add_argument('--output', help="write this run's results as JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative growth in p50 or peak RSS counted as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit 1 when any scenario regressed")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    args.data_dir = os.path.abspath(args.data_dir)
+    output, baseline_path = (os.path.abspath(p) if p else None for p in (args.output, args.baseline))
+    sizes = [synthetic.parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    schemas = [s.strip() for s in args.schemas.split(',') if s.strip()]
+    cwd, workdir = os.getcwd(), tempfile.mkdtemp(prefix='bench-')
+    bench, results = None, []
+    try:
+        bench = Bench(args, workdir)
+        bench.warm_up()
+        for fmt, schema, rows in itertools.product(formats, schemas, sizes):
+            if fmt == 'xlsx' and rows > synthetic.XLSX_MAX_ROWS:
+                print(f"[WARN] Skipping xlsx/{schema}/{synthetic.size_label(rows)}: more rows than an Excel sheet holds"); continue
+            print(f"{fmt}/{schema}/{synthetic.size_label(rows)}")
+            results += bench.dataset_scenarios(fmt, schema, rows)
+        print("listing")
+        results += bench.listing_scenarios()
+        backends = {name: b.totals() for name, b in bench.backends.items()}
+    finally:
+        if bench: bench.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = {'environment': environment(), 'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+              'stand_ins': backends, 'results': results}
+    if output:
+        with open(output, 'w') as f: json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f: json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+    with open(baseline_path) as f: regressions = compare(results, json.load(f), args.threshold)
+    if regressions: print(f"\n{len(regressions)} scenarios regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import itertools
+import threading
+from typing import Dict
+
+class LocalBackend:
+    """In-process stand-in for a storage backend: runs the same client-side encoding as the real service (the part
+    this repo owns) and keeps only counts, so uploads fan out to every sink without any server running"""
+    name = 'backend'
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.files, self.rows = 0, 0
+
+    def _store(self, batches, encode) -> int:
+        rows = 0
+        for batch in batches or ():
+            encode(batch)
+            rows += batch.num_rows
+        with self._lock:
+            self.files += 1; self.rows += rows
+            return next(self._ids)
+
+    def totals(self) -> Dict[str, int]:
+        return {'files': self.files, 'rows': self.rows}
+
+class LocalMongo(LocalBackend):
+    name = 'mongodb'
+
+    def save_uploaded_file(self, filename, file_type, data, batches=None, sqlite_file_id=None) -> str:
+        from mongodb_service import _bson_batch, MONGO_INSERT_BATCH
+        def encode(batch):
+            batch = _bson_batch(batch)
+            for start in range(0, batch.num_rows, MONGO_INSERT_BATCH): batch.slice(start, MONGO_INSERT_BATCH).to_pylist()
+        return f"local-{self._store(batches, encode)}"
+
+class LocalOpenSearch(LocalBackend):
+    name = 'opensearch'
+
+    def index_file(self, filename, file_type, data, batches=None, sqlite_file_id=None) -> str:
+        from opensearch_service import _row_text
+        return f"local-{self._store(batches, _row_text)}"
+
+class LocalPostgres(LocalBackend):
+    name = 'postgresql'
+
+    def save_file(self, filename, file_type, data, batches=None, sqlite_file_id=None) -> int:
+        from postgres_service import _CsvStream, COPY_READ_BYTES
+        stream = _CsvStream(batches or ())
+        # Drain the COPY stream the way copy_expert would
+        while stream.read(COPY_READ_BYTES): pass
+        with self._lock:
+            self.files += 1; self.rows += stream.rows
+            return next(self._ids)
+
+def install(sinks) -> Dict[str, LocalBackend]:
+    """Point the sinks of a SinkFanOut at local stand-ins instead of the real services"""
+    backends = {b.name: b for b in (LocalMongo(), LocalOpenSearch(), LocalPostgres())}
+    for name, backend in backends.items(): sinks.sinks[name].service = backend
+    return backends
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Iterator
+
+GENERATE_CHUNK_ROWS = 500000
+# One row fewer than an Excel sheet holds, leaving room for the header
+XLSX_MAX_ROWS = 1048575
+FORMATS = {'csv': '.csv', 'xlsx': '.xlsx', 'json': '.json', 'ndjson': '.ndjson'}
+SCHEMAS = ('narrow', 'wide')
+WIDE_EXTRA_COLUMNS = 45
+CATEGORIES = ['north', 'south', 'east', 'west', 'central', 'online', 'retail', 'wholesale', 'partner', 'export', 'import', 'other']
+
+def parse_size(text: str) -> int:
+    """'1k' -> 1000, '2.5m' -> 2500000, '300' -> 300"""
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+def size_label(rows: int) -> str:
+    for scale, suffix in ((1000000, 'm'), (1000, 'k')):
+        if rows >= scale and rows % scale == 0: return f"{rows // scale}{suffix}"
+    return str(rows)
+
+def frame(schema: str, start: int, rows: int, seed: int = 0) -> pd.DataFrame:
+    """Rows start..start+rows of a dataset; each chunk has its own seed, so any size is the same data cut shorter"""
+    rng = np.random.default_rng((seed, start))
+    ids = np.arange(start, start + rows)
+    df = pd.DataFrame({
+        'id': ids,
+        'timestamp': (np.datetime64('2024-01-01T00:00:00') + ids.astype('timedelta64[s]')).astype(str),
+        'category': rng.choice(CATEGORIES, rows),
+        'value': np.round(np.sin(ids / 5000) * 100 + rng.normal(0, 5, rows), 4),
+        'flag': rng.random(rows) < 0.3,
+    })
+    if schema == 'wide':
+        for i in range(WIDE_EXTRA_COLUMNS):
+            kind = i % 3
+            if kind == 0: df[f'metric_{i}'] = np.round(rng.normal(i, 1 + i, rows), 4)
+            elif kind == 1: df[f'count_{i}'] = rng.integers(0, 10 ** (1 + i % 6), rows)
+            else: df[f'label_{i}'] = np.char.add('item_', rng.integers(0, 10 ** (1 + i % 4), rows).astype(str))
+    return df
+
+def frames(schema: str, rows: int, seed: int = 0, chunk: int = GENERATE_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    for start in range(0, rows, chunk): yield frame(schema, start, min(chunk, rows - start), seed)
+
+def _write_xlsx(path: str, schema: str, rows: int, seed: int):
+    from openpyxl import Workbook
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet('data')
+    header = False
+    for df in frames(schema, rows, seed):
+        if not header: sheet.append(list(df.columns)); header = True
+        for row in df.itertuples(index=False): sheet.append([v.item() if isinstance(v, np.generic) else v for v in row])
+    book.save(path)
+
+def _write_json(path: str, schema: str, rows: int, seed: int, lines: bool):
+    with open(path, 'w', encoding='utf-8') as f:
+        if not lines: f.write('[')
+        for i, df in enumerate(frames(schema, rows, seed)):
+            if lines: f.write(df.to_json(orient='records', lines=True)); f.write('\n')
+            else: f.write((',' if i else '') + df.to_json(orient='records')[1:-1])
+        if not lines: f.write(']')
+
+def dataset(root: str, fmt: str, schema: str, rows: int, seed: int = 0) -> str:
+    """Path of the synthetic file, generating it on first use; later runs with the same arguments reuse it"""
+    if fmt not in FORMATS: raise ValueError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    if schema not in SCHEMAS: raise ValueError(f"Unknown schema {schema!r}; use one of {', '.join(SCHEMAS)}")
+    if fmt == 'xlsx' and rows > XLSX_MAX_ROWS: raise ValueError(f"An Excel sheet holds at most {XLSX_MAX_ROWS} data rows")
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, f"{schema}-{size_label(rows)}-s{seed}{FORMATS[fmt]}")
+    if os.path.exists(path): return path
+    part = path + '.part'
+    if fmt == 'csv':
+        for i, df in enumerate(frames(schema, rows, seed)): df.to_csv(part, mode='a' if i else 'w', header=not i, index=False)
+    elif fmt == 'xlsx':
+        # openpyxl insists on an .xlsx name, so the temporary file keeps the extension
+        part = path + '.part.xlsx'
+        _write_xlsx(part, schema, rows, seed)
+    else: _write_json(part, schema, rows, seed, lines=fmt == 'ndjson')
+    os.replace(part, path)
+    return path
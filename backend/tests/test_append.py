@@ -0,0 +1,62 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from test_online_stats import QUANTILE_TOLERANCE
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    # main keeps its storage relative to the working directory and its metadata in DATA_STORE_PATH
+    with pytest.MonkeyPatch.context() as mp:
+        root = tmp_path_factory.mktemp('app')
+        mp.chdir(root)
+        mp.setenv('DATA_STORE_PATH', str(root / 'files.db'))
+        mp.syspath_prepend(BENCHMARKS)
+        import main, standins
+        from fastapi.testclient import TestClient
+        standins.install(main.sinks)
+        yield main, TestClient(main.app)
+        main.parse_pool.shutdown()
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(7)
+    n = 3000
+    return pd.DataFrame({'id': np.arange(n), 'value': rng.normal(50, 10, n).round(3), 'count': rng.integers(0, 40, n),
+                         'city': rng.choice(['Oslo', 'Lima', 'Pune', None], n), 'score': np.where(rng.random(n) < 0.1, np.nan, rng.random(n))})
+
+def upload(client, url, name, df):
+    response = client.post(url, params={'wait': True}, files={'file': (name, df.to_csv(index=False).encode(), 'text/csv')})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def summary(client, file_id):
+    return client.get(f'/api/analyze/{file_id}').json()['results']
+
+def test_appended_stats_match_a_full_rescan(app, frame):
+    main, client = app
+    first = upload(client, '/api/upload/', 'part.csv', frame.iloc[:2000])
+    appended = upload(client, f"/api/files/{first['file_id']}/append", 'more.csv', frame.iloc[2000:])
+    whole = upload(client, '/api/upload/', 'whole.csv', frame)
+    assert appended['appended_rows'] == 1000 and appended['row_count'] == len(frame)
+    assert main.data_store.get_file_by_id(first['file_id'])['row_count'] == len(frame)
+    assert main.datasets.open(first['file_id']).num_rows == len(frame)
+    merged, rescanned = summary(client, first['file_id']), summary(client, whole['file_id'])
+    assert merged['null_counts'] == rescanned['null_counts'] and merged['unique_counts'] == rescanned['unique_counts']
+    for col, described in rescanned['summary'].items():
+        moments = ['count', 'mean', 'std', 'min', 'max']
+        assert {k: merged['summary'][col][k] for k in moments} == pytest.approx({k: described[k] for k in moments}, rel=1e-9), col
+        # Quantiles come from sketches, which agree to within the sketch's rank error however they were fed
+        span = frame[col].max() - frame[col].min()
+        for q in ['25%', '50%', '75%']: assert abs(merged['summary'][col][q] - described[q]) <= QUANTILE_TOLERANCE * span, (col, q)
+
+def test_delete_drops_the_append_lock(app, frame):
+    main, client = app
+    file_id = upload(client, '/api/upload/', 'locked.csv', frame.iloc[:10])['file_id']
+    upload(client, f'/api/files/{file_id}/append', 'more.csv', frame.iloc[10:20])
+    assert file_id in main.append_locks
+    assert client.delete(f'/api/files/{file_id}').status_code == 200
+    assert file_id not in main.append_locks
@@ -0,0 +1,78 @@
+import io
+import json
+import os
+import pytest
+from dataset_store import DatasetStore
+from file_processor import FileProcessor
+from online_stats import DatasetStats
+from stream_readers import JsonStream
+
+CHUNK = 100
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Samples')
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(str(tmp_path / 'datasets'))
+
+def parse(store, path, ext):
+    writer = store.writer()
+    data = FileProcessor.process_path(str(path), ext, chunksize=CHUNK, dataset=writer)
+    writer.commit(1)
+    return data, store.open(1)
+
+@pytest.mark.parametrize('ext', ['.json', '.ndjson'])
+def test_text_key_absent_from_the_whole_first_chunk(store, tmp_path, ext):
+    records = [{'x': 0}] * CHUNK + [{'x': 1, 'y': None}, {'x': 2, 'y': 'new'}]
+    path = tmp_path / f'late{ext}'
+    path.write_text(json.dumps(records) if ext == '.json' else '\n'.join(map(json.dumps, records)))
+    data, table = parse(store, path, ext)
+    assert data['row_count'] == CHUNK + 2 and data['columns'] == ['x', 'y']
+    assert str(table.schema.field('y').type) == 'string'
+    assert table.column('y').to_pylist()[-2:] == [None, 'new']
+
+def test_csv_text_column_empty_for_the_whole_first_chunk(store, tmp_path):
+    path = tmp_path / 'late.csv'
+    path.write_text('x,y\n' + ''.join(f'{i},\n' for i in range(CHUNK)) + '1,new\n')
+    data, table = parse(store, path, '.csv')
+    assert data['row_count'] == CHUNK + 1
+    assert table.column('y').null_count == CHUNK and table.column('y')[-1].as_py() == 'new'
+
+def test_json_with_list_cells_counts_them_by_value(store):
+    # Samples/sample111.json: every record has a "languages" list
+    writer = store.writer()
+    data = FileProcessor.process_path(os.path.join(SAMPLES, 'sample111.json'), '.json', dataset=writer)
+    summary = DatasetStats.from_state(writer.stats).summary()
+    assert data['row_count'] == 5 and 'languages' in data['columns']
+    assert summary['unique_counts']['languages'] == len({json.dumps(row['languages']) for row in data['preview']}) == 5
+    assert summary['unique_counts']['id'] == 5
+
+@pytest.mark.parametrize('ext', ['.json', '.ndjson'])
+def test_nested_cells_in_a_text_column_are_stored_as_json(store, tmp_path, ext):
+    # Numbers fix the column type in the first chunk; the object after it makes the column text
+    records = [{'x': i, 'y': i} for i in range(CHUNK)] + [{'x': CHUNK, 'y': {'a': [1, None], 'b': 'c'}}]
+    path = tmp_path / f'nested{ext}'
+    path.write_text(json.dumps(records) if ext == '.json' else '\n'.join(map(json.dumps, records)))
+    data, table = parse(store, path, ext)
+    assert data['row_count'] == CHUNK + 1
+    assert json.loads(table.column('y')[-1].as_py()) == {'a': [1, None], 'b': 'c'}
+    assert table.column('y')[0].as_py() == '0'
+
+class CountingReader(io.StringIO):
+    reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+@pytest.mark.parametrize('text', ['[{"a": 1}, {"a": @}, ', '[{"a": tru}, ', '[[1, 2] 3, '])
+def test_malformed_json_fails_without_reading_on(text):
+    f = CountingReader(text + '{"a": 1}, ' * 1000 + '{"a": 1}]')
+    with pytest.raises(ValueError):
+        list(JsonStream(f, block=64).array())
+    assert f.reads == 1
+
+@pytest.mark.parametrize('value', ['"' + 'x' * 200 + '"', '-Infinity', 'true', '12345.678e-9', '"\\ud83d\\ude00"', '{"a": [1, {"b": null}]}'])
+def test_values_split_across_blocks(value):
+    for offset in range(1, 16):
+        text = '[' + ' ' * offset + value + ', ' + value + ']'
+        assert list(JsonStream(io.StringIO(text), block=8).array()) == [json.loads(value)] * 2
@@ -0,0 +1,110 @@
+import datetime
+import mongomock
+import mongodb_service
+import pyarrow as pa
+import pytest
+from pymongo.errors import ExecutionTimeout
+from mongodb_service import MongoDBService
+
+@pytest.fixture
+def service():
+    return MongoDBService(client=mongomock.MongoClient(), batch_size=3)
+
+def save(service, filename, columns=('x',), batches=None):
+    return service.save_uploaded_file(filename, 'CSV', {'columns': list(columns), 'row_count': 0, 'preview': []}, batches=batches)
+
+def test_rows_are_inserted_in_batch_size_slices(service, monkeypatch):
+    sizes = []
+    insert_many = mongomock.collection.Collection.insert_many
+    def spy(self, documents, *args, **kwargs):
+        sizes.append(len(documents))
+        return insert_many(self, documents, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, 'insert_many', spy)
+    table = pa.table({'n': list(range(10)), 'day': pa.array([datetime.date(2024, 1, i + 1) for i in range(10)])})
+    file_id = save(service, 'rows.csv', ['n', 'day'], table.to_batches(max_chunksize=4))
+    # Batches of 4, 4 and 2 record batch rows, each split again into slices of at most batch_size documents
+    assert sizes == [3, 1, 3, 1, 2]
+    meta = service.collection.find_one()
+    rows = service.collection.database[meta['rows_collection']]
+    assert str(meta['_id']) == file_id
+    assert meta['rows_inserted'] == rows.count_documents({}) == 10
+    # BSON has no date type; dates go in as datetimes
+    assert rows.find_one({'n': 0})['day'] == datetime.datetime(2024, 1, 1)
+
+def test_metadata_only_save_creates_no_rows_collection(service):
+    save(service, 'meta.csv')
+    assert 'rows_collection' not in service.collection.find_one()
+    assert service.collection.database.list_collection_names() == ['files']
+
+def test_search_falls_back_to_an_escaped_case_insensitive_regex(service):
+    save(service, 'Sales_2024.csv', ['region', 'amount'])
+    save(service, 'inventory.csv', ['sku', 'amount (usd)'])
+    # mongomock has no $text, so these only pass through the regex fallback
+    assert [f['filename'] for f in service.search_files('sales_20')] == ['Sales_2024.csv']
+    assert [f['filename'] for f in service.search_files('REGION')] == ['Sales_2024.csv']
+    assert [f['filename'] for f in service.search_files('(usd)')] == ['inventory.csv']
+    assert service.search_files('.*') == []
+
+def test_search_leaves_out_previews_unless_asked(service):
+    save(service, 'preview.csv')
+    hit, = service.search_files('preview')
+    assert 'preview_data' not in hit and 'stats' not in hit and isinstance(hit['_id'], str)
+    assert 'preview_data' in service.search_files('preview', include_preview=True)[0]
+
+def test_cursor_pages_cover_every_file_once_newest_first(service):
+    for i in range(7): save(service, f'f{i}.csv')
+    seen, cursor = [], None
+    while True:
+        page, cursor = service.get_all_files(limit=3, cursor=cursor)
+        seen += [f['filename'] for f in page]
+        if cursor is None: break
+    assert seen == [f'f{i}.csv' for i in reversed(range(7))]
+
+def test_files_uploaded_in_the_same_millisecond_are_ordered_by_id(service, monkeypatch):
+    class FrozenClock(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None): return datetime.datetime(2024, 5, 1, 12, 0, 0)
+    monkeypatch.setattr(mongodb_service, 'datetime', FrozenClock)
+    for i in range(5): save(service, f'f{i}.csv')
+    first, cursor = service.get_all_files(limit=2)
+    second, cursor = service.get_all_files(limit=2, cursor=cursor)
+    third, cursor = service.get_all_files(limit=2, cursor=cursor)
+    assert [f['filename'] for f in first + second + third] == ['f4.csv', 'f3.csv', 'f2.csv', 'f1.csv', 'f0.csv']
+    assert cursor is None
+
+def test_last_full_page_still_returns_a_cursor_to_an_empty_page(service):
+    for i in range(4): save(service, f'f{i}.csv')
+    page, cursor = service.get_all_files(limit=2)
+    page, cursor = service.get_all_files(limit=2, cursor=cursor)
+    assert [f['filename'] for f in page] == ['f1.csv', 'f0.csv']
+    assert service.get_all_files(limit=2, cursor=cursor) == ([], None)
+
+@pytest.mark.parametrize('cursor', ['no-separator', '2024-01-01T00:00:00|not-an-id', 'yesterday|' + '0' * 24])
+def test_malformed_cursor_is_a_value_error(service, cursor):
+    with pytest.raises(ValueError): service.get_all_files(cursor=cursor)
+
+@pytest.fixture
+def text_misses(monkeypatch):
+    """mongomock has no $text; make it answer like a server whose text index matches nothing, and log the filters"""
+    class NoHits(list):
+        def sort(self, *args, **kwargs): return self
+        def limit(self, n): return self
+    filters, find = [], mongomock.collection.Collection.find
+    def spy(self, filter=None, *args, **kwargs):
+        filters.append(filter)
+        return NoHits() if filter and '$text' in filter else find(self, filter, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, 'find', spy)
+    return filters
+
+def test_text_miss_does_not_scan_unless_substring_is_asked_for(service, text_misses):
+    save(service, 'Sales_2024.csv')
+    assert service.search_files('sal') == []
+    assert all('$text' in f for f in text_misses)
+    assert [f['filename'] for f in service.search_files('sal', substring=True)] == ['Sales_2024.csv']
+    assert '$or' in text_misses[-1]
+
+def test_substring_scan_that_runs_too_long_returns_nothing(service, text_misses, monkeypatch):
+    save(service, 'Sales_2024.csv')
+    def timeout(self, ms): raise ExecutionTimeout('operation exceeded time limit')
+    monkeypatch.setattr(mongomock.collection.Cursor, 'max_time_ms', timeout)
+    assert service.search_files('sal', substring=True) == []
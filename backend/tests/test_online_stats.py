@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from online_stats import CovarianceAccumulator, DatasetStats, DistinctCounter, QuantileSketch
+
+# HyperLogLog at precision 14 has a standard error of about 1.04 / sqrt(2**14) = 0.8%; 3% is well outside noise
+HLL_TOLERANCE = 0.03
+# Rank error of the compactor sketch at k=1024, as a fraction of the value range of the test data
+QUANTILE_TOLERANCE = 0.01
+
+def chunks(df: pd.DataFrame, size: int):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(7)
+    n = 60000
+    df = pd.DataFrame({
+        'uniform': rng.uniform(0, 1000, n),
+        'ints': rng.integers(0, 20000, n),
+        'label': np.char.add('item_', rng.integers(0, 300, n).astype(str)),
+        'noisy': rng.normal(0, 1, n),
+    })
+    df['linked'] = df['uniform'] * 2 + rng.normal(0, 50, n)
+    df.loc[rng.random(n) < 0.1, 'noisy'] = np.nan
+    return df
+
+def test_distinct_counts_are_exact_below_the_limit(frame):
+    counter = DistinctCounter()
+    for chunk in chunks(frame, 7000): counter.update(chunk['label'])
+    assert counter.registers is None and counter.estimate() == frame['label'].nunique()
+
+def test_distinct_counts_beyond_the_limit_are_within_hll_error(frame):
+    counter = DistinctCounter()
+    for chunk in chunks(frame, 7000): counter.update(chunk['ints'])
+    assert counter.registers is not None
+    assert counter.estimate() == pytest.approx(frame['ints'].nunique(), rel=HLL_TOLERANCE)
+
+def test_merged_distinct_counters_match_one_pass(frame):
+    halves = [DistinctCounter().update(part['ints']) for part in chunks(frame, 30000)]
+    one_pass = DistinctCounter().update(frame['ints'])
+    merged = halves[0].merge(DistinctCounter.from_state(halves[1].to_state()))
+    assert merged.estimate() == one_pass.estimate()
+
+def test_exact_counter_merges_into_a_sketch():
+    big, small = DistinctCounter().update(pd.Series(np.arange(10000))), DistinctCounter().update(pd.Series([1, 2, 10 ** 9]))
+    assert small.registers is None
+    assert big.merge(small).estimate() == pytest.approx(10001, rel=HLL_TOLERANCE)
+
+@pytest.mark.parametrize('q', [0.01, 0.25, 0.5, 0.75, 0.99])
+def test_chunked_quantiles_are_close_to_pandas(frame, q):
+    sketch = QuantileSketch()
+    for chunk in chunks(frame, 5000): sketch.update(chunk['uniform'])
+    assert abs(sketch.quantile(q) - frame['uniform'].quantile(q)) <= QUANTILE_TOLERANCE * 1000
+
+def test_small_quantile_sketch_is_exact():
+    values = pd.Series([5.0, 1, 3, np.nan, 2])
+    sketch = QuantileSketch().update(values)
+    assert [sketch.quantile(q) for q in (0.25, 0.5, 0.75)] == list(values.quantile([0.25, 0.5, 0.75]))
+
+def test_correlation_of_chunks_matches_pandas(frame):
+    columns = ['uniform', 'ints', 'noisy', 'linked']
+    acc = CovarianceAccumulator(columns)
+    for chunk in chunks(frame, 9000): acc.update(chunk)
+    expected = frame[columns].corr()
+    got = acc.correlation()
+    for a in columns:
+        for b in columns: assert got[a][b] == pytest.approx(expected.loc[a, b], abs=1e-9)
+
+def test_merged_dataset_stats_match_a_full_scan(frame):
+    parts = chunks(frame, 20000)
+    merged = DatasetStats.scan([parts[0]])
+    for part in parts[1:]: merged.merge(DatasetStats.from_state(DatasetStats.scan(chunks(part, 3000)).to_state()))
+    summary = merged.summary()
+    assert merged.rows == len(frame)
+    assert summary['null_counts'] == frame.isna().sum().to_dict()
+    assert summary['unique_counts']['label'] == frame['label'].nunique()
+    assert summary['unique_counts']['uniform'] == pytest.approx(frame['uniform'].nunique(), rel=HLL_TOLERANCE)
+    described = frame.describe()
+    for col in ('uniform', 'ints', 'noisy', 'linked'):
+        stats, expected = summary['summary'][col], described[col]
+        for key in ('count', 'mean', 'std', 'min', 'max'): assert stats[key] == pytest.approx(expected[key], rel=1e-9)
+        spread = expected['max'] - expected['min']
+        for key in ('25%', '50%', '75%'): assert abs(stats[key] - expected[key]) <= QUANTILE_TOLERANCE * spread
+    assert 'label' not in summary['summary']
+
+def test_state_round_trip_is_lossless(frame):
+    stats = DatasetStats.scan(chunks(frame, 10000))
+    assert DatasetStats.from_state(stats.to_state()).summary() == stats.summary()
+
+def test_a_text_chunk_demotes_a_numeric_column_on_merge():
+    numbers = DatasetStats.scan([pd.DataFrame({'v': [1.0, 2.0]})])
+    text = DatasetStats.scan([pd.DataFrame({'v': ['a', 'b']})])
+    summary = numbers.merge(text).summary()
+    assert 'v' not in summary['summary'] and summary['unique_counts']['v'] == 4
@@ -0,0 +1,125 @@
+import json
+import pyarrow as pa
+import pytest
+from opensearchpy.helpers import actions
+from opensearchpy.serializer import JSONSerializer
+import opensearch_service
+from opensearch_service import OpenSearchService, ROWS_INDEX
+
+class LocalIndices:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def exists(self, index): return index in self.cluster.indices_created
+
+    def create(self, index, body): self.cluster.indices_created[index] = body
+
+    def get_settings(self, index, name):
+        interval = self.cluster.refresh_interval
+        return {index: {'settings': {'index': {'refresh_interval': interval}} if interval else {}}}
+
+    def put_settings(self, index, body):
+        self.cluster.refresh_interval = body['index']['refresh_interval']
+        self.cluster.settings_log.append(self.cluster.refresh_interval)
+
+class LocalOpenSearch:
+    """Just enough of the client for streaming_bulk: bulk requests are parsed and kept, and reject(doc) may answer
+    a document with an error status instead of indexing it"""
+
+    def __init__(self, reject=lambda doc, attempt: None):
+        self.transport = type('Transport', (), {'serializer': JSONSerializer()})()
+        self.indices = LocalIndices(self)
+        self.indices_created, self.refresh_interval, self.settings_log = {}, None, []
+        self.reject, self.attempts, self.requests, self.docs = reject, {}, [], []
+
+    def ping(self): return True
+
+    def close(self): pass
+
+    def bulk(self, body, *args, **kwargs):
+        lines = body.strip().split('\n')
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            doc = json.loads(source)
+            key = (doc['file_id'], doc['row_start'])
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            status = self.reject(doc, self.attempts[key]) or 201
+            if status == 201: self.docs.append(doc)
+            items.append({'index': {'_index': ROWS_INDEX, 'status': status, **({'error': {'type': 'rejected'}} if status != 201 else {})}})
+        self.requests.append({'docs': len(items), 'refresh_interval': self.refresh_interval})
+        return {'took': 1, 'errors': any(i['index']['status'] != 201 for i in items), 'items': items}
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(actions.time, 'sleep', lambda seconds: None)
+
+def table(rows: int) -> pa.Table:
+    return pa.table({'id': list(range(rows)), 'name': [f'row {i}' for i in range(rows)], 'note': [None if i % 2 else 'x' for i in range(rows)]})
+
+def test_rows_are_grouped_into_documents_across_batches():
+    client = LocalOpenSearch()
+    failed = OpenSearchService(client=client).index_rows('f1', table(7).to_batches(max_chunksize=5), rows=7, rows_per_doc=2)
+    assert failed == 0
+    # Documents never span a record batch boundary, and row numbers keep counting across batches
+    assert [(d['row_start'], d['row_end']) for d in client.docs] == [(0, 1), (2, 3), (4, 4), (5, 6)]
+    assert client.docs[0]['content'] == '0 row 0 x\n1 row 1 '
+    assert {d['file_id'] for d in client.docs} == {'f1'}
+
+def test_bulk_requests_are_capped_at_bulk_docs(monkeypatch):
+    monkeypatch.setattr(opensearch_service, 'BULK_DOCS', 3)
+    client = LocalOpenSearch()
+    OpenSearchService(client=client).index_rows('f1', table(8).to_batches(), rows=8, rows_per_doc=1)
+    assert [r['docs'] for r in client.requests] == [3, 3, 2]
+
+def test_large_loads_run_with_refresh_disabled_and_restore_it(monkeypatch):
+    monkeypatch.setattr(opensearch_service, 'NO_REFRESH_ROWS', 5)
+    client = LocalOpenSearch()
+    client.refresh_interval = '5s'
+    OpenSearchService(client=client).index_rows('f1', table(6).to_batches(), rows=6)
+    assert {r['refresh_interval'] for r in client.requests} == {'-1'}
+    assert client.settings_log == ['-1', '5s']
+
+def test_small_loads_leave_refresh_alone(monkeypatch):
+    monkeypatch.setattr(opensearch_service, 'NO_REFRESH_ROWS', 5)
+    client = LocalOpenSearch()
+    OpenSearchService(client=client).index_rows('f1', table(4).to_batches(), rows=4)
+    assert client.settings_log == [] and client.requests[0]['refresh_interval'] is None
+
+def test_overlapping_loads_share_one_refresh_switch(monkeypatch):
+    monkeypatch.setattr(opensearch_service, 'NO_REFRESH_ROWS', 5)
+    client = LocalOpenSearch()
+    service = OpenSearchService(client=client)
+    with service._bulk_load(10):
+        with service._bulk_load(10): assert client.refresh_interval == '-1'
+        assert client.refresh_interval == '-1'
+    # Nothing was set before the loads, so None puts the cluster default back
+    assert client.settings_log == ['-1', None]
+
+def test_rejected_documents_are_retried_until_accepted():
+    client = LocalOpenSearch(reject=lambda doc, attempt: 429 if doc['row_start'] % 2 == 0 and attempt <= 2 else None)
+    failed = OpenSearchService(client=client).index_rows('f1', table(6).to_batches(), rows=6, rows_per_doc=1)
+    assert failed == 0
+    assert sorted(d['row_start'] for d in client.docs) == list(range(6))
+    assert client.attempts[('f1', 0)] == 3 and client.attempts[('f1', 1)] == 1
+
+def test_documents_still_rejected_after_the_last_retry_are_counted():
+    client = LocalOpenSearch(reject=lambda doc, attempt: 429 if doc['row_start'] == 0 else None)
+    failed = OpenSearchService(client=client).index_rows('f1', table(3).to_batches(), rows=3, rows_per_doc=1)
+    assert failed == 1
+    assert client.attempts[('f1', 0)] == opensearch_service.BULK_RETRIES + 1
+
+def test_other_errors_are_not_retried():
+    client = LocalOpenSearch(reject=lambda doc, attempt: 400 if doc['row_start'] == 1 else None)
+    failed = OpenSearchService(client=client).index_rows('f1', table(3).to_batches(), rows=3, rows_per_doc=1)
+    assert failed == 1 and client.attempts[('f1', 1)] == 1
+
+def test_search_asks_for_and_returns_at_most_limit_hits():
+    client, sizes = LocalOpenSearch(), []
+    def search(index, size, body):
+        sizes.append(size)
+        hits = [{'_id': f'{index}-{i}', '_score': float(i), '_source': {'file_id': f'files-{i}', 'row_start': 0, 'row_end': 0}} for i in range(size + 5)]
+        return {'hits': {'hits': hits}}
+    client.search = search
+    client.mget = lambda index, body: {'docs': [{'_id': i, 'found': True, '_source': {}} for i in body['ids']]}
+    results = OpenSearchService(client=client).search_files('sales', limit=3)
+    assert sizes == [3, 3] and len(results) == 3
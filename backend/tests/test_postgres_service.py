@@ -0,0 +1,85 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import psycopg2.extensions
+import pyarrow as pa
+import pytest
+from psycopg2.pool import SimpleConnectionPool
+from connections import ManagedConnection
+from dataset_store import DatasetStore
+from file_processor import FileProcessor
+from postgres_service import PostgresService, _CsvStream
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Samples')
+
+class LocalPool(SimpleConnectionPool):
+    """A pool whose connections are opaque objects, so nothing talks to a server"""
+
+    def _connect(self, key=None):
+        conn = object()
+        if key is not None: self._used[key], self._rused[id(conn)] = conn, key
+        else: self._pool.append(conn)
+        return conn
+
+    def closeall(self): self.closed = True
+
+def test_exhausted_pool_is_busy_not_down():
+    pool = LocalPool(0, 2)
+    pool.getconn(), pool.getconn()
+    conn = ManagedConnection('postgresql', lambda: pool, PostgresService()._ping, lambda p: p.closeall())
+    conn.get()
+    conn.probe()
+    assert conn.healthy and conn.client is pool and not pool.closed
+    assert len(pool._used) == 2
+
+class CopyCursor:
+    """Records statements and drains COPY input the way psycopg2's copy_expert reads it"""
+
+    def __init__(self):
+        self.statements, self.copied = [], b""
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement if isinstance(statement, str) else statement.as_string(self))
+
+    def copy_expert(self, statement, stream, size=8192):
+        while chunk := stream.read(size): self.copied += chunk
+
+def test_nested_json_columns_are_copied_as_jsonb(tmp_path, monkeypatch):
+    # quote_ident needs a live connection; identifiers here are plain names
+    monkeypatch.setattr(psycopg2.extensions, 'quote_ident', lambda name, scope: '"' + name.replace('"', '""') + '"')
+    store = DatasetStore(str(tmp_path))
+    writer = store.writer()
+    FileProcessor.process_path(os.path.join(SAMPLES, 'sample111.json'), '.json', dataset=writer)
+    writer.commit(1)
+    table = store.open(1)
+    assert pa.types.is_list(table.schema.field('languages').type)
+    cur = CopyCursor()
+    assert PostgresService()._copy_rows(cur, 7, table.to_batches()) == table.num_rows
+    assert '"languages" JSONB' in cur.statements[0]
+    copied = list(csv.reader(io.StringIO(cur.copied.decode('utf-8'))))
+    languages = table.schema.get_field_index('languages')
+    with open(os.path.join(SAMPLES, 'sample111.json'), encoding='utf-8') as f: records = json.load(f)
+    assert [json.loads(row[languages]) for row in copied] == [r['languages'] for r in records]
+
+def test_non_finite_floats_inside_nested_values_become_null():
+    batch = pa.record_batch([pa.array([[1.5, float('nan')], None]), pa.array([{'a': float('inf')}, {'a': 2.0}])], names=['xs', 's'])
+    rows = list(csv.reader(io.StringIO(_CsvStream([batch]).read().decode('utf-8'))))
+    assert [[json.loads(v) if v else None for v in row] for row in rows] == [[[1.5, None], {'a': None}], [None, {'a': 2.0}]]
+
+class SearchCursor:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, statement, params=None): self.calls.append((statement, params))
+
+    def fetchall(self): return []
+
+@pytest.mark.parametrize('keyword, like', [('50%', '%50\\%%'), ('a_b', '%a\\_b%'), ('c:\\tmp', '%c:\\\\tmp%')])
+def test_search_matches_wildcards_literally(monkeypatch, keyword, like):
+    cur, service = SearchCursor(), PostgresService()
+    monkeypatch.setattr(service, 'cursor', contextlib.contextmanager(lambda: iter([cur])))
+    assert service.search_files(keyword) == ([], None)
+    statement, params = cur.calls[0]
+    assert params['like'] == like and statement.count("ILIKE %(like)s ESCAPE '\\'") == 2
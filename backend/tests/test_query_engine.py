@@ -0,0 +1,24 @@
+import pyarrow as pa
+import pytest
+from query_engine import QueryError, run_query
+
+@pytest.fixture
+def table():
+    return pa.table({'Date': [f'2024-01-0{i}' for i in (3, 1, 2, 5, 4, 7, 6)], 'New York': [2.0, 1, 5, 3, 8, 4, 9], 'city': list('abcabca')})
+
+def test_projection_keeps_the_sort_column(table):
+    summary, result = run_query(table, {'columns': ['New York'], 'x': 'Date'})
+    assert summary['columns'] == ['New York', 'Date']
+    assert result.column('Date').to_pylist() == sorted(result.column('Date').to_pylist())
+
+def test_projection_keeps_the_downsampled_series(table):
+    summary, result = run_query(table, {'columns': ['city'], 'x': 'Date', 'y': 'New York', 'downsample': 'lttb', 'points': 3})
+    assert summary['columns'] == ['city', 'Date', 'New York'] and result.num_rows == 3
+
+@pytest.mark.parametrize('spec, message', [
+    ({'aggregates': [{'fn': 'median', 'column': 'city'}]}, "'median' does not apply to column 'city'"),
+    ({'group_by': 'city', 'aggregates': [{'fn': 'count'}, {'fn': 'sum', 'column': 'city'}]}, "'sum' does not apply to column 'city'"),
+    ({'time_column': 'Date', 'bucket': '1d', 'aggregates': [{'fn': 'mean', 'column': 'New York'}, {'fn': 'std', 'column': 'city'}]}, "'std'"),
+])
+def test_aggregate_on_the_wrong_type_is_a_query_error(table, spec, message):
+    with pytest.raises(QueryError, match=message): run_query(table, spec)
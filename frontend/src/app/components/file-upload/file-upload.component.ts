@@ -25,7 +25,7 @@ import { ApiService } from '../../services/api.service';
           <mat-icon style="font-size:36px;height:36px;width:36px;color:#FF8A65;margin-bottom:12px">cloud_upload</mat-icon>
           <h4 style="margin-bottom:6px;font-size:16px;font-weight:500;color:#FF7043">Drag and drop your file here</h4>
           <p style="font-size:13px;color:#FF8A65;margin-bottom:12px">or click to browse</p>
-          <input type="file" #fileInput (change)="onFileSelected($event)" accept=".csv,.json,.xlsx,.xls" style="display:none"/>
+          <input type="file" #fileInput (change)="onFileSelected($event)" accept=".csv,.json,.ndjson,.jsonl,.xlsx,.xls" style="display:none"/>
           <button mat-stroked-button (click)="fileInput.click();$event.stopPropagation()" style="border-color:#FF8A65;color:#FF8A65">Browse Files</button>
         </div>
 
@@ -82,7 +82,7 @@ export class FileUploadComponent implements OnInit {
   fileTypes = [
     { label: 'Excel (.xlsx, .xls)', icon: 'table_chart', color: '#64B5F6', bg: '#E3F2FD' },
     { label: 'CSV (.csv)',           icon: 'description', color: '#81C784', bg: '#E8F5E9' },
-    { label: 'JSON (.json)',         icon: 'code',        color: '#FFB74D', bg: '#FFF3E0' },
+    { label: 'JSON (.json, .ndjson)', icon: 'code',       color: '#FFB74D', bg: '#FFF3E0' },
   ];
 
   constructor(private apiService: ApiService) {}
@@ -95,7 +95,7 @@ export class FileUploadComponent implements OnInit {
   onFileSelected(e: any) { const file = e.target.files?.[0]; if (file && this.validateFile(file)) { this.selectedFile = file; this.uploadFile(); } }
 
   validateFile(file: File): boolean {
-    if (!['.csv','.xlsx','.xls','.json'].some(ext => file.name.toLowerCase().endsWith(ext))) return alert('Invalid file type. Please upload CSV, Excel, or JSON files.'), false;
+    if (!['.csv','.xlsx','.xls','.json','.ndjson','.jsonl'].some(ext => file.name.toLowerCase().endsWith(ext))) return alert('Invalid file type. Please upload CSV, Excel, or JSON files.'), false;
     if (file.size / 1024 / 1024 >= 100) return alert('File size too large. Maximum size is 100MB.'), false;
     return true;
   }
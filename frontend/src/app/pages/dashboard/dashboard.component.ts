@@ -59,7 +59,7 @@ export class DashboardComponent implements OnInit {
 
   ngOnInit() {
     this.apiService.getSystemStats().subscribe({ next: r => this.systemStats = r.stats, error: e => console.error('Failed to fetch stats:', e) });
-    this.apiService.getAllFiles().subscribe({
+    this.apiService.getAllFiles({ includePreview: true, limit: 5 }).subscribe({
       next: r => { this.recentFiles = r.files.slice(0, 5); if (this.recentFiles.length && !this.selectedFile) this.selectedFile = this.recentFiles[0]; this.loading = false; },
       error: e => { console.error('Failed to fetch files:', e); this.loading = false; }
     });
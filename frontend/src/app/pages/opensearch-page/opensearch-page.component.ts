@@ -141,7 +141,7 @@ export class OpenSearchPageComponent implements OnInit {
   ngOnInit() { this.fetchFiles(); }
 
   fetchFiles() {
-    this.apiService.getAllFiles().subscribe({
+    this.apiService.getAllFiles({ includePreview: true, source: 'opensearch' }).subscribe({
       next: r => {
         this.files = (r.files || []).filter((f: any) => f.source === 'opensearch').map((f: any) => ({ id: f.id, filename: f.filename, file_type: f.file_type, columns: Array.isArray(f.columns) ? f.columns : [], row_count: f.row_count || 0, uploaded_at: f.uploaded_at, preview: f.preview || [], source: 'opensearch' }));
         if (this.files.length <= this.pageIndex * this.pageSize) this.pageIndex = 0;
@@ -1,6 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { Observable, of, timer } from 'rxjs';
+import { first, map, switchMap } from 'rxjs/operators';
 
 export interface FileInfo {
   id: number; filename: string; file_type: string;
@@ -11,6 +12,21 @@ export interface FileInfo {
 export interface SystemStats {
   total_files: number; total_rows: number; total_columns: number;
   file_types: { [key: string]: number };
+  by_type?: { [key: string]: { files: number; rows: number; columns: number } };
+}
+
+export interface QuerySpec {
+  filters?: { column: string; op: string; value?: any }[];
+  group_by?: string | string[]; time_column?: string; bucket?: string;
+  aggregates?: { fn: string; column?: string }[];
+  x?: string; y?: string | string[]; downsample?: 'lttb' | 'minmax'; points?: number;
+  columns?: string[]; limit?: number;
+}
+
+export interface UploadJob {
+  id: string; kind: string; filename: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  stage: string; progress: number; result?: any; error?: string;
 }
 
 @Injectable({ providedIn: 'root' })
@@ -22,7 +38,16 @@ export class ApiService {
   private upload(path: string, file: File): Observable<any> {
     const fd = new FormData();
     fd.append('file', file);
-    return this.http.post(`${this.base}${path}`, fd);
+    // Uploads are processed as background jobs; poll until the job settles and emit its result
+    return this.http.post<any>(`${this.base}${path}`, fd).pipe(
+      switchMap(res => res?.job_id ? this.waitForJob(res.job_id) : of(res)));
+  }
+
+  private waitForJob(id: string): Observable<any> {
+    return timer(0, 500).pipe(
+      switchMap(() => this.getJob(id)),
+      first(r => r.job.status === 'succeeded' || r.job.status === 'failed'),
+      map(r => { if (r.job.status === 'failed') throw new Error(r.job.error); return r.job.result; }));
   }
 
   private get<T>(path: string) { return this.http.get<T>(`${this.base}${path}`); }
@@ -33,16 +58,29 @@ export class ApiService {
   uploadToOpenSearch(f: File) { return this.upload('/api/opensearch/upload/', f); }
   uploadToPostgres(f: File)   { return this.upload('/api/postgres/upload/', f); }
 
-  getAllFiles()    { return this.get<{ success: boolean; files: FileInfo[] }>('/api/files/'); }
+  getJob(id: string) { return this.get<{ success: boolean; job: UploadJob }>(`/api/jobs/${id}`); }
+
+  // Listings are metadata-only unless previews are asked for; the preview/stats blobs are the expensive part
+  getAllFiles(opts: { includePreview?: boolean; source?: string; limit?: number } = {}) {
+    const params = new URLSearchParams();
+    if (opts.includePreview) params.set('include_preview', 'true');
+    if (opts.source) params.set('source', opts.source);
+    if (opts.limit) params.set('limit', String(opts.limit));
+    const qs = params.toString();
+    return this.get<{ success: boolean; files: FileInfo[] }>(`/api/files/${qs ? '?' + qs : ''}`);
+  }
   getFileById(id: number) { return this.get<{ success: boolean; file: FileInfo }>(`/api/files/${id}`); }
   deleteFile(id: number)  { return this.http.delete(`${this.base}/api/files/${id}`); }
+  // Aggregated or downsampled rows computed over the whole dataset; rows have the same shape as a preview
+  queryFile(id: number, spec: QuerySpec) { return this.http.post<{ success: boolean; columns: string[]; rows: any[]; truncated: boolean }>(`${this.base}/api/files/${id}/query`, spec); }
 
-  getMongoDBFiles()   { return this.get<{ success: boolean; files: FileInfo[] }>('/api/mongodb/files/'); }
+  getMongoDBFiles()   { return this.get<{ success: boolean; files: FileInfo[]; next_cursor?: string }>('/api/mongodb/files/?include_preview=true&limit=1000'); }
   getPostgresFiles()  { return this.get<{ success: boolean; files: FileInfo[] }>('/api/postgres/files/'); }
   getSystemStats()    { return this.get<{ success: boolean; stats: SystemStats }>('/api/stats/'); }
   getOpenSearchStats(){ return this.get('/api/opensearch/stats/'); }
   getPostgresStats()  { return this.get('/api/postgres/stats/'); }
 
+  searchAll(q: string)        { return this.search('/api/search', q); }
   searchMongoDB(q: string)    { return this.search('/api/mongodb/search/', q); }
   searchOpenSearch(q: string) { return this.search('/api/opensearch/search/', q); }
   searchPostgres(q: string)   { return this.search('/api/postgres/search/', q); }